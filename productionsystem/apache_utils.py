@@ -66,6 +66,7 @@ def check_credentials(func):
             raise cherrypy.HTTPError(401, 'Unauthorized: Cert not verified for user DN: %s, CA: %s.'
                                      % (client_dn, client_ca))
 
+        # Stays on the primary DB so suspensions and demotions take effect immediately.
         with sql.managed_session() as session:
             try:
                 user = session.query(sql.models.Users) \
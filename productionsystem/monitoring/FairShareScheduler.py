@@ -0,0 +1,143 @@
+"""Fair-share submission scheduler."""
+import logging
+from datetime import datetime, timedelta
+from collections import Counter
+
+from productionsystem.config import getConfig
+from productionsystem.sql.enums import SchedulerDecision
+from productionsystem.sql.models import ParametricJobs, SchedulerQueue
+
+MAX_PRIORITY = 9
+DEFAULT_WEIGHTS = {'fairshare': 1.0, 'priority': 1.0, 'age': 0.5}
+USAGE_WINDOW = 7  # days
+AGE_HORIZON = 7  # days
+
+
+class FairShareScheduler(object):
+    """
+    Decides the order in which approved requests are submitted.
+
+    Each request is scored by the weighted sum of three factors between 0 and 1:
+
+    * fairshare: 2^(-usage share / fair share) where the usage share is the requester's
+      fraction of the recent DIRAC job usage of the competing users and the fair share is an
+      equal split between them, so it halves for each fair share used
+    * priority: the highest priority of the request's parametric jobs over the maximum
+    * age: how long ago the request was made over the age horizon, capped at 1
+
+    Requests are chosen one at a time with the jobs of each request submitted added to its
+    requester's usage before the next is chosen, so a user with many approved requests takes
+    turns with everyone else rather than going first with all of them.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, weights=None, usage_window=None, age_horizon=None):
+        """
+        Initialisation.
+
+        Args:
+            weights (dict): The weights of the fairshare, priority and age factors. Defaults to
+                            the scheduler_weights entry of the monitoring config, unspecified
+                            weights take their default values
+            usage_window (float): Days of finished jobs counted in the usage. Defaults to the
+                                  scheduler_usage_window entry of the monitoring config
+            age_horizon (float): Age in days at which the age factor reaches 1. Defaults to the
+                                 scheduler_age_horizon entry of the monitoring config
+
+        Raises:
+            ValueError: If weights has an unknown factor
+        """
+        config = getConfig('monitoring')
+        if weights is None:
+            weights = config.get('scheduler_weights', {})
+        if usage_window is None:
+            usage_window = config.get('scheduler_usage_window', USAGE_WINDOW)
+        if age_horizon is None:
+            age_horizon = config.get('scheduler_age_horizon', AGE_HORIZON)
+
+        unknown = set(weights).difference(DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError("Unknown scheduler weight(s) %s, expected some of %s"
+                             % (sorted(unknown), sorted(DEFAULT_WEIGHTS)))
+        self._weights = dict(DEFAULT_WEIGHTS, **weights)
+        self._usage_window = timedelta(days=usage_window)
+        self._age_horizon = timedelta(days=age_horizon).total_seconds()
+        self._usage = Counter()
+        self._chosen = {}
+        self._entries = []
+
+    def schedule(self, requests):
+        """
+        Order approved requests for submission.
+
+        The caller should record what it did with each request before taking the next, the
+        decisions being published with publish once all the requests have been taken.
+
+        Args:
+            requests (list): The approved Requests, with their parametric jobs loaded
+
+        Yields:
+            Requests: The request to submit next
+        """
+        now = datetime.utcnow()
+        self._usage = Counter(ParametricJobs.usage_by_requester(now - self._usage_window))
+        self._chosen = {}
+        self._entries = []
+        pending = list(requests)
+        while pending:
+            competing = {request.requester_id for request in pending}
+            competing.update(user_id for user_id, usage in self._usage.iteritems() if usage)
+            total_usage = sum(self._usage[user_id] for user_id in competing)
+            factors, request = max(((self._factors(request, len(competing), total_usage, now),
+                                     request) for request in pending),
+                                   key=lambda scored: (scored[0]['score'], -scored[1].id))
+            pending.remove(request)
+            self._chosen[request.id] = factors
+            yield request
+
+    def _factors(self, request, num_competing, total_usage, now):
+        """
+        Score a request.
+
+        Args:
+            request (Requests): The request
+            num_competing (int): The number of users competing for the fair share
+            total_usage (int): The recent usage of all the competing users
+            now (datetime): The current time
+
+        Returns:
+            dict: The request's score and the factors making it up
+        """
+        usage_share = self._usage[request.requester_id] / float(total_usage) if total_usage else 0.
+        factors = {'fairshare_factor': 2 ** (-usage_share * num_competing),
+                   'priority_factor': max([job.priority for job in request.parametric_jobs]
+                                          or [0]) / float(MAX_PRIORITY),
+                   'age_factor': min((now - request.request_date).total_seconds()
+                                     / self._age_horizon, 1.)}
+        factors['score'] = sum(self._weights[name] * factors[name + '_factor']
+                               for name in self._weights)
+        return factors
+
+    def record(self, request, decision):
+        """
+        Record what was done with a request taken from schedule.
+
+        Args:
+            request (Requests): The request
+            decision (SchedulerDecision): What was done with it
+        """
+        factors = self._chosen.pop(request.id)
+        if decision == SchedulerDecision.SUBMITTED:
+            self._usage[request.requester_id] += sum(job.num_jobs
+                                                     for job in request.parametric_jobs)
+        self.logger.debug("Request %d of user %d, score %.3f: %s", request.id,
+                          request.requester_id, factors['score'], decision.value)
+        self._entries.append(SchedulerQueue(request_id=request.id,
+                                            position=len(self._entries) + 1,
+                                            requester_id=request.requester_id,
+                                            decision=decision, **factors))
+
+    def publish(self):
+        """Store the queue and decisions of the latest schedule for the API."""
+        SchedulerQueue.replace(self._entries)
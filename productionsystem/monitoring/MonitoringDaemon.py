@@ -1,6 +1,7 @@
 """Monitoring Daemon."""
 import logging
 import time
+import threading
 from datetime import datetime
 
 import requests
@@ -8,22 +9,33 @@ from daemonize import Daemonize
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from productionsystem.sql.registry import SessionRegistry, managed_session
-from productionsystem.sql.models import Requests, Services
-from productionsystem.sql.enums import LocalStatus, ServiceStatus
+from productionsystem.sql.models import Requests, Services, DiracCleanup, SubmissionJournal
+from productionsystem.sql.enums import LocalStatus, ServiceStatus, SchedulerDecision
+from productionsystem.monitoring.RescheduleEngine import RescheduleEngine
+from productionsystem.monitoring.SubmissionThrottle import SubmissionThrottle
+from productionsystem.monitoring.FairShareScheduler import FairShareScheduler
+from productionsystem.monitoring.diracrpc.DiracRPCClient import DiracServerBusy
 
 MINS = 60
+SERVICE_CHECK_TIMEOUT = 30  # seconds
 
 
 class MonitoringDaemon(Daemonize):
     """Monitoring Daemon."""
 
-    def __init__(self, dburl, delay, cert, verify=False, **kwargs):
+    def __init__(self, dburl, delay, cert, verify=False, cleanup_interval=60,
+                 cleanup_batch_size=1000, **kwargs):
         """Initialisation."""
         super(MonitoringDaemon, self).__init__(action=self.main, **kwargs)
         self._dburl = dburl
         self._delay = delay
+        self._cleanup_interval = cleanup_interval
+        self._cleanup_batch_size = cleanup_batch_size
         self.cert = cert
         self.verify = verify
+        self.rescheduler = RescheduleEngine()
+        self.throttle = SubmissionThrottle()
+        self.scheduler = FairShareScheduler()
 
     def exit(self):
         """Update the monitoringd status on exit."""
@@ -50,6 +62,10 @@ class MonitoringDaemon(Daemonize):
         """Daemon main function."""
         SessionRegistry.setup(self._dburl)  # pylint: disable=no-member
 
+        cleanup_thread = threading.Thread(target=self.cleanup_dirac_jobs, name="DiracCleanup")
+        cleanup_thread.daemon = True
+        cleanup_thread.start()
+
         try:
             while True:
                 self.check_services()
@@ -60,6 +76,22 @@ class MonitoringDaemon(Daemonize):
         except Exception:
             self.logger.exception("Unhandled exception while running daemon.")
 
+    def cleanup_dirac_jobs(self):
+        """
+        Drain the DIRAC job cleanup queue.
+
+        Runs in a background thread so DIRAC jobs of deleted requests are killed
+        and deleted shortly after the deletion rather than on the next monitoring pass.
+        """
+        while True:
+            try:
+                removed = DiracCleanup.drain(batch_size=self._cleanup_batch_size)
+                if removed:
+                    self.logger.info("Removed %d DIRAC job(s) of deleted requests.", removed)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception("Unhandled exception while removing DIRAC jobs.")
+            time.sleep(self._cleanup_interval)
+
     def check_services(self):
         """
         Check the status of the services.
@@ -73,7 +105,8 @@ class MonitoringDaemon(Daemonize):
         status = ServiceStatus.DOWN
         try:
             if requests.get("https://dirac.gridpp.ac.uk/DIRAC/",
-                            cert=self.cert, verify=self.verify) \
+                            cert=self.cert, verify=self.verify,
+                            timeout=SERVICE_CHECK_TIMEOUT) \
                     .status_code == 200:
                 status = ServiceStatus.UP
         except IOError as err:
@@ -113,22 +146,93 @@ class MonitoringDaemon(Daemonize):
         Monitor the DB requests.
 
         Check the status of ongoing DB requests and either update them or
-        create new Ganga tasks for new requests.
+        create new Ganga tasks for new requests. Requests left submitting with a
+        submission journal had their submission interrupted, so it is resumed.
+        Failed/stalled DIRAC jobs of all the requests are rescheduled together
+        before the requests are monitored. Approved requests are submitted in the
+        order chosen by the fair-share scheduler, but only while the DIRAC queue
+        depth is within the throttle's watermarks.
         """
+        submitting_ids = [request['id'] for request in
+                          Requests.get(status=(LocalStatus.SUBMITTING,), fields=('id',))]
+        interrupted_ids = SubmissionJournal.request_ids(submitting_ids)
         monitored_requests = Requests.get(status=(LocalStatus.APPROVED,
                                                   LocalStatus.SUBMITTED,
                                                   LocalStatus.RUNNING),
                                           load_parametricjobs=True)
+        if interrupted_ids:
+            monitored_requests.extend(Requests.get(request_id=list(interrupted_ids),
+                                                   load_parametricjobs=True))
         monitored_requests.extend(Requests.get_reschedules())
 
+        try:
+            self.rescheduler.run(monitored_requests)
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception("Unhandled exception while rescheduling DIRAC jobs.")
+
+        self.submit_requests([request for request in monitored_requests
+                              if request.status == LocalStatus.APPROVED])
+
         for request in monitored_requests:
+            if request.status == LocalStatus.APPROVED:  # Held by the throttle.
+                continue
             try:
-                if request.status == LocalStatus.APPROVED:
-                    request.status = LocalStatus.SUBMITTING
-                    request.update()
+                if request.status == LocalStatus.SUBMITTING and request.id in interrupted_ids:
+                    self.logger.info("Resuming submission of request %d", request.id)
                     request.submit()
                     request.update()
                 request.monitor()
                 request.update()
             except:
                 self.logger.exception("Unhandled exception while monitoring request %d", request.id)
+
+    def submit_requests(self, requests):
+        """
+        Submit approved requests.
+
+        Requests are taken in the fair-share scheduler's order and submitted unless the
+        throttle is holding them back, in which case they stay approved until a later
+        cycle. The scheduler's queue and decisions are then published for the API.
+        If the DIRAC RPC server is too busy the request being submitted and the rest are
+        likewise held until a later cycle.
+
+        Args:
+            requests (list): The approved requests, with their parametric jobs loaded
+        """
+        self.throttle.refresh()
+        held = 0
+        busy = False
+        for request in self.scheduler.schedule(requests):
+            if busy or not self.throttle.admit(request):
+                self.scheduler.record(request, SchedulerDecision.THROTTLED)
+                held += 1
+                continue
+            try:
+                request.status = LocalStatus.SUBMITTING
+                request.update()
+                request.submit()
+                request.update()
+                self.throttle.submitted(request)
+                self.scheduler.record(request, SchedulerDecision.SUBMITTED)
+            except DiracServerBusy:
+                self.logger.warning("DIRAC RPC server busy, holding request %d", request.id)
+                busy = True
+                held += 1
+                request.status = LocalStatus.APPROVED
+                try:
+                    request.update()
+                except SQLAlchemyError:
+                    self.logger.exception("Error returning request %d to approved",
+                                          request.id)
+                self.scheduler.record(request, SchedulerDecision.THROTTLED)
+            except:
+                self.logger.exception("Unhandled exception while submitting request %d",
+                                      request.id)
+                self.scheduler.record(request, SchedulerDecision.FAILED)
+        if held:
+            self.logger.info("Holding %d approved request(s) until a later cycle.", held)
+
+        try:
+            self.scheduler.publish()
+        except SQLAlchemyError:
+            self.logger.exception("Error publishing the submission scheduler queue.")
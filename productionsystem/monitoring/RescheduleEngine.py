@@ -0,0 +1,238 @@
+"""Cross-request DIRAC job reschedule engine."""
+import time
+import logging
+from collections import Counter
+from copy import deepcopy
+
+from productionsystem.config import getConfig
+from productionsystem.sql.enums import DiracStatus
+from productionsystem.monitoring.diracrpc.DiracRPCClient import dirac_api_client
+
+RESCHEDULE_BATCH_SIZE = 1000
+RESCHEDULABLE = (DiracStatus.FAILED, DiracStatus.STALLED)
+NO_SITE = (None, 'ANY', 'Unknown')
+
+
+class ReschedulePolicy(object):
+    """Automatic rescheduling policy for a class of requests."""
+
+    def __init__(self, max_reschedules=2, backoff=0, require_done=True,
+                 site_failure_threshold=None, site_backoff=3600):
+        """
+        Initialisation.
+
+        Args:
+            max_reschedules (int): The number of times a job is automatically rescheduled
+            backoff (float): Seconds to wait before automatically rescheduling a job, doubled
+                             for each time it has already been rescheduled
+            require_done (bool): Only reschedule the jobs of parametric jobs with some DONE
+                                 jobs, so jobs that can never succeed aren't retried
+            site_failure_threshold (int): Hold off rescheduling the failed jobs of a site with
+                                          at least this many of them, None to never hold off
+            site_backoff (float): Seconds to hold off rescheduling a failing site's jobs
+        """
+        self.max_reschedules = max_reschedules
+        self.backoff = backoff
+        self.require_done = require_done
+        self.site_failure_threshold = site_failure_threshold
+        self.site_backoff = site_backoff
+
+    def delay(self, reschedules):
+        """
+        Get the backoff before automatically rescheduling a job.
+
+        Args:
+            reschedules (int): The number of times the job has been rescheduled
+
+        Returns:
+            float: The delay in seconds
+        """
+        return self.backoff * 2 ** reschedules
+
+
+class RescheduleEngine(object):
+    """
+    Reschedules failed and stalled DIRAC jobs across all monitored requests.
+
+    Run once per monitoring cycle before the requests are monitored. The reschedule
+    candidates of all the requests are collected and rescheduled in a few large calls to
+    DIRAC rather than one per parametric job.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, policies=None, batch_size=None):
+        """
+        Initialisation.
+
+        Args:
+            policies (dict): Map of request class (polymorphic identity) to ReschedulePolicy
+                             keyword args. The 'default' entry applies to all classes and is
+                             overridden by the class specific entries. Defaults to the
+                             reschedule_policy entry of the monitoring config
+            batch_size (int): The maximum number of jobs per call to DIRAC. Defaults to the
+                              reschedule_batch_size entry of the monitoring config
+        """
+        config = getConfig('monitoring')
+        if policies is None:
+            policies = config.get('reschedule_policy', {})
+        if batch_size is None:
+            batch_size = config.get('reschedule_batch_size', RESCHEDULE_BATCH_SIZE)
+        default = policies.get('default', {})
+        self._default_policy = ReschedulePolicy(**default)
+        self._policies = {classtype: ReschedulePolicy(**dict(default, **policy))
+                          for classtype, policy in policies.iteritems() if classtype != 'default'}
+        self._batch_size = batch_size
+        self._first_seen = {}  # job id -> time first seen as an automatic reschedule candidate
+        self._site_holds = {}  # (request class, site) -> time the hold expires
+
+    def policy(self, classtype):
+        """Get the reschedule policy for a class of requests."""
+        return self._policies.get(classtype, self._default_policy)
+
+    def run(self, requests):
+        """
+        Reschedule the failed and stalled jobs of the given requests.
+
+        All such jobs of parametric jobs a user has asked to reschedule are rescheduled,
+        other jobs only as the policy for their request's class allows. Rescheduled jobs
+        are set to RECEIVED so their status is refreshed when the requests are monitored.
+
+        Args:
+            requests (list): The Requests, with their parametric and DIRAC jobs loaded
+
+        Returns:
+            set: The ids of the rescheduled DIRAC jobs
+        """
+        now = time.time()
+        manual = {}
+        automatic = {}  # job id -> (DiracJobs, request class, ReschedulePolicy)
+        for request in requests:
+            policy = self.policy(request.classtype)
+            for parametricjob in request.parametric_jobs:
+                failed = [job for job in parametricjob.dirac_jobs if job.status in RESCHEDULABLE]
+                if parametricjob.reschedule:
+                    manual.update((job.id, job) for job in failed)
+                elif not policy.require_done or any(job.status == DiracStatus.DONE
+                                                    for job in parametricjob.dirac_jobs):
+                    automatic.update((job.id, (job, request.classtype, policy)) for job in failed
+                                     if job.reschedules < policy.max_reschedules)
+
+        # Forget jobs which are no longer candidates so that later failures back off afresh.
+        self._first_seen = {job_id: self._first_seen.get(job_id, now) for job_id in automatic}
+        due = {job_id: entry for job_id, entry in automatic.iteritems()
+               if now - self._first_seen[job_id] >= entry[2].delay(entry[0].reschedules)}
+        due = self._hold_failing_sites(automatic, due, now)
+
+        jobs = {job_id: job for job_id, (job, _, _) in due.iteritems()}
+        jobs.update(manual)
+        if not jobs:
+            return set()
+        self.logger.info("Rescheduling %d DIRAC job(s), %d requested by users, %d of %d "
+                         "automatic candidates due", len(jobs), len(manual), len(due),
+                         len(automatic))
+
+        rescheduled = self._reschedule(sorted(jobs))
+        for job_id in rescheduled:
+            job = jobs[job_id]
+            job.reschedules += 1
+            job.status = DiracStatus.RECEIVED
+            self._first_seen.pop(job_id, None)
+        return rescheduled
+
+    def _batches(self, job_ids):
+        """Split job ids into batches for calling DIRAC."""
+        job_ids = list(job_ids)
+        return [job_ids[start:start + self._batch_size]
+                for start in xrange(0, len(job_ids), self._batch_size)]
+
+    def _hold_failing_sites(self, candidates, due, now):
+        """
+        Hold back the due jobs of sites failing too many of a request class's jobs.
+
+        A site's jobs are held for the policy's site_backoff, after which they are released
+        to be rescheduled even if the site still has too many failed jobs.
+
+        Args:
+            candidates (dict): All the automatic reschedule candidates
+            due (dict): The candidates whose backoff has passed
+            now (float): The current time
+
+        Returns:
+            dict: The due candidates which aren't held
+        """
+        if all(policy.site_failure_threshold is None for _, _, policy in candidates.itervalues()):
+            return due
+
+        sites = self._sites(candidates)
+        failures = Counter((classtype, sites.get(job_id))
+                           for job_id, (_, classtype, _) in candidates.iteritems())
+        released = {key for key, until in self._site_holds.iteritems() if until <= now}
+        for key in released:
+            del self._site_holds[key]
+        for job_id, (_, classtype, policy) in candidates.iteritems():
+            key = (classtype, sites.get(job_id))
+            if key[1] in NO_SITE or policy.site_failure_threshold is None\
+                    or key in released or key in self._site_holds:
+                continue
+            if failures[key] >= policy.site_failure_threshold:
+                self.logger.warning("Site %s has %d failed/stalled %s job(s), holding off "
+                                    "rescheduling them for %ds", key[1], failures[key],
+                                    classtype, policy.site_backoff)
+                self._site_holds[key] = now + policy.site_backoff
+        return {job_id: entry for job_id, entry in due.iteritems()
+                if (entry[1], sites.get(job_id)) not in self._site_holds}
+
+    def _sites(self, job_ids):
+        """
+        Get the sites DIRAC jobs ran at.
+
+        Args:
+            job_ids (iterable): The DIRAC job ids
+
+        Returns:
+            dict: Map of job id to site for the jobs DIRAC returned the status of
+        """
+        sites = {}
+        try:
+            with dirac_api_client() as dirac:
+                for batch in self._batches(job_ids):
+                    result = deepcopy(dirac.status(batch))
+                    if not result['OK']:
+                        self.logger.error("DIRAC failed to get the sites of jobs: %s",
+                                          result['Message'])
+                        continue
+                    sites.update((job_id, status.get('Site'))
+                                 for job_id, status in result['Value'].iteritems())
+        except Exception as err:  # pylint: disable=broad-except
+            self.logger.exception("Error calling DIRAC to get the sites of jobs: %s", err.message)
+        return sites
+
+    def _reschedule(self, job_ids):
+        """
+        Reschedule DIRAC jobs in batches.
+
+        Args:
+            job_ids (list): The DIRAC job ids
+
+        Returns:
+            set: The ids of the jobs DIRAC rescheduled
+        """
+        rescheduled = set()
+        try:
+            with dirac_api_client() as dirac:
+                for batch in self._batches(job_ids):
+                    result = deepcopy(dirac.reschedule(batch))
+                    if not result['OK']:
+                        self.logger.error("DIRAC failed to reschedule %d job(s): %s",
+                                          len(batch), result['Message'])
+                        continue
+                    rescheduled.update(result['Value'])
+        except Exception as err:  # pylint: disable=broad-except
+            self.logger.exception("Error calling DIRAC to reschedule jobs: %s", err.message)
+
+        skipped = set(job_ids).difference(rescheduled)
+        if skipped:
+            self.logger.warning("Failed to reschedule %d job(s): %s", len(skipped), sorted(skipped))
+        self.logger.debug("Rescheduled jobs: %s", sorted(rescheduled))
+        return rescheduled
@@ -0,0 +1,112 @@
+"""DIRAC queue depth aware submission throttle."""
+import logging
+from collections import Counter
+
+from productionsystem.config import getConfig
+from productionsystem.sql.models import ParametricJobs
+
+ALL_SITES = None  # Key of the global queue depth and watermarks.
+
+
+class SubmissionThrottle(object):
+    """
+    Throttles the submission of approved requests on the depth of our DIRAC queue.
+
+    The queue depth is the number of our DIRAC jobs waiting to run, in total and per
+    requested site. Once a depth reaches its high watermark no requests adding to it are
+    released for submission until it has fallen below its low watermark, so that approving
+    a large batch of requests doesn't flood the DIRAC queue.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, high_watermark=None, low_watermark=None, site_watermarks=None):
+        """
+        Initialisation.
+
+        Args:
+            high_watermark (int): The total queue depth at which submission is stopped.
+                                  Defaults to the queue_high_watermark entry of the monitoring
+                                  config, if neither is set the total depth is unlimited
+            low_watermark (int): The total queue depth below which submission resumes. Defaults
+                                 to the queue_low_watermark entry of the monitoring config, or
+                                 the high watermark
+            site_watermarks (dict): Map of site to (low, high) watermarks for the jobs
+                                    requesting that site. Defaults to the site_queue_watermarks
+                                    entry of the monitoring config
+
+        Raises:
+            ValueError: If a low watermark is above its high watermark
+        """
+        config = getConfig('monitoring')
+        if high_watermark is None:
+            high_watermark = config.get('queue_high_watermark')
+        if low_watermark is None:
+            low_watermark = config.get('queue_low_watermark', high_watermark)
+        if site_watermarks is None:
+            site_watermarks = config.get('site_queue_watermarks', {})
+
+        self._watermarks = dict(site_watermarks)
+        if high_watermark is not None:
+            self._watermarks[ALL_SITES] = (low_watermark, high_watermark)
+        for key, (low, high) in self._watermarks.iteritems():
+            if low > high:
+                raise ValueError("Low watermark %d above high watermark %d for %s"
+                                 % (low, high, key or 'all sites'))
+        self._depths = Counter()
+        self._throttled = set()
+
+    @property
+    def throttled(self):
+        """The sites (None for all sites) currently not accepting submissions."""
+        return frozenset(self._throttled)
+
+    def refresh(self):
+        """Re-read the queue depths from the DB, done at the start of each monitoring cycle."""
+        if not self._watermarks:
+            return
+        self._depths = Counter(ParametricJobs.queue_depths())
+        self._depths[ALL_SITES] = sum(self._depths.itervalues())
+        self._update()
+
+    def admit(self, request):
+        """
+        Check if an approved request can be submitted now.
+
+        Args:
+            request (Requests): The request, with its parametric jobs loaded
+
+        Returns:
+            bool: False if the total queue depth or that of any of its sites is throttled
+        """
+        held = self._throttled.intersection([ALL_SITES] + [job.site for job in
+                                                           request.parametric_jobs])
+        if held:
+            self.logger.debug("Holding request %d, queue too deep for: %s", request.id,
+                              sorted(site or 'all sites' for site in held))
+        return not held
+
+    def submitted(self, request):
+        """
+        Account for the DIRAC jobs of a request that has just been submitted.
+
+        Args:
+            request (Requests): The submitted request
+        """
+        for job in request.parametric_jobs:
+            self._depths[job.site] += job.num_jobs
+            self._depths[ALL_SITES] += job.num_jobs
+        self._update()
+
+    def _update(self):
+        """Apply the watermarks to the current queue depths."""
+        for key, (low, high) in self._watermarks.iteritems():
+            depth = self._depths[key]
+            if key not in self._throttled and depth >= high:
+                self.logger.warning("Throttling submission, %d DIRAC jobs waiting for %s "
+                                    "(high watermark %d)", depth, key or 'all sites', high)
+                self._throttled.add(key)
+            elif key in self._throttled and depth < low:
+                self.logger.info("Resuming submission, %d DIRAC jobs waiting for %s "
+                                 "(low watermark %d)", depth, key or 'all sites', low)
+                self._throttled.discard(key)
@@ -1,11 +1,29 @@
 """DIRAC RPC Client utilities."""
+import json
+import time
 import logging
 from contextlib import contextmanager
 import copy
+import socket
 import rpyc
+from rpyc.core.stream import SocketStream
+from rpyc.utils.factory import connect_stream
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+BUSY_RETRIES = 3
+BUSY_BACKOFF = 1  # secs, doubled for each retry
+# Sent by a busy server before closing the connection. It can't start a real rpyc reply as
+# the first byte of a reply's frame header is the top byte of its (< 16 MB) length.
+BUSY_MARKER = b'\xff'
+JOB_SETTERS = frozenset(('setName', 'setExecutable', 'setInputSandbox', 'setOutputSandbox',
+                         'setInputData', 'setInputDataPolicy', 'setOutputData',
+                         'setParameterSequence', 'setPriority', 'setCPUTime', 'setDestination',
+                         'setBannedSites', 'setPlatform', 'setTag', 'setType', 'setJobGroup',
+                         'setLogLevel', 'setConfigArgs', 'setExecutionEnv',
+                         'setNumberOfProcessors', 'setOwner', 'setOwnerGroup',
+                         'setSubmitPool', 'setDestinationCE'))
+
 # This is not strictly necessary as all works without it when deep copying
 # However it bypasses the standard deepcopy implementation
 # which does type detection for unknown netref type and uses getattr('__deepcopy__')
@@ -20,12 +38,142 @@ netref_tuple = rpyc.core.netref.builtin_classes_cache[('tuple', '__builtin__')]
 copy._deepcopy_dispatch[netref_tuple] = copy._deepcopy_tuple
 
 
+class JobDescription(object):
+    """
+    Description of a DIRAC job, built up by calling the DIRAC Job setters on it.
+
+    Stands in for the DIRAC Job class, recording the constructor arguments and setter calls
+    rather than making each one over RPC so that the job can be built in one call in the
+    DIRAC daemon. Only the DIRAC Job setters in JOB_SETTERS can be called, and only with
+    JSON serialisable arguments. They return an empty S_OK as no DIRAC Job state can be read
+    back, other attributes raise AttributeError.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialisation.
+
+        Args:
+            *args: Positional arguments for the DIRAC Job constructor
+            **kwargs: Keyword arguments for the DIRAC Job constructor
+
+        Raises:
+            TypeError: If the arguments aren't JSON serialisable
+        """
+        self.init = self._checked('Job', args, kwargs)
+        self.calls = []
+
+    @staticmethod
+    def _checked(name, args, kwargs):
+        """
+        Check the arguments of a call can be sent to the DIRAC daemon.
+
+        Returns:
+            list: The [args, kwargs] of the call
+
+        Raises:
+            TypeError: If the arguments aren't JSON serialisable
+        """
+        try:
+            json.dumps([args, kwargs])
+        except (TypeError, ValueError) as err:
+            raise TypeError("Arguments to DIRAC %s must be JSON serialisable: %s" % (name, err))
+        return [list(args), kwargs]
+
+    def __getattr__(self, name):
+        """Get a DIRAC Job setter recording its calls."""
+        if name not in JOB_SETTERS:
+            raise AttributeError("%r is not a DIRAC Job setter a JobDescription can record"
+                                 % name)
+
+        def record(*args, **kwargs):
+            """Record the call."""
+            self.calls.append([name] + self._checked(name, args, kwargs))
+            return {'OK': True, 'Value': ''}
+        return record
+
+    def dumps(self):
+        """Serialise the description for the DIRAC daemon."""
+        return json.dumps({'init': self.init, 'calls': self.calls})
+
+
+class DiracServerBusy(Exception):
+    """Raised when the DIRAC RPC server is still too busy to serve us after retrying."""
+
+
+class BusyAwareSocketStream(SocketStream):
+    """Socket stream which recognises the busy marker sent by a busy DIRAC RPC server."""
+
+    def __init__(self, sock):
+        """Initialisation."""
+        super(BusyAwareSocketStream, self).__init__(sock)
+        self.busy = False
+        self._checked = False
+
+    def read(self, count):
+        """Read count bytes, first checking if the server turned us away as busy."""
+        if not self._checked:
+            self._checked = True
+            while True:
+                try:
+                    head = self.sock.recv(len(BUSY_MARKER), socket.MSG_PEEK)
+                except socket.timeout:
+                    continue
+                except socket.error:
+                    break  # let the normal read deal with it
+                if head == BUSY_MARKER:
+                    self.busy = True
+                    self.close()
+                    raise EOFError("DIRAC RPC server busy")
+                break
+        return super(BusyAwareSocketStream, self).read(count)
+
+
+def _connect(host, port):
+    """
+    Connect to the DIRAC RPC server, retrying with backoff while it's busy.
+
+    A busy server sends BUSY_MARKER and closes connections as soon as it accepts them.
+    Connections ended any other way before the request for the root service is answered
+    are errors rather than the server being busy.
+
+    Args:
+        host (str): The server host
+        port (int): The server port
+
+    Returns:
+        Connection: The rpyc connection, with its root service fetched
+
+    Raises:
+        DiracServerBusy: If the server was busy for all the retries
+        EOFError: If the connection was closed without the server saying it was busy
+    """
+    for retry in xrange(BUSY_RETRIES + 1):
+        stream = BusyAwareSocketStream.connect(host, port)
+        conn = connect_stream(stream, config={"allow_public_attrs": True,
+                                              "sync_request_timeout": 300})  # 5 mins
+        try:
+            conn.root  # pylint: disable=pointless-statement
+        except EOFError:
+            conn.close()
+            if not stream.busy:
+                logger.error("DIRAC RPC server at %s:%d closed the connection", host, port)
+                raise
+        else:
+            return conn
+        if retry < BUSY_RETRIES:
+            delay = BUSY_BACKOFF * 2 ** retry
+            logger.warning("DIRAC RPC server busy, retrying in %ss", delay)
+            time.sleep(delay)
+    raise DiracServerBusy("DIRAC RPC server at %s:%d busy after %d retries"
+                          % (host, port, BUSY_RETRIES))
+
+
 # Used in Solid to list the DIRAC file catalogue
 @contextmanager
 def dirac_rpc_client(rpc_endpoint, host="localhost", port=18861):
     """RPC DIRAC RPC client context."""
-    conn = rpyc.connect(host, port, config={"allow_public_attrs": True,
-                                            "sync_request_timeout": 300})  # 5 mins
+    conn = _connect(host, port)
     try:
         yield conn.root.RPCClient(rpc_endpoint)
     finally:
@@ -35,8 +183,7 @@ def dirac_rpc_client(rpc_endpoint, host="localhost", port=18861):
 @contextmanager
 def dirac_api_client(host="localhost", port=18861):
     """RPC DIRAC API client context."""
-    conn = rpyc.connect(host, port, config={"allow_public_attrs": True,
-                                            "sync_request_timeout": 300})
+    conn = _connect(host, port)
     try:
         yield conn.root.Dirac()
     finally:
@@ -45,9 +192,18 @@ def dirac_api_client(host="localhost", port=18861):
 
 @contextmanager
 def dirac_api_job_client(host="localhost", port=18861):
-    conn = rpyc.connect(host, port, config={"allow_public_attrs": True,
-                                            "sync_request_timeout": 300})
+    conn = _connect(host, port)
     try:
         yield conn.root.Dirac(), conn.root.Job
     finally:
         conn.close()
+
+
+@contextmanager
+def dirac_api_job_builder(host="localhost", port=18861):
+    """RPC DIRAC API client and JobDescription builder context."""
+    conn = _connect(host, port)
+    try:
+        yield conn.root.Dirac(), conn.root.build_job
+    finally:
+        conn.close()
@@ -1,14 +1,33 @@
 """DIRAC RPC Server."""
+import os
+import copy
+import json
+import time
+import signal
+import socket
+import hashlib
 import logging
+import threading
+from itertools import imap
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 # from types import FunctionType
 import rpyc
-from rpyc.utils.server import ThreadedServer
+from rpyc.utils.server import Server, ThreadedServer
 from daemonize import Daemonize
+from productionsystem.utils import BoundedExecutor, ExecutorBusy
+from productionsystem.monitoring.diracrpc.DiracRPCClient import BUSY_MARKER
 # pylint: disable=import-error
 from DIRAC.Interfaces.API.Job import Job
 from DIRAC.Interfaces.API.Dirac import Dirac
 from DIRAC.Core.DISET.RPCClient import RPCClient
 
+JOB_TEMPLATE_CACHE_SIZE = 256
+SERVER_MODES = ('threaded', 'pool', 'prefork')
+SERVER_WORKERS = 16
+SERVER_PROCESSES = 4
+SERVER_BACKLOG = 10
+
 # logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
@@ -23,6 +42,8 @@ from DIRAC.Core.DISET.RPCClient import RPCClient
 class FixedJob(Job):
     """Fixed DIRAC Job class."""
 
+    sandbox_cache = None  # The daemon's SandboxCache, if enabled.
+
     def setInputSandbox(self, files):
         """
         Set the input sandbox.
@@ -30,15 +51,43 @@ class FixedJob(Job):
         This method uses if type(files) == list in DIRAC which fails for
         rpc type <netref list>. isinstance should be used instead. Solution
         is to intercept this arg and cast it to a list.
+
+        If the daemon has a sandbox cache, local files are swapped for their
+        cached LFNs.
         """
         if isinstance(files, list):
             files = list(files)
+        if self.sandbox_cache is not None:
+            files = self.sandbox_cache.resolve([files] if isinstance(files, basestring) else files)
         return super(FixedJob, self).setInputSandbox(files)
 
     def setPriority(self, priority):
         """Set the job Priority."""
         super(FixedJob, self)._setParamValue("Priority", priority)
 
+    def parameterChunks(self, chunk_size):
+        """
+        Split a parametric job into parametric jobs of at most chunk_size parameters.
+
+        Args:
+            chunk_size (int): The maximum number of parameters (subjobs) per job
+
+        Returns:
+            list: The chunk jobs in parameter order, just this job if it needs no splitting
+        """
+        num_parameters = getattr(self, 'numberOfParameters', 0)
+        if not num_parameters or num_parameters <= chunk_size:
+            return [self]
+
+        chunks = []
+        for start in xrange(0, num_parameters, chunk_size):
+            chunk = copy.deepcopy(self)
+            chunk.numberOfParameters = 0  # Allow the sequences to be reset to a new length.
+            for name, sequence in self.parameterSeqs.iteritems():
+                chunk.setParameterSequence(name, sequence[start:start + chunk_size])
+            chunks.append(chunk)
+        return chunks
+
 
 class FixedDirac(Dirac):
     """Fixed DIRAC Dirac class."""
@@ -67,6 +116,136 @@ class FixedDirac(Dirac):
             jobid = list(jobid)
         return super(FixedDirac, self).reschedule(jobid)
 
+    def submitChunks(self, job, chunk_size, workers=4, skip=(), callback=None):
+        """
+        Submit a (large) parametric job in chunks.
+
+        The job is split into parametric jobs of at most chunk_size parameters which
+        are submitted concurrently, each worker thread using its own Dirac instance
+        and so its own connections to the DIRAC services. This way no single submission
+        has to wait for DIRAC to create more than chunk_size subjobs.
+
+        Args:
+            job (FixedJob): The job to submit
+            chunk_size (int): The maximum number of parameters (subjobs) per submission
+            workers (int): The maximum number of concurrent submissions
+            skip (iterable): Indices of chunks that shouldn't be submitted, for instance
+                             because they already were before an interruption
+            callback (callable): Called with the chunk index and result as soon as each
+                                 chunk's submission returns
+
+        Returns:
+            list: The DIRAC submission result for each chunk, in parameter order, with
+                  None for skipped chunks
+        """
+        logger = logging.getLogger(__name__)
+        chunks = job.parameterChunks(chunk_size) if isinstance(job, FixedJob) else [job]
+        skip = set(skip)
+        local = threading.local()
+
+        def submit(chunk_index):
+            """Submit a chunk using this thread's Dirac instance."""
+            if not hasattr(local, 'dirac'):
+                local.dirac = FixedDirac() if len(chunks) > 1 else self
+            try:
+                return chunk_index, local.dirac.submit(chunks[chunk_index])
+            except Exception as err:  # pylint: disable=broad-except
+                logger.exception("Error submitting job chunk %d.", chunk_index)
+                return chunk_index, {'OK': False, 'Message': str(err)}
+
+        to_submit = [index for index in xrange(len(chunks)) if index not in skip]
+        results = [None] * len(chunks)
+        pool = ThreadPool(min(len(to_submit), workers)) if len(to_submit) > 1 else None
+        try:
+            # The callback is called from this (the connection's) thread as rpyc
+            # doesn't allow calls back to the client from other threads mid-request.
+            for index, result in (pool.imap_unordered(submit, to_submit) if pool is not None
+                                  else imap(submit, to_submit)):
+                results[index] = result
+                if callback is not None:
+                    try:
+                        callback(index, result)
+                    except Exception:  # pylint: disable=broad-except
+                        logger.exception("Error in callback for job chunk %d.", index)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return results
+
+
+def _str(obj):
+    """Convert the unicode strings from JSON back to str, which parts of DIRAC expect."""
+    if isinstance(obj, unicode):
+        return obj.encode("utf-8")
+    if isinstance(obj, list):
+        return [_str(item) for item in obj]
+    if isinstance(obj, dict):
+        return {_str(key): _str(value) for key, value in obj.iteritems()}
+    return obj
+
+
+class JobBuilder(object):
+    """
+    Builds DIRAC jobs from JobDescriptions, reusing templates of identical configurations.
+
+    The calls in a description to the per_job setters, which only set the job's name,
+    input sandbox and parameter sequences, are applied to every job. The rest of the calls,
+    which set up the job's workflow, are hashed and the job they build kept as a template
+    so that jobs with the same configuration are copied from it rather than rebuilt.
+    """
+
+    per_job = frozenset(('setName', 'setInputSandbox', 'setParameterSequence'))
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, max_templates=JOB_TEMPLATE_CACHE_SIZE):
+        """
+        Initialisation.
+
+        Args:
+            max_templates (int): The number of templates to keep, least recently used first out
+        """
+        self._max_templates = max_templates
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, description):
+        """
+        Build a DIRAC job.
+
+        Args:
+            description (str): The serialised JobDescription
+
+        Returns:
+            FixedJob: The job
+        """
+        description = _str(json.loads(description))
+        init_args, init_kwargs = description['init']
+        calls = description['calls']
+        config = [call for call in calls if call[0] not in self.per_job]
+        key = hashlib.sha256(json.dumps([description['init'], config],
+                                        sort_keys=True)).hexdigest()
+        with self._lock:
+            template = self._templates.pop(key, None)
+            if template is not None:
+                self._templates[key] = template
+        if template is None:
+            template = self._apply(FixedJob(*init_args, **init_kwargs), config)
+            with self._lock:
+                self._templates[key] = template
+                while len(self._templates) > self._max_templates:
+                    self._templates.popitem(last=False)
+        else:
+            self.logger.debug("Reusing job template %s", key)
+        return self._apply(copy.deepcopy(template),
+                           [call for call in calls if call[0] in self.per_job])
+
+    @staticmethod
+    def _apply(job, calls):
+        """Make the described calls on a job."""
+        for name, args, kwargs in calls:
+            getattr(job, name)(*args, **kwargs)
+        return job
+
 
 class FixedRPCClient(RPCClient):
 
@@ -82,25 +261,155 @@ class DiracService(rpyc.Service):
     exposed_Job = FixedJob
     exposed_Dirac = FixedDirac
     exposed_RPCClient = FixedRPCClient
+    job_builder = JobBuilder()
+
+    def exposed_build_job(self, description):
+        """
+        Build a DIRAC job from a JobDescription in one call.
+
+        Args:
+            description (str): The serialised JobDescription
+
+        Returns:
+            FixedJob: The job, ready to submit
+        """
+        return self.job_builder.build(description)
+
+
+class PooledServer(Server):
+    """
+    rpyc server serving connections on a bounded pool of threads.
+
+    At most workers connections are served at once. Further connections are sent
+    BUSY_MARKER and closed as soon as they are accepted, rather than each getting a new
+    thread, so clients can tell the server is busy rather than broken.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialisation.
+
+        Args:
+            workers (int): Keyword only, the number of connections served at once
+            *args: Positional arguments for Server
+            **kwargs: Keyword arguments for Server
+        """
+        self._executor = BoundedExecutor(workers=kwargs.pop('workers', SERVER_WORKERS),
+                                         backlog=0)
+        super(PooledServer, self).__init__(*args, **kwargs)
+
+    def _accept_method(self, sock):
+        """Serve the connection on the pool, or tell the client it's busy if the pool is."""
+        try:
+            self._executor.submit(self._authenticate_and_serve_client, sock)
+        except ExecutorBusy:
+            self.logger.warning("Server busy, closing connection with fd %d", sock.fileno())
+            try:
+                sock.sendall(BUSY_MARKER)
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+            self.clients.discard(sock)
 
 
 class DiracDaemon(Daemonize):
-    """DIRAC daemon to host the server."""
+    """
+    DIRAC daemon to host the server.
+
+    The server runs in one of three modes:
 
-    def __init__(self, address, **kwargs):
-        """Initialise."""
+    * threaded: a thread per connection, however many connections there are
+    * pool: a pool of worker threads, connections beyond which are turned away as busy
+    * prefork: processes forked processes sharing the listening socket, each with a pool of
+      worker threads, so DIRAC calls don't all contend within one process
+    """
+
+    def __init__(self, address, sandbox_cache=None, mode='threaded', workers=SERVER_WORKERS,
+                 processes=SERVER_PROCESSES, backlog=SERVER_BACKLOG, **kwargs):
+        """
+        Initialise.
+
+        Args:
+            address (tuple): The (hostname, port) to serve on
+            sandbox_cache (SandboxCache): Cache for the jobs' input sandbox files, if any
+            mode (str): The server mode, one of SERVER_MODES
+            workers (int): The number of connections served at once per process in the pool
+                           and prefork modes
+            processes (int): The number of server processes in the prefork mode
+            backlog (int): The number of connections waiting to be accepted
+
+        Raises:
+            ValueError: If mode isn't one of SERVER_MODES
+        """
+        if mode not in SERVER_MODES:
+            raise ValueError("Unknown server mode %r, expected one of %s" % (mode, SERVER_MODES))
         self._address = address
+        self._sandbox_cache = sandbox_cache
+        self._mode = mode
+        self._workers = workers
+        self._processes = processes
+        self._backlog = backlog
         super(DiracDaemon, self).__init__(action=self.main, **kwargs)
 
     def main(self):
         """Daemon main."""
-        # Set up the threaded server in the daemon main
+        FixedJob.sandbox_cache = self._sandbox_cache
+        # Set up the server in the daemon main
         # else the file descriptors will be closed when daemon starts.
         hostname, port = self._address
-        ThreadedServer(DiracService,
-                       hostname=hostname,
-                       port=port,
-                       logger=self.logger,
-                       protocol_config={"allow_public_attrs": True,
-                                        "sync_request_timeout": 300,  # 5 mins
-                                        "allow_pickle": True}).start()
+        kwargs = dict(hostname=hostname,
+                      port=port,
+                      backlog=self._backlog,
+                      logger=self.logger,
+                      protocol_config={"allow_public_attrs": True,
+                                       "sync_request_timeout": 300,  # 5 mins
+                                       "allow_pickle": True})
+        if self._mode == 'threaded':
+            ThreadedServer(DiracService, **kwargs).start()
+            return
+
+        server = PooledServer(DiracService, workers=self._workers, **kwargs)
+        if self._mode == 'pool':
+            server.start()
+        else:
+            self._prefork(server)
+
+    def _prefork(self, server):
+        """
+        Serve from forked processes, restarting any that exit, until the daemon is stopped.
+
+        Args:
+            server (PooledServer): The server, whose listening socket the processes share
+        """
+        server.listener.listen(self._backlog)
+        children = set()
+
+        def stop(signum, frame):
+            """Stop the server processes along with the daemon."""
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+            self.sigterm(signum, frame)
+        signal.signal(signal.SIGTERM, stop)
+
+        while True:
+            while len(children) < self._processes:
+                pid = os.fork()
+                if pid == 0:
+                    # The daemon's handlers would remove its pid file on exit.
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    try:
+                        server.start()
+                    except Exception:  # pylint: disable=broad-except
+                        self.logger.exception("Error in server process %d.", os.getpid())
+                    finally:
+                        os._exit(0)  # pylint: disable=protected-access
+                children.add(pid)
+            pid, status = os.wait()
+            children.discard(pid)
+            self.logger.warning("Server process %d exited with status %d, restarting it.",
+                                pid, status)
+            time.sleep(1)
@@ -0,0 +1,201 @@
+"""Content addressed DIRAC input sandbox cache."""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+# pylint: disable=import-error
+from DIRAC.Interfaces.API.Dirac import Dirac
+
+MAX_AGE = 30  # days
+EVICT_INTERVAL = 3600  # secs
+HASH_BLOCK_SIZE = 1024 * 1024
+NUM_LOCKS = 16
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of a file's content."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file_:
+        for block in iter(lambda: file_.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class SandboxCache(object):
+    """
+    Content addressed cache of input sandbox files on DIRAC storage.
+
+    Local input sandbox files are uploaded once to an LFN made from their content hash and
+    name (which DIRAC keeps when it downloads the file for a job) and later sandboxes with the
+    same file reference that LFN rather than uploading the file again. A local sqlite index
+    maps the files to their LFNs. Files not used for max_age days are removed from both the
+    storage and the index, so max_age should be longer than jobs can wait to start.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, index_path, lfn_base, storage_element, max_age=MAX_AGE,
+                 evict_interval=EVICT_INTERVAL):
+        """
+        Initialisation.
+
+        Args:
+            index_path (str): Path of the sqlite index file, created if it doesn't exist
+            lfn_base (str): The LFN directory the files are uploaded under
+            storage_element (str): The DIRAC storage element to upload the files to
+            max_age (float): Days after which unused files are evicted
+            evict_interval (float): Minimum seconds between evictions
+        """
+        self._index_path = index_path
+        self._lfn_base = lfn_base.rstrip('/')
+        self._storage_element = storage_element
+        self._max_age = max_age * 24 * 3600
+        self._evict_interval = evict_interval
+        self._last_evicted = time.time()
+        self._evict_lock = threading.Lock()
+        # Files are locked by key stripe so the same file isn't uploaded by two threads
+        # at once, or evicted while it's being resolved.
+        self._locks = [threading.Lock() for _ in xrange(NUM_LOCKS)]
+        with self._index() as index:
+            index.execute("CREATE TABLE IF NOT EXISTS sandboxfiles ("
+                          "key TEXT PRIMARY KEY, lfn TEXT NOT NULL, size INTEGER NOT NULL, "
+                          "uploaded REAL NOT NULL, last_used REAL NOT NULL)")
+
+    @contextmanager
+    def _index(self):
+        """Connection to the index, committing on leaving unless there was an error."""
+        connection = sqlite3.connect(self._index_path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _stripe(key):
+        """Get the index of the lock for a key."""
+        return int(key[:8], 16) % NUM_LOCKS
+
+    def resolve(self, files):
+        """
+        Replace local files in an input sandbox with their cached LFNs.
+
+        Files which fail to upload are left as they are, to go in the job's own sandbox.
+
+        Args:
+            files (list): The input sandbox entries
+
+        Returns:
+            list: The input sandbox, with local files replaced by 'LFN:' entries
+        """
+        resolved = [self._resolve(file_) if os.path.isfile(file_) else file_ for file_ in files]
+        self._maybe_evict()
+        return resolved
+
+    def _resolve(self, path):
+        """Get the 'LFN:' sandbox entry for a local file, uploading it if not yet cached."""
+        key = '%s/%s' % (file_digest(path), os.path.basename(path))
+        with self._locks[self._stripe(key)]:
+            with self._index() as index:
+                row = index.execute("SELECT lfn FROM sandboxfiles WHERE key = ?",
+                                    (key,)).fetchone()
+                if row is not None:
+                    index.execute("UPDATE sandboxfiles SET last_used = ? WHERE key = ?",
+                                  (time.time(), key))
+                    self.logger.debug("Sandbox cache hit for %s: %s", path, row[0])
+                    return 'LFN:' + str(row[0])
+
+            lfn = '/'.join((self._lfn_base, key[:2], key))
+            if not self._upload(path, lfn):
+                return path
+            now = time.time()
+            with self._index() as index:
+                index.execute("INSERT OR REPLACE INTO sandboxfiles VALUES (?, ?, ?, ?, ?)",
+                              (key, lfn, os.path.getsize(path), now, now))
+            return 'LFN:' + lfn
+
+    def _upload(self, path, lfn):
+        """
+        Upload a file to DIRAC storage.
+
+        Args:
+            path (str): The local file path
+            lfn (str): The LFN to upload it to
+
+        Returns:
+            bool: True if the LFN now holds the file
+        """
+        self.logger.info("Uploading sandbox file %s to %s", path, lfn)
+        try:
+            dirac = Dirac()
+            result = dirac.addFile(lfn, path, self._storage_element)
+            if result['OK'] and lfn not in result['Value'].get('Failed', {}):
+                return True
+            # It may have been uploaded before the index lost track of it.
+            replicas = dirac.getReplicas(lfn)
+            if replicas['OK'] and lfn in replicas['Value'].get('Successful', {}):
+                return True
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception("Error uploading sandbox file %s to %s", path, lfn)
+            return False
+        self.logger.warning("Failed to upload sandbox file %s to %s: %s", path, lfn,
+                            result.get('Message') or result['Value'].get('Failed', {}).get(lfn))
+        return False
+
+    def _maybe_evict(self):
+        """Start an eviction in the background if one is due."""
+        with self._evict_lock:
+            if time.time() - self._last_evicted < self._evict_interval:
+                return
+            self._last_evicted = time.time()
+        thread = threading.Thread(target=self.evict, name="SandboxCacheEviction")
+        thread.daemon = True
+        thread.start()
+
+    def evict(self):
+        """
+        Remove files not used for max_age days from DIRAC storage and the index.
+
+        Returns:
+            int: The number of files evicted
+        """
+        cutoff = time.time() - self._max_age
+        with self._index() as index:
+            stale = index.execute("SELECT key FROM sandboxfiles WHERE last_used < ?",
+                                  (cutoff,)).fetchall()
+        stripes = {}
+        for key, in stale:
+            stripes.setdefault(self._stripe(key), []).append(key)
+
+        evicted = 0
+        for stripe, keys in stripes.iteritems():
+            with self._locks[stripe]:
+                with self._index() as index:
+                    # Re-check under the lock in case they were used in the meantime.
+                    lfns = [lfn for key in keys for lfn, in
+                            index.execute("SELECT lfn FROM sandboxfiles "
+                                          "WHERE key = ? AND last_used < ?", (key, cutoff))]
+                    index.executemany("DELETE FROM sandboxfiles WHERE key = ? AND last_used < ?",
+                                      [(key, cutoff) for key in keys])
+                if not lfns:
+                    continue
+                try:
+                    result = Dirac().removeFile(lfns)
+                except Exception:  # pylint: disable=broad-except
+                    self.logger.exception("Error removing %d evicted sandbox file(s).", len(lfns))
+                    continue
+                if not result['OK']:
+                    self.logger.warning("Failed to remove %d evicted sandbox file(s): %s",
+                                        len(lfns), result['Message'])
+                    continue
+                failed = result['Value'].get('Failed', {})
+                if failed:
+                    self.logger.warning("Failed to remove evicted sandbox files: %s", failed)
+                evicted += len(lfns) - len(failed)
+        if evicted:
+            self.logger.info("Evicted %d sandbox file(s) unused for %d days.", evicted,
+                             self._max_age // (24 * 3600))
+        return evicted
@@ -1,6 +1,7 @@
 """JSON Utilities Module."""
 
 import json
+from types import GeneratorType
 import cherrypy
 from .SQLTableBase import SQLTableBase
 
@@ -16,7 +17,40 @@ class JSONTableEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+def iter_json_array(iterable, buffer_size=65536):
+    """
+    Incrementally encode an iterable as a JSON array.
+
+    Each item is encoded as soon as it is taken from the iterable and the
+    output is yielded in chunks of roughly buffer_size characters, so the
+    whole collection never has to be held in memory at once.
+    """
+    encoder = JSONTableEncoder()
+    buffer_ = ['[']
+    buffered = 1
+    separator = ''
+    for item in iterable:
+        chunk = separator + encoder.encode(item)
+        separator = ','
+        buffer_.append(chunk)
+        buffered += len(chunk)
+        if buffered >= buffer_size:
+            yield ''.join(buffer_)
+            buffer_ = []
+            buffered = 0
+    buffer_.append(']')
+    yield ''.join(buffer_)
+
+
 def json_cherrypy_handler(*args, **kwargs):
-    """Handle JSON encoding of response."""
+    """
+    Handle JSON encoding of response.
+
+    If the handler returns a generator then the response is streamed
+    as a JSON array, encoding each item as it's generated.
+    """
     value = cherrypy.serving.request._json_inner_handler(*args, **kwargs)
+    if isinstance(value, GeneratorType):
+        cherrypy.serving.response.stream = True
+        return iter_json_array(value)
     return json.dumps(value, cls=JSONTableEncoder)
@@ -4,13 +4,15 @@ from enum import Enum
 from datetime import datetime
 from abc import ABCMeta
 from collections import Mapping
-from sqlalchemy import Column
+from itertools import izip
+from sqlalchemy import Column, DateTime, event, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.declarative.api import DeclarativeMeta
+from sqlalchemy.orm import configure_mappers, Query
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm.exc import DetachedInstanceError
 
-__all__ = ('SQLTableBase', )
+__all__ = ('SQLTableBase', 'TableSerialiser', 'ProjectionQuery')
 
 
 class DeclarativeABCMeta(DeclarativeMeta, ABCMeta):
@@ -43,26 +45,192 @@ class SmartColumn(Column):
 
 
 class ColumnsDescriptor(object):
-    """Yield the column names."""
+    """Return the column names."""
     def __init__(self, required=False, allowed=False):
         self._required = required
         self._allowed = allowed
+        self._cache = {}
 
     def __get__(self, obj, cls):
         """Descriptor get."""
-        for column in cls.__table__.columns:
+        # The table is fixed once the class is declared so only need to do this once per class.
+        columns = self._cache.get(cls)
+        if columns is None:
             # use getattr so works (doesnt break) on normal column as well as smart column
-            if self._required and not getattr(column, 'required', False):
-                continue
-            if self._allowed and not getattr(column, 'allowed', False):
-                continue
-            yield column.name
+            columns = tuple(column.name for column in cls.__table__.columns
+                            if not (self._required and not getattr(column, 'required', False))
+                            and not (self._allowed and not getattr(column, 'allowed', False)))
+            self._cache[cls] = columns
+        return columns
 
     def __set__(self, obj, value):
         """Descriptor set."""
         raise AttributeError("Read only attribute!")
 
 
+def _to_json_identity(val):
+    """Return value unchanged."""
+    return val
+
+
+def _to_json_enum(val):
+    """Convert Enum column value."""
+    if val is None:
+        return None
+    return val.name.capitalize()
+
+
+def _to_json_datetime(val):
+    """Convert DateTime column value."""
+    if val is None:
+        return None
+    return val.isoformat(' ')
+
+
+def _to_json_generic(val):
+    """Convert value of unknown type."""
+    if isinstance(val, Enum):
+        return val.name.capitalize()
+    elif isinstance(val, datetime):
+        return val.isoformat(' ')
+    return val
+
+
+class TableSerialiser(object):
+    """
+    Precompiled serialiser for a mapped table class.
+
+    Holds a fixed list of field names along with the value converter for
+    each, chosen once from the column type, so that instances (or row
+    tuples from column only queries) can be converted to JSON encodable
+    dicts in a single pass.
+    """
+
+    def __init__(self, attributes, properties=()):
+        """
+        Initialisation.
+
+        Args:
+            attributes (iterable): (name, converter) pairs for the instrumented attributes
+            properties (iterable): (name, converter) pairs for plain python properties
+        """
+        self._attributes = tuple(attributes)
+        self._properties = tuple(properties)
+        self._converters = dict(self._attributes + self._properties)
+
+    @classmethod
+    def from_class(cls, table_class):
+        """Build the serialiser for a mapped class."""
+        column_attrs = inspect(table_class).column_attrs
+        attributes = []
+        properties = []
+        for name, type_ in vars(table_class).iteritems():
+            if isinstance(type_, property):
+                properties.append((name, _to_json_generic))
+            elif isinstance(type_, InstrumentedAttribute):
+                converter = _to_json_generic
+                if name in column_attrs:
+                    column_type = column_attrs[name].columns[0].type
+                    converter = _to_json_identity
+                    if getattr(column_type, 'enum_class', None) is not None:
+                        converter = _to_json_enum
+                    elif isinstance(column_type, DateTime):
+                        converter = _to_json_datetime
+                attributes.append((name, converter))
+        return cls(attributes, properties)
+
+    @property
+    def names(self):
+        """The serialised field names."""
+        return tuple(name for name, _ in self._attributes + self._properties)
+
+    def subset(self, names):
+        """
+        Return a serialiser restricted to the given fields.
+
+        The returned serialiser keeps the order of names so can be
+        used with serialise_row on the results of a query selecting
+        those columns.
+
+        Raises:
+            KeyError: If one of the names is not a known field.
+        """
+        return TableSerialiser((name, self._converters[name]) for name in names)
+
+    def iter_names(self, obj):
+        """Yield the names of the fields available on the given instance."""
+        state = inspect(obj)
+        unloaded = state.unloaded if state.detached else ()
+        for name, _ in self._attributes:
+            if name not in unloaded:
+                yield name
+        for name, _ in self._properties:
+            try:
+                getattr(obj, name)
+            except DetachedInstanceError:  # depends on something not loaded.
+                continue
+            yield name
+
+    def serialise(self, obj):
+        """Return a JSON encodable dict from a mapped instance."""
+        state = inspect(obj)
+        # Lazy loaded attributes of detached instances are not available.
+        unloaded = state.unloaded if state.detached else ()
+        output_obj = {}
+        for name, converter in self._attributes:
+            if name not in unloaded:
+                output_obj[name] = converter(getattr(obj, name))
+        for name, converter in self._properties:
+            try:
+                output_obj[name] = converter(getattr(obj, name))
+            except DetachedInstanceError:
+                continue
+        return output_obj
+
+    def serialise_row(self, row):
+        """Return a JSON encodable dict from a row tuple ordered as names."""
+        return {name: converter(val)
+                for (name, converter), val in izip(self._attributes + self._properties, row)}
+
+
+class ProjectionQuery(Query):
+    """
+    Column only query returning plain dicts.
+
+    Selects just the given columns of a table so no instances are created
+    (no identity map or instrumentation overhead) and yields each row as a
+    JSON encodable dict built by the table serialiser.
+    """
+
+    def __init__(self, table_class, fields, session=None):
+        """
+        Initialisation.
+
+        Args:
+            table_class (SQLTableBase): The mapped table class
+            fields (iterable): The column attribute names to select
+            session (Session): The session to bind to
+
+        Raises:
+            ValueError: If any of the fields is not a column of the table.
+        """
+        fields = tuple(fields)
+        # The mapper columns include those inherited from the parent tables of joined
+        # table inheritance subclasses (such as plugin requests) unlike __table__.columns.
+        unknown = set(fields).difference(inspect(table_class).columns.keys())
+        if unknown:
+            raise ValueError("Unknown field(s) for %s: %s"
+                             % (table_class.__name__, sorted(unknown)))
+        super(ProjectionQuery, self).__init__([getattr(table_class, field) for field in fields],
+                                              session=session)
+        self._row_serialiser = table_class.serialiser().subset(fields)
+
+    def __iter__(self):
+        """Iterate over the results as dicts."""
+        serialise_row = self._row_serialiser.serialise_row
+        return (serialise_row(row) for row in super(ProjectionQuery, self).__iter__())
+
+
 class IterableBase(Mapping):
     """
     Iterable base class.
@@ -78,15 +246,34 @@ class IterableBase(Mapping):
     required_columns = ColumnsDescriptor(required=True)
     allowed_columns = ColumnsDescriptor(allowed=True)
 
+    @classmethod
+    def serialiser(cls):
+        """Get the precompiled serialiser for this class."""
+        # Look in this class only, not a parent class serialiser.
+        serialiser = vars(cls).get('_serialiser')
+        if serialiser is None:
+            configure_mappers()
+            serialiser = vars(cls).get('_serialiser')
+            if serialiser is None:
+                serialiser = TableSerialiser.from_class(cls)
+                cls._serialiser = serialiser
+        return serialiser
+
+    @classmethod
+    def query(cls, fields=None):
+        """
+        Get a session-less query for this table.
+
+        If fields are given then only those columns are selected and the
+        results are plain dicts rather than instances of this class.
+        """
+        if fields is None:
+            return Query(cls)
+        return ProjectionQuery(cls, fields)
+
     def __iter__(self):
         """Get an iterator over instrumented attributes."""
-        for name, type_ in vars(self.__class__).iteritems():
-            if isinstance(type_, (InstrumentedAttribute, property)):
-                try:
-                    getattr(self, name, None)
-                except DetachedInstanceError:  # This is lazy loaded and not available
-                    continue
-                yield name
+        return self.serialiser().iter_names(self)
 
     def __getitem__(self, item):
         """Access instrumented attributes as a dict."""
@@ -105,14 +292,7 @@ class IterableBase(Mapping):
 
     def jsonable_dict(self):
         """Return an easily JSON encodable object."""
-        output_obj = {}
-        for column, val in self.iteritems():
-            if isinstance(val, Enum):
-                val = val.name.capitalize()
-            elif isinstance(val, datetime):
-                val = val.isoformat(' ')
-            output_obj[column] = val
-        return output_obj
+        return self.serialiser().serialise(self)
 
     def to_json(self):
         """Return a JSON representation of the object."""
@@ -121,3 +301,9 @@ class IterableBase(Mapping):
 
 SQLTableBase = declarative_base(cls=IterableBase,  # pylint: disable=invalid-name
                                 metaclass=DeclarativeABCMeta)
+
+
+@event.listens_for(SQLTableBase, 'mapper_configured', propagate=True)
+def compile_serialiser(_, class_):
+    """Build the table serialiser once the mapper is configured."""
+    class_._serialiser = TableSerialiser.from_class(class_)  # pylint: disable=protected-access
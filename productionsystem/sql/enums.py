@@ -2,7 +2,7 @@
 from enum import unique, Enum, IntEnum
 
 
-__all__ = ('ServiceStatus', 'DiracStatus', 'LocalStatus', 'STATUS_MAP')
+__all__ = ('ServiceStatus', 'DiracStatus', 'LocalStatus', 'SchedulerDecision', 'STATUS_MAP')
 
 
 @unique
@@ -55,6 +55,15 @@ class LocalStatus(IntEnum):
     RUNNING = 9
 
 
+@unique
+class SchedulerDecision(Enum):
+    """Fair-share scheduler decision Enum."""
+
+    SUBMITTED = 'submitted'
+    THROTTLED = 'throttled'
+    FAILED = 'failed'
+
+
 STATUS_MAP = {DiracStatus.UNKNOWN: LocalStatus.UNKNOWN,
               DiracStatus.DELETED: LocalStatus.DELETED,
               DiracStatus.KILLED: LocalStatus.KILLED,
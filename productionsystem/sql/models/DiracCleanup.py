@@ -0,0 +1,136 @@
+"""DIRAC Job Cleanup Queue Table."""
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, TIMESTAMP, TEXT
+
+from productionsystem.monitoring.diracrpc.DiracRPCClient import dirac_api_client
+from ..registry import managed_session
+from ..SQLTableBase import SQLTableBase
+
+CLEANUP_BATCH_SIZE = 1000
+MAX_ATTEMPTS = 10
+
+
+class DiracCleanup(SQLTableBase):
+    """
+    DIRAC job cleanup queue SQL Table.
+
+    When a parametric job is deleted locally the ids of its DIRAC jobs are
+    queued here in the same transaction, rather than killing and deleting
+    them on the DIRAC system synchronously. The queue is drained in batches
+    by the monitoring daemon.
+    """
+
+    __tablename__ = 'diraccleanup'
+    id = Column(Integer, primary_key=True, autoincrement=False)  # pylint: disable=invalid-name
+    queued = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(TEXT, nullable=True)
+    logger = logging.getLogger(__name__)
+
+    @classmethod
+    def enqueue(cls, session, dirac_ids):
+        """
+        Queue DIRAC jobs for removal.
+
+        Ids which are already queued are skipped rather than failing the whole flush.
+
+        Args:
+            session (Session): The session whose transaction the queueing is part of
+            dirac_ids (iterable): The DIRAC job ids to kill and delete
+        """
+        dirac_ids = list(set(dirac_ids))
+        queued = set()
+        for i in xrange(0, len(dirac_ids), CLEANUP_BATCH_SIZE):
+            queued.update(dirac_id for dirac_id, in
+                          session.query(cls.id)
+                                 .filter(cls.id.in_(dirac_ids[i:i + CLEANUP_BATCH_SIZE])))
+        if queued:
+            cls.logger.debug("%d DIRAC job(s) already queued for removal.", len(queued))
+        rows = [{'id': dirac_id, 'queued': datetime.utcnow()}
+                for dirac_id in dirac_ids if dirac_id not in queued]
+        if rows:
+            session.execute(cls.__table__.insert(), rows)
+            cls.logger.info("Queued %d DIRAC job(s) for removal.", len(rows))
+
+    @classmethod
+    def drain(cls, batch_size=CLEANUP_BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+        """
+        Kill and delete the queued DIRAC jobs.
+
+        Jobs are removed in batches of batch_size with one kill and one delete call to
+        DIRAC per batch. Jobs DIRAC fails to delete stay queued and are retried on the next
+        call until they have been tried max_attempts times, after which they are kept in
+        the table (so are not forgotten) but no longer retried.
+
+        Args:
+            batch_size (int): The number of DIRAC jobs to remove per call to DIRAC
+            max_attempts (int): The number of times to try removing a job
+
+        Returns:
+            int: The number of DIRAC jobs removed
+        """
+        removed = 0
+        last_id = None
+        while True:
+            with managed_session() as session:
+                query = session.query(cls.id).filter(cls.attempts < max_attempts)
+                if last_id is not None:
+                    query = query.filter(cls.id > last_id)
+                batch = [dirac_id for dirac_id, in query.order_by(cls.id).limit(batch_size)]
+            if not batch:
+                return removed
+            last_id = batch[-1]
+
+            failed, error = cls._remove(batch)
+            with managed_session() as session:
+                done = set(batch).difference(failed)
+                if done:
+                    session.query(cls).filter(cls.id.in_(done))\
+                                      .delete(synchronize_session=False)
+                if failed:
+                    session.query(cls).filter(cls.id.in_(failed))\
+                                      .update({cls.attempts: cls.attempts + 1,
+                                               cls.last_error: error},
+                                              synchronize_session=False)
+                    abandoned = [dirac_id for dirac_id, in
+                                 session.query(cls.id).filter(cls.id.in_(failed))
+                                                      .filter(cls.attempts >= max_attempts)]
+            removed += len(done)
+            if failed:
+                cls.logger.warning("Failed to remove %d DIRAC job(s), will retry: %s",
+                                   len(failed), error)
+                if abandoned:
+                    cls.logger.error("Giving up removing DIRAC jobs after %d attempts, "
+                                     "these may be orphaned: %s", max_attempts, abandoned)
+
+    @classmethod
+    def _remove(cls, dirac_ids):
+        """
+        Kill and delete a batch of DIRAC jobs.
+
+        Args:
+            dirac_ids (list): The DIRAC job ids
+
+        Returns:
+            tuple: The (set of ids that couldn't be deleted, error message)
+        """
+        cls.logger.info("Killing/deleting %d DIRAC job(s).", len(dirac_ids))
+        try:
+            with dirac_api_client() as dirac:
+                # Jobs already in a final state can't be killed but can still be deleted.
+                result = dirac.kill(dirac_ids)
+                if not result['OK']:
+                    cls.logger.debug("DIRAC failed to kill some jobs: %s", result['Message'])
+                result = dirac.delete(dirac_ids)
+        except Exception as err:  # pylint: disable=broad-except
+            cls.logger.exception("Error calling DIRAC to remove jobs.")
+            return set(dirac_ids), str(err)
+
+        if result['OK']:
+            return set(), None
+        # Jobs DIRAC no longer knows about (InvalidJobIDs) don't need retrying.
+        failed = set(result.get('FailedJobIDs', dirac_ids)) |\
+            set(result.get('NonauthorizedJobIDs', ()))
+        return failed.intersection(dirac_ids), result['Message']
@@ -3,11 +3,11 @@ import logging
 import json
 
 import cherrypy
-from sqlalchemy import Column, Integer, Enum, ForeignKey, ForeignKeyConstraint
+from sqlalchemy import Column, Integer, Enum, ForeignKey, ForeignKeyConstraint, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 
-from productionsystem.sql.registry import managed_session
+from productionsystem.sql.registry import managed_session, stream_query
 from ..enums import DiracStatus
 from ..SQLTableBase import SQLTableBase
 
@@ -19,7 +19,10 @@ class DiracJobs(SQLTableBase):
 
     __tablename__ = 'diracjobs'
     __table_args__ = (ForeignKeyConstraint(['request_id', 'parametricjob_id'],
-                                           ['parametricjobs.request_id', 'parametricjobs.id']),)
+                                           ['parametricjobs.request_id', 'parametricjobs.id']),
+                      # Paging through (a status subset of) a parametric job's jobs.
+                      Index('ix_diracjobs_parametricjob_status',
+                            'request_id', 'parametricjob_id', 'status', 'id'))
     id = Column(Integer, primary_key=True)  # pylint: disable=invalid-name
     requester_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     request_id = Column(Integer, nullable=False)
@@ -29,16 +32,9 @@ class DiracJobs(SQLTableBase):
     logger = logging.getLogger(__name__)
 
     @classmethod
-    def get(cls, diracjob_id=None, request_id=None, parametricjob_id=None, user_id=None):
-        """Get dirac jobs."""
-        if diracjob_id is not None:
-            try:
-                diracjob_id = int(diracjob_id)
-            except ValueError:
-                cls.logger.error("Dirac job id: %r should be of type int "
-                                 "(or convertable to int)", diracjob_id)
-                raise
-
+    def _filtered_query(cls, query, request_id=None, parametricjob_id=None, user_id=None,
+                        status=None):
+        """Apply the common getter filters to a query."""
         if parametricjob_id is not None:
             try:
                 parametricjob_id = int(parametricjob_id)
@@ -63,17 +59,75 @@ class DiracJobs(SQLTableBase):
                                  "(or convertable to int)", user_id)
                 raise
 
-        with managed_session() as session:
-            query = session.query(cls)
-            if diracjob_id is not None:
-                query = query.filter_by(id=diracjob_id)
-            if parametricjob_id is not None:
-                query = query.filter_by(parametricjob_id=parametricjob_id)
-            if request_id is not None:
-                query = query.filter_by(request_id=request_id)
-            if user_id is not None:
-                query = query.filter_by(requester_id=user_id)
+        if status is not None:
+            if not isinstance(status, (list, tuple)):
+                cls.logger.error("Status: %r should be of type list/tuple", status)
+                raise TypeError
+
+        if parametricjob_id is not None:
+            query = query.filter_by(parametricjob_id=parametricjob_id)
+        if request_id is not None:
+            query = query.filter_by(request_id=request_id)
+        if user_id is not None:
+            query = query.filter_by(requester_id=user_id)
+        if status is not None:
+            query = query.filter(cls.status.in_(status))
+        return query
+
+    @classmethod
+    def count(cls, request_id=None, parametricjob_id=None, user_id=None, status=None):
+        """
+        Count dirac jobs.
+
+        Args:
+            request_id (int): Only count jobs belonging to this request
+            parametricjob_id (int): Only count jobs belonging to this parametric job
+            user_id (int): Only count jobs belonging to this user
+            status (list): Only count jobs with one of these DiracStatus values
+
+        Returns:
+            int: The number of matching dirac jobs
+        """
+        query = cls._filtered_query(cls.query(), request_id=request_id,
+                                    parametricjob_id=parametricjob_id, user_id=user_id,
+                                    status=status).with_entities(func.count(cls.id))
+        with managed_session(readonly=True) as session:
+            return query.with_session(session).scalar()
+
+    @classmethod
+    def get(cls, diracjob_id=None, request_id=None, parametricjob_id=None, user_id=None,
+            readonly=False, stream=False, fields=None, status=None, limit=None, offset=None):
+        """
+        Get dirac jobs.
+
+        If stream is True and no diracjob_id is given then a generator is
+        returned which loads the matching dirac jobs from the DB in chunks.
+        If fields is given then only those columns are selected and plain
+        dicts are returned rather than DiracJobs objects.
+        A collection can be restricted to the given statuses and paged through,
+        ordered by id, using limit and offset.
+        """
+        if diracjob_id is not None:
+            try:
+                diracjob_id = int(diracjob_id)
+            except ValueError:
+                cls.logger.error("Dirac job id: %r should be of type int "
+                                 "(or convertable to int)", diracjob_id)
+                raise
+
+        query = cls._filtered_query(cls.query(fields), request_id=request_id,
+                                    parametricjob_id=parametricjob_id, user_id=user_id,
+                                    status=status)
+        if diracjob_id is not None:
+            query = query.filter_by(id=diracjob_id)
+        elif limit is not None or offset is not None:
+            query = query.order_by(cls.id).limit(limit).offset(offset)
+
+        if stream and diracjob_id is None:
+            return stream_query(query, readonly=readonly)
 
+        with managed_session(readonly=readonly) as session:
+            query = query.with_session(session)
             if diracjob_id is None:
                 requests = query.all()
                 session.expunge_all()
@@ -88,5 +142,5 @@ class DiracJobs(SQLTableBase):
                 cls.logger.error("Multiple results found for dirac job id: %d",
                                  parametricjob_id)
                 raise
-            session.expunge(diracjob)
+            session.expunge_all()  # diracjob may be a dict if fields given
             return diracjob
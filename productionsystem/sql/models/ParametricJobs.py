@@ -10,7 +10,7 @@ from tempfile import NamedTemporaryFile
 
 import cherrypy
 from sqlalchemy import (Column, SmallInteger, Integer, Boolean, TEXT, TIMESTAMP,
-                        ForeignKey, Enum, CheckConstraint, event, inspect)
+                        ForeignKey, Enum, CheckConstraint, event, inspect, func, or_)
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
@@ -18,12 +18,19 @@ from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from productionsystem.config import getConfig
 from productionsystem.utils import TemporyFileManagerContext
 from productionsystem.monitoring.diracrpc.DiracRPCClient import (dirac_api_client,
-                                                                 dirac_api_job_client)
+                                                                 dirac_api_job_builder,
+                                                                 JobDescription)
 # from lzproduction.rpc.DiracRPCClient import dirac_api_client, ParametricDiracJobClient
 from ..enums import LocalStatus, DiracStatus
-from ..registry import managed_session, SessionRegistry
+from ..registry import managed_session, stream_query, SessionRegistry
 from ..SQLTableBase import SQLTableBase, SmartColumn
 from .DiracJobs import DiracJobs
+from .DiracCleanup import DiracCleanup
+from .SubmissionJournal import SubmissionJournal
+
+SUBMIT_CHUNK_SIZE = 1000
+SUBMIT_WORKERS = 4
+RUNSCRIPT_NAME = 'runscript.sh'
 
 
 def subdict(dct, keys, **kwargs):
@@ -80,24 +87,16 @@ class ParametricJobs(SQLTableBase):
         with managed_session() as session:
             session.merge(self)
 
-    def remove_dirac_jobs(self):
-        if not self.dirac_jobs:
-            return
-
-        dirac_ids = [job.id for job in self.dirac_jobs]
-        try:
-            with dirac_api_client() as dirac:
-                self.logger.info("Killing/deleting %d DIRAC job(s).", len(dirac_ids))
-                dirac.kill(dirac_ids)
-                dirac.delete(dirac_ids)
-        except BaseException:
-            self.logger.exception("Error doing DIRAC tidy up. Cleaning up local system "
-                                  "and forgetting about the (possibly) orphaned jobs "
-                                  "on DIRAC system")
-
 #    @abstractmethod
     def _setup_dirac_job(self, DiracJob, tmp_runscript, tmp_filemanager):
-        """Setup the DIRAC parametric job."""
+        """
+        Setup the DIRAC parametric job.
+
+        DiracJob is the JobDescription class rather than the DIRAC Job class. It takes the
+        same constructor arguments and records the calls made to the DIRAC Job setters (see
+        JOB_SETTERS), which must have JSON serialisable arguments, for the job to be built in
+        one call in the DIRAC daemon. No other attributes of the job can be used.
+        """
         tmp_runscript.write("echo HelloWorld\n")
         tmp_runscript.flush()
         job = DiracJob()
@@ -106,54 +105,124 @@ class ParametricJobs(SQLTableBase):
         return job
 
     def submit(self):
-        """Submit parametric job."""
-        with dirac_api_job_client() as (dirac, dirac_job_class),\
+        """
+        Submit parametric job.
+
+        Parametric DIRAC jobs with more than submit_chunk_size parameters (from the
+        monitoring config section) are split and submitted as chunks of at most that
+        many subjobs, up to submit_workers at a time. If some chunks fail the DIRAC
+        jobs from the chunks that succeeded are kept and the parametric job is marked
+        as failed.
+
+        Progress is recorded in the submission journal, each chunk's DIRAC jobs being
+        stored as soon as DIRAC returns them. Calling submit again after an interrupted
+        submission resumes it, only submitting the chunks that weren't recorded. A chunk
+        that was in flight when the submission was interrupted is submitted again.
+        """
+        config = getConfig('monitoring')
+        workers = config.get('submit_workers', SUBMIT_WORKERS)
+        journal = SubmissionJournal.start(self.request_id, self.id,
+                                          config.get('submit_chunk_size', SUBMIT_CHUNK_SIZE))
+        submitted_chunks = journal.submitted_chunks
+        dirac_job_ids = {job['id'] for job in DiracJobs.get(request_id=self.request_id,
+                                                            parametricjob_id=self.id,
+                                                            fields=('id',))}
+        if journal.finished:
+            self.logger.info("Parametric job %d.%d has already been submitted",
+                             self.request_id, self.id)
+            self.num_jobs = len(dirac_job_ids)
+            return
+        if submitted_chunks:
+            self.logger.info("Resuming submission of parametric job %d.%d, %d chunk(s) "
+                             "(%d Dirac jobs) already submitted", self.request_id, self.id,
+                             len(submitted_chunks), len(dirac_job_ids))
+
+        with dirac_api_job_builder() as (dirac, build_job),\
                 TemporyFileManagerContext() as tmp_filemanager:
             try:
-                dirac_jobs = self._setup_dirac_job(dirac_job_class,
-                                                   tmp_filemanager.new_file(),
+                # A fixed name lets identical run scripts share a sandbox cache entry.
+                dirac_jobs = self._setup_dirac_job(JobDescription,
+                                                   tmp_filemanager.new_file(RUNSCRIPT_NAME),
                                                    tmp_filemanager)
+                if not isinstance(dirac_jobs, Iterable):
+                    dirac_jobs = [dirac_jobs]
+                dirac_jobs = [build_job(job.dumps()) for job in dirac_jobs]
             except Exception as err:
                 self.logger.exception("Error setting up the parametric job %d.%d: %s",
                                       self.request_id, self.id, err.message)
                 self.status = LocalStatus.FAILED
+                journal.finish()
                 return
 
-            if not isinstance(dirac_jobs, Iterable):
-                dirac_jobs = [dirac_jobs]
-
             # If the parametricjob has large number of subjobs then submission could timeout
-            # waiting for DIRAC to create all the subjobs, this allows you to split it into
-            # a few parametricjobs.
-            dirac_job_ids = set()
-            for dirac_job in dirac_jobs:
+            # waiting for DIRAC to create all the subjobs, so large parametric jobs are
+            # submitted in chunks. _setup_dirac_job can also return several jobs.
+            failed_chunks = 0
+            for job_index, dirac_job in enumerate(dirac_jobs):
+                skip = [chunk for index, chunk in submitted_chunks if index == job_index]
                 try:
-                    result = dirac.submit(dirac_job)
+                    results = deepcopy(dirac.submitChunks(dirac_job, journal.chunk_size, workers,
+                                                          skip, self._chunk_recorder(journal,
+                                                                                     job_index)))
                 except Exception as err:
                     self.logger.exception("Error submitting parametric job %d.%d: %s",
                                           self.request_id, self.id, err.message)
-                    self.status = LocalStatus.FAILED
-                    self.remove_dirac_jobs()  # Clean up Dirac jobs that may have been created
-                    return
-
-                if not result['OK']:
-                    self.logger.error("DIRAC error submitting parametricjob %d.%d: %s",
-                                      self.request_id, self.id, result['Message'])
-                    self.status = LocalStatus.FAILED
-                    self.remove_dirac_jobs()  # Clean up Dirac jobs that may have been created
-                    return
-
-                created_ids = result['Value']
-                if isinstance(created_ids, int):  # non-parametric submission
-                    created_ids = [created_ids]
-                dirac_job_ids.update(created_ids)
+                    failed_chunks += 1
+                    continue
+
+                for chunk, result in enumerate(results):
+                    if result is None:  # Submitted before the submission was interrupted.
+                        continue
+                    if not result['OK']:
+                        self.logger.error("DIRAC error submitting chunk %d of parametricjob "
+                                          "%d.%d: %s", chunk, self.request_id, self.id,
+                                          result['Message'])
+                        failed_chunks += 1
+                        continue
+
+                    created_ids = result['Value']
+                    if isinstance(created_ids, int):  # non-parametric submission
+                        created_ids = [created_ids]
+                    dirac_job_ids.update(created_ids)
 
             self.dirac_jobs = [DiracJobs(id=i, parametricjob_id=self.id, request_id=self.request_id,
                                          requester_id=self.requester_id,
                                          status=DiracStatus.UNKNOWN) for i in dirac_job_ids]
             self.num_jobs = len(dirac_job_ids)
-            self.logger.info("Successfully submitted %d Dirac jobs for %d.%d",
-                             len(self.dirac_jobs), self.request_id, self.id)
+            if failed_chunks:
+                self.logger.error("Failed to submit %d chunk(s) of parametric job %d.%d, "
+                                  "keeping the %d Dirac jobs that were created",
+                                  failed_chunks, self.request_id, self.id, len(dirac_job_ids))
+                self.status = LocalStatus.FAILED
+            else:
+                self.logger.info("Successfully submitted %d Dirac jobs for %d.%d",
+                                 len(self.dirac_jobs), self.request_id, self.id)
+            journal.finish()
+
+    def _chunk_recorder(self, journal, job_index):
+        """
+        Make the callback used to journal chunks as they are submitted.
+
+        Args:
+            journal (SubmissionJournal): This parametric job's submission journal
+            job_index (int): The index of the DIRAC job being split into chunks
+
+        Returns:
+            callable: Callback taking the chunk index and its DIRAC submission result
+        """
+        def record_chunk(chunk, result):
+            """Journal a successfully submitted chunk."""
+            if not result['OK']:
+                return
+            created_ids = result['Value']
+            if isinstance(created_ids, int):  # non-parametric submission
+                created_ids = [created_ids]
+            try:
+                journal.record(job_index, chunk, list(created_ids), self.requester_id)
+            except Exception:
+                self.logger.exception("Error journaling chunk %d of parametric job %d.%d",
+                                      chunk, self.request_id, self.id)
+        return record_chunk
 
     def monitor(self):
         """
@@ -175,14 +244,12 @@ class ParametricJobs(SQLTableBase):
             self.num_running = 0
             return
 
+        # Failed/stalled jobs are rescheduled beforehand, across all requests, by the
+        # monitoring daemon's RescheduleEngine which sets those it reschedules to RECEIVED.
         job_types = defaultdict(set)
         for job in self.dirac_jobs:
             job_types[job.status].add(job.id)
-            # add auto-reschedule jobs
-            if job.status in (DiracStatus.FAILED, DiracStatus.STALLED) and job.reschedules < 2:
-                job_types['Reschedule'].add(job.id)
 
-        reschedule_jobs = job_types['Reschedule'] if job_types[DiracStatus.DONE] else set()
         monitor_jobs = job_types[DiracStatus.RUNNING] | \
             job_types[DiracStatus.RECEIVED] | \
             job_types[DiracStatus.QUEUED] | \
@@ -192,29 +259,6 @@ class ParametricJobs(SQLTableBase):
             job_types[DiracStatus.UNKNOWN] | \
             job_types[DiracStatus.COMPLETED]
 
-        if self.reschedule:
-            reschedule_jobs = job_types[DiracStatus.FAILED] | job_types[DiracStatus.STALLED]
-
-        # Reschedule jobs
-        rescheduled_jobs = set()
-        if reschedule_jobs:
-            self.logger.info("Rescheduling DIRAC jobs: %s", list(reschedule_jobs))
-            with dirac_api_client() as dirac:
-                try:
-                    result = dirac.reschedule(reschedule_jobs)
-                except Exception as err:
-                    self.logger.exception("Error calling DIRAC to reschedule jobs: %s", err.message)
-                else:
-                    if not result['OK']:
-                        self.logger.error("DIRAC failed to reschedule jobs: %s", result['Message'])
-                    else:
-                        rescheduled_jobs.update(result['Value'])
-                        self.logger.info("Rescheduled jobs: %s", list(rescheduled_jobs))
-                        skipped_jobs = reschedule_jobs.difference(rescheduled_jobs)
-                        if skipped_jobs:
-                            self.logger.warning("Failed to reschedule jobs: %s", list(skipped_jobs))
-                        monitor_jobs.update(rescheduled_jobs)
-
         # Update status
         monitored_jobs = {}
         self.logger.debug("Monitoring DIRAC jobs: %s", list(monitor_jobs))
@@ -239,8 +283,6 @@ class ParametricJobs(SQLTableBase):
 
         statuses = Counter()
         for job in self.dirac_jobs:
-            if job.id in rescheduled_jobs:
-                job.reschedules += 1
             if job.id in monitored_jobs:
                 try:
                     # pylint: disable=unsubscriptable-object
@@ -262,8 +304,16 @@ class ParametricJobs(SQLTableBase):
         self.reschedule = False
 
     @classmethod
-    def get(cls, request_id=None, parametricjob_id=None, user_id=None):
-        """Get parametric jobs."""
+    def get(cls, request_id=None, parametricjob_id=None, user_id=None,
+            readonly=False, stream=False, fields=None):
+        """
+        Get parametric jobs.
+
+        If stream is True and a collection is requested then a generator is
+        returned which loads the matching parametric jobs from the DB in chunks.
+        If fields is given then only those columns are selected and plain
+        dicts are returned rather than ParametricJobs objects.
+        """
         if request_id is not None:
             try:
                 request_id = int(request_id)
@@ -288,15 +338,19 @@ class ParametricJobs(SQLTableBase):
                                  "(or convertable to int)", user_id)
                 raise
 
-        with managed_session() as session:
-            query = session.query(cls)
-            if request_id is not None:
-                query = query.filter_by(request_id=request_id)
-            if parametricjob_id is not None:
-                query = query.filter_by(id=parametricjob_id)
-            if user_id is not None:
-                query = query.filter_by(requester_id=user_id)
+        query = cls.query(fields)
+        if request_id is not None:
+            query = query.filter_by(request_id=request_id)
+        if parametricjob_id is not None:
+            query = query.filter_by(id=parametricjob_id)
+        if user_id is not None:
+            query = query.filter_by(requester_id=user_id)
 
+        if stream and (request_id is None or parametricjob_id is None):
+            return stream_query(query, readonly=readonly)
+
+        with managed_session(readonly=readonly) as session:
+            query = query.with_session(session)
             if request_id is None or parametricjob_id is None:
                 requests = query.all()
                 session.expunge_all()
@@ -311,9 +365,47 @@ class ParametricJobs(SQLTableBase):
                 cls.logger.error("Multiple results found for parametric job id: %d",
                                  parametricjob_id)
                 raise
-            session.expunge(parametricjob)
+            session.expunge_all()  # parametricjob may be a dict if fields given
             return parametricjob
 
+    @classmethod
+    def queue_depths(cls):
+        """
+        Get the number of DIRAC jobs waiting to run per requested site.
+
+        Uses the num_submitted counters, i.e. jobs which DIRAC has received but
+        which haven't started running yet.
+
+        Returns:
+            dict: Map of requested site to number of waiting DIRAC jobs
+        """
+        with managed_session() as session:
+            return {site: int(depth) for site, depth in
+                    session.query(cls.site, func.sum(cls.num_submitted))
+                           .filter(cls.num_submitted > 0)
+                           .group_by(cls.site)}
+
+    @classmethod
+    def usage_by_requester(cls, since):
+        """
+        Get the number of DIRAC jobs each user has used recently.
+
+        Counts the jobs of parametric jobs which are still active or were last
+        updated (so finished) since the given time.
+
+        Args:
+            since (datetime): The start of the usage window
+
+        Returns:
+            dict: Map of requester id to number of DIRAC jobs
+        """
+        active = (LocalStatus.SUBMITTING, LocalStatus.SUBMITTED, LocalStatus.RUNNING)
+        with managed_session() as session:
+            return {requester_id: int(usage) for requester_id, usage in
+                    session.query(cls.requester_id, func.sum(cls.num_jobs))
+                           .filter(or_(cls.status.in_(active), cls.timestamp >= since))
+                           .group_by(cls.requester_id)}
+
 
 @event.listens_for(ParametricJobs.status, "set", propagate=True)
 def intercept_status_set(target, newvalue, oldvalue, _):
@@ -324,15 +416,24 @@ def intercept_status_set(target, newvalue, oldvalue, _):
                            target.request_id, target.id, oldvalue.name, newvalue.name)
 
 
+@event.listens_for(SessionRegistry, "before_flush")
+def intercept_before_flush(session, *_):
+    """Intercept deletion of parametric jobs and queue removal of their DIRAC jobs."""
+    dirac_ids = []
+    for object_ in session.deleted:
+        if isinstance(object_, ParametricJobs):
+            ParametricJobs.logger.info("Parametric job %d.%d is being removed, queueing tidy up "
+                                       "of DIRAC job(s).",
+                                       object_.request_id, object_.id)
+            dirac_ids.extend(job.id for job in object_.dirac_jobs)
+            SubmissionJournal.discard(session, object_.request_id, object_.id)
+    # Queued in the same transaction so the removal is neither lost nor done if it rolls back.
+    DiracCleanup.enqueue(session, dirac_ids)
+
+
 @event.listens_for(SessionRegistry, "persistent_to_deleted")
 def intercept_persistent_to_deleted(session, object_):
-    """Intercept deletion of object and remove DIRAC jobs."""
+    """Intercept deletion of object."""
     if isinstance(object_, DiracJobs):
         DiracJobs.logger.debug("Local DB Dirac job %d from parametric job %d.%d is being removed.",
                                object_.id, object_.request_id, object_.parametricjob_id)
-
-    if isinstance(object_, ParametricJobs):
-        ParametricJobs.logger.info("Parametric job %d.%d is being removed, triggering bulk tidy up "
-                                   "of DIRAC job(s).",
-                                   object_.request_id, object_.id)
-        object_.remove_dirac_jobs()
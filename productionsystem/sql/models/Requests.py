@@ -9,8 +9,9 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import relationship, joinedload
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 
+from productionsystem.monitoring.diracrpc.DiracRPCClient import DiracServerBusy
 from ..enums import LocalStatus
-from ..registry import managed_session
+from ..registry import managed_session, stream_query
 from ..SQLTableBase import SQLTableBase, SmartColumn
 from ..models import ParametricJobs
 from .Users import Users
@@ -76,11 +77,19 @@ class Requests(SQLTableBase):
             session.merge(self)
 
     def submit(self):
-        """Submit Request."""
+        """
+        Submit Request, the highest priority parametric jobs first.
+
+        Raises:
+            DiracServerBusy: If the DIRAC RPC server was too busy, the submission can be
+                             resumed by calling submit again later
+        """
         self.logger.info("Submitting request %s", self.id)
         try:
-            for job in self.parametric_jobs:
+            for job in sorted(self.parametric_jobs, key=lambda job: -job.priority):
                 job.submit()
+        except DiracServerBusy:
+            raise
         except:
             self.logger.exception("Unhandled exception while submitting request %s", self.id)
             self.status = LocalStatus.FAILED
@@ -130,8 +139,21 @@ class Requests(SQLTableBase):
 
     @classmethod
     def get(cls, request_id=None, user_id=None,
-            load_user=False, load_parametricjobs=False, status=None):
-        """Get requests."""
+            load_user=False, load_parametricjobs=False, status=None, readonly=False, stream=False,
+            fields=None, load_diracjobs=True):
+        """
+        Get requests.
+
+        If stream is True and a collection is requested then a generator is
+        returned which loads the matching requests from the DB in chunks. This
+        can't be combined with load_parametricjobs.
+        If load_parametricjobs is True then the dirac jobs of each parametric job
+        are also loaded unless load_diracjobs is False, in which case only the
+        parametric job summaries are available.
+        If fields is given then only those columns are selected and plain
+        dicts are returned rather than Requests objects. In this case
+        load_user and load_parametricjobs are ignored.
+        """
         if request_id is not None:
             try:
                 if isinstance(request_id, (list, tuple)):
@@ -156,18 +178,33 @@ class Requests(SQLTableBase):
                 cls.logger.error("Status: %r should be of type list/tuple", status)
                 raise TypeError
 
-        with managed_session() as session:
-            query = session.query(cls)
-            if load_user:
-                query = query.options(joinedload(cls.requester, innerjoin=True))
-            if load_parametricjobs:
-                query = query.options(joinedload(cls.parametric_jobs)
-                                      .joinedload(ParametricJobs.dirac_jobs))
-            if user_id is not None:
-                query = query.filter_by(requester_id=user_id)
-            if status is not None:
-                query = query.filter(cls.status.in_(status))
+        if fields is not None:
+            load_user = load_parametricjobs = False
+
+        if stream and load_parametricjobs:
+            cls.logger.error("Can't stream requests while eager loading parametric jobs")
+            raise ValueError("stream and load_parametricjobs are mutually exclusive")
+
+        query = cls.query(fields)
+        if load_user:
+            query = query.options(joinedload(cls.requester, innerjoin=True))
+        if load_parametricjobs and load_diracjobs:
+            query = query.options(joinedload(cls.parametric_jobs)
+                                  .joinedload(ParametricJobs.dirac_jobs))
+        elif load_parametricjobs:
+            query = query.options(joinedload(cls.parametric_jobs))
+        if user_id is not None:
+            query = query.filter_by(requester_id=user_id)
+        if status is not None:
+            query = query.filter(cls.status.in_(status))
+
+        if stream and request_id is None:
+            return stream_query(query, readonly=readonly)
+        if stream and isinstance(request_id, (list, tuple)):
+            return stream_query(query.filter(cls.id.in_(request_id)), readonly=readonly)
 
+        with managed_session(readonly=readonly) as session:
+            query = query.with_session(session)
             if request_id is None:
                 requests = query.all()
                 session.expunge_all()
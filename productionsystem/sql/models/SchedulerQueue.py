@@ -0,0 +1,71 @@
+"""Submission Scheduler Queue Table."""
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, Float, TIMESTAMP, Enum
+
+from ..enums import SchedulerDecision
+from ..registry import managed_session
+from ..SQLTableBase import SQLTableBase
+
+
+class SchedulerQueue(SQLTableBase):
+    """
+    Submission Scheduler Queue SQL Table.
+
+    A snapshot of the approved requests the monitoring daemon's fair-share scheduler
+    considered in its last cycle, in the order it took them, along with the factors behind
+    its choice and what happened to each. Replaced in full every monitoring cycle.
+    """
+
+    __tablename__ = 'schedulerqueue'
+    request_id = Column(Integer, primary_key=True, autoincrement=False)
+    position = Column(Integer, nullable=False)
+    requester_id = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    fairshare_factor = Column(Float, nullable=False)
+    priority_factor = Column(Float, nullable=False)
+    age_factor = Column(Float, nullable=False)
+    decision = Column(Enum(SchedulerDecision), nullable=False)
+    timestamp = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    logger = logging.getLogger(__name__)
+
+    @classmethod
+    def replace(cls, entries):
+        """
+        Replace the queue snapshot.
+
+        Args:
+            entries (list): The new snapshot's SchedulerQueue entries
+        """
+        with managed_session() as session:
+            session.query(cls).delete(synchronize_session=False)
+            session.add_all(entries)
+
+    @classmethod
+    def get(cls, user_id=None, readonly=False):
+        """
+        Get the queue snapshot.
+
+        Args:
+            user_id (int): Only get the entries of this user's requests
+            readonly (bool): Query the read-only DB (if configured)
+
+        Returns:
+            list: The SchedulerQueue entries in the order the scheduler took them
+        """
+        if user_id is not None:
+            try:
+                user_id = int(user_id)
+            except ValueError:
+                cls.logger.error("User id: %r should be of type int "
+                                 "(or convertable to int)", user_id)
+                raise
+
+        with managed_session(readonly=readonly) as session:
+            query = session.query(cls)
+            if user_id is not None:
+                query = query.filter_by(requester_id=user_id)
+            entries = query.order_by(cls.position).all()
+            session.expunge_all()
+            return entries
@@ -34,7 +34,7 @@ class Services(SQLTableBase):
             session.merge(self)
 
     @classmethod
-    def get_services(cls, service_id=None, service_name=None):
+    def get_services(cls, service_id=None, service_name=None, readonly=False):
         """
         Get service from database.
 
@@ -43,6 +43,7 @@ class Services(SQLTableBase):
         Args:
             service_id (int): Service id to extract
             service_name (string): Service name to extract
+            readonly (bool): Query the read-only DB (if configured)
 
         Returns:
             list/Services: The services/service pulled from the database
@@ -60,7 +61,7 @@ class Services(SQLTableBase):
                                  "(or convertable to int)", service_id)
                 raise
 
-        with managed_session() as session:
+        with managed_session(readonly=readonly) as session:
             query = session.query(cls)
             query_id = []
             if service_id is not None:
@@ -0,0 +1,117 @@
+"""Submission Journal Table."""
+import json
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, Boolean, TEXT, TIMESTAMP, ForeignKeyConstraint
+
+from ..registry import managed_session
+from ..SQLTableBase import SQLTableBase
+from .DiracJobs import DiracJobs
+
+
+class SubmissionJournal(SQLTableBase):
+    """
+    Submission Journal SQL Table.
+
+    Records the progress of submitting a parametric job to DIRAC. Each chunk's DIRAC jobs
+    are stored together with the chunk being marked as submitted as soon as DIRAC returns,
+    so if the submission is interrupted it can be resumed without resubmitting (or losing
+    track of) the chunks already submitted.
+    """
+
+    __tablename__ = 'submissionjournal'
+    __table_args__ = (ForeignKeyConstraint(['request_id', 'parametricjob_id'],
+                                           ['parametricjobs.request_id', 'parametricjobs.id']),)
+    request_id = Column(Integer, primary_key=True)
+    parametricjob_id = Column(Integer, primary_key=True)
+    chunk_size = Column(Integer, nullable=False)
+    chunks = Column(TEXT, nullable=False, default='[]')
+    finished = Column(Boolean, nullable=False, default=False)
+    timestamp = Column(TIMESTAMP, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    logger = logging.getLogger(__name__)
+
+    @property
+    def submitted_chunks(self):
+        """The set of (job index, chunk index) pairs already submitted."""
+        return {tuple(chunk) for chunk in json.loads(self.chunks)}
+
+    @classmethod
+    def start(cls, request_id, parametricjob_id, chunk_size):
+        """
+        Get the journal for a parametric job, starting a new one if there isn't one.
+
+        Args:
+            request_id (int): The request id
+            parametricjob_id (int): The parametric job id
+            chunk_size (int): The chunk size for a new submission, an existing journal
+                              keeps the chunk size it was started with
+
+        Returns:
+            SubmissionJournal: The journal
+        """
+        with managed_session() as session:
+            journal = session.query(cls).get((request_id, parametricjob_id))
+            if journal is None:
+                journal = cls(request_id=request_id, parametricjob_id=parametricjob_id,
+                              chunk_size=chunk_size, chunks='[]', finished=False)
+                session.add(journal)
+                session.flush()
+            session.expunge(journal)
+            return journal
+
+    @classmethod
+    def discard(cls, session, request_id, parametricjob_id):
+        """
+        Remove the journal of a parametric job that is being deleted.
+
+        Args:
+            session (Session): The session whose transaction the deletion is part of
+            request_id (int): The request id
+            parametricjob_id (int): The parametric job id
+        """
+        session.execute(cls.__table__.delete()
+                        .where(cls.__table__.c.request_id == request_id)
+                        .where(cls.__table__.c.parametricjob_id == parametricjob_id))
+
+    @classmethod
+    def request_ids(cls, request_ids):
+        """Return those of the given request ids that have any submission journal."""
+        if not request_ids:
+            return set()
+        with managed_session() as session:
+            return {request_id for request_id, in session.query(cls.request_id)
+                                                        .filter(cls.request_id.in_(request_ids))
+                                                        .distinct()}
+
+    def record(self, job_index, chunk, dirac_ids, requester_id):
+        """
+        Record a submitted chunk along with its DIRAC jobs.
+
+        Args:
+            job_index (int): The index of the DIRAC job the chunk was split from
+            chunk (int): The chunk index
+            dirac_ids (list): The DIRAC ids of the chunk's jobs
+            requester_id (int): The id of the user the jobs belong to
+        """
+        with managed_session() as session:
+            journal = session.query(type(self)).with_for_update()\
+                             .get((self.request_id, self.parametricjob_id))
+            submitted = json.loads(journal.chunks)
+            if [job_index, chunk] in submitted:
+                return
+            submitted.append([job_index, chunk])
+            journal.chunks = json.dumps(submitted)
+            session.add_all(DiracJobs(id=dirac_id, request_id=self.request_id,
+                                      parametricjob_id=self.parametricjob_id,
+                                      requester_id=requester_id) for dirac_id in dirac_ids)
+            session.flush()
+            self.chunks = journal.chunks
+
+    def finish(self):
+        """Mark the submission as having run to completion, successfully or not."""
+        with managed_session() as session:
+            session.query(type(self))\
+                   .filter_by(request_id=self.request_id, parametricjob_id=self.parametricjob_id)\
+                   .update({'finished': True}, synchronize_session=False)
+        self.finished = True
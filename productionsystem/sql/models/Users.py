@@ -36,7 +36,12 @@ class Users(SQLTableBase):
         Returns:
             str: The human-readable name
         """
-        cns = (token[len('CN='):] for token in self.dn.split('/')
+        return self.name_from_dn(self.dn)
+
+    @staticmethod
+    def name_from_dn(dn):  # pylint: disable=invalid-name
+        """Human-readable name from a slash delimited DN (see name)."""
+        cns = (token[len('CN='):] for token in dn.split('/')
                if token.startswith('CN='))
         return sorted(cns, key=len)[-1]
 
@@ -54,7 +59,7 @@ class Users(SQLTableBase):
             session.merge(self)
 
     @classmethod
-    def get_users(cls, user_id=None):
+    def get_users(cls, user_id=None, readonly=False):
         """
         Get users from database.
 
@@ -62,6 +67,7 @@ class Users(SQLTableBase):
 
         Args:
             user_id (int): User id to extract
+            readonly (bool): Query the read-only DB (if configured)
 
         Returns:
             list/Users: The users/user pulled from the database
@@ -74,7 +80,7 @@ class Users(SQLTableBase):
                                  "(or convertable to int)", user_id)
                 raise
 
-        with managed_session() as session:
+        with managed_session(readonly=readonly) as session:
             query = session.query(cls)
             if user_id is None:
                 users = query.all()
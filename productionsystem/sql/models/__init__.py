@@ -4,6 +4,9 @@ from productionsystem.config import ConfigSystem
 from Users import Users
 from Services import Services
 from DiracJobs import DiracJobs
+from DiracCleanup import DiracCleanup
+from SubmissionJournal import SubmissionJournal
+from SchedulerQueue import SchedulerQueue
 
 # pylint: disable=no-member
 ParametricJobs = ConfigSystem.get_instance().entry_point_map['dbmodels']['parametricjobs'].load()
@@ -2,7 +2,7 @@
 import logging
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import scoped_session, sessionmaker
 
 from productionsystem.singleton import singleton
@@ -10,25 +10,89 @@ from productionsystem.singleton import singleton
 from .SQLTableBase import SQLTableBase
 
 
+def create_missing_indexes(engine):
+    """
+    Create any indexes missing from existing tables.
+
+    create_all only creates indexes along with new tables so indexes added
+    to the models later would otherwise never reach an existing DB.
+
+    Args:
+        engine (Engine): The DB engine
+
+    Returns:
+        list: The names of the indexes created
+    """
+    logger = logging.getLogger(__name__)
+    inspector = inspect(engine)
+    created = []
+    for table in SQLTableBase.metadata.sorted_tables:
+        existing = set(index['name'] for index in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info("Creating missing index %s on table %s.", index.name, table.name)
+                index.create(bind=engine)
+                created.append(index.name)
+    return created
+
+
 @singleton
 class SessionRegistry(scoped_session):
     """
     Singleton version of SQLAlchemy's scoped_session.
 
-    This avoids the need to make the scoped_session (session registry) global
+    This avoids the need to make the scoped_session (session registry) global.
+    If a readonly_url is given then a second session registry bound to that
+    (read replica) DB is made available through the readonly attribute,
+    otherwise readonly simply refers back to this primary registry.
     """
-    def __init__(self, url):
+    def __init__(self, url, readonly_url=None):
         engine = create_engine(url)
         SQLTableBase.metadata.create_all(bind=engine)
+        create_missing_indexes(engine)
         super(SessionRegistry, self).__init__(sessionmaker(engine))
         self._logger = logging.getLogger(__name__)
+        self._engines = [engine]
+        self._readonly = self
+        if readonly_url is not None and readonly_url != url:
+            self._logger.info("Routing read-only DB queries to replica.")
+            readonly_engine = create_engine(readonly_url)
+            self._engines.append(readonly_engine)
+            self._readonly = scoped_session(sessionmaker(readonly_engine))
+
+    @property
+    def readonly(self):
+        """The read-only session registry."""
+        return self._readonly
+
+    def dispose(self):
+        """
+        Discard all pooled DB connections.
+
+        The engines start new connection pools, so this should be called both
+        before and after forking to avoid processes sharing connections.
+        """
+        self.remove()
+        if self._readonly is not self:
+            self._readonly.remove()
+        for engine in self._engines:
+            engine.dispose()
 
 
 @contextmanager
-def managed_session():
-    """Transactional scoped DB session context."""
+def managed_session(readonly=False):
+    """
+    Transactional scoped DB session context.
+
+    Args:
+        readonly (bool): Use a session from the read-only registry. Only
+                         queries that don't need to see the latest writes
+                         (including their own) should set this.
+    """
     logger = logging.getLogger(__name__)
     session_registry = SessionRegistry.get_instance()  # pylint: disable=no-member
+    if readonly:
+        session_registry = session_registry.readonly
     try:
         yield session_registry()
         session_registry.commit()
@@ -39,3 +103,68 @@ def managed_session():
         raise
     finally:
         session_registry.remove()
+
+
+def _iter_query(query, yield_per, readonly):
+    """Generator running a query in its own unscoped session, see stream_query."""
+    logger = logging.getLogger(__name__)
+    session_registry = SessionRegistry.get_instance()  # pylint: disable=no-member
+    if readonly:
+        session_registry = session_registry.readonly
+    session = session_registry.session_factory()
+    try:
+        for result in query.with_session(session).yield_per(yield_per):
+            # Detach as with the non-streamed getters so serialising doesn't lazy load.
+            if isinstance(result, SQLTableBase):
+                session.expunge(result)
+            yield result
+        session.commit()
+    except:  # pylint: disable=bare-except
+        logger.exception("Problem with streamed DB query, rolling back.")
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _resume(first, results):
+    """Generator yielding an already fetched first result followed by the rest."""
+    try:
+        yield first
+        for result in results:
+            yield result
+    finally:
+        results.close()
+
+
+def stream_query(query, yield_per=1000, readonly=False):
+    """
+    Stream the results of a query.
+
+    Runs the given (session-less) query in its own unscoped session, loading
+    the results in chunks of yield_per rows. The session is kept open until
+    the returned generator is exhausted or closed. Mapped instances are
+    detached before being yielded. Using an unscoped session means that the
+    thread's scoped session is free to be used in the meantime.
+
+    The query is run, and the first chunk loaded, before returning so that DB
+    errors are raised here (e.g. within a request handler's error handling)
+    rather than once the response has started streaming.
+
+    Args:
+        query (Query): The query to run. Any session it's bound to is ignored
+        yield_per (int): The number of rows to load at a time
+        readonly (bool): Use a session from the read-only registry
+
+    Returns:
+        generator: The query results
+
+    Note:
+        yield_per is not compatible with joined eager loading of collections.
+    """
+    results = _iter_query(query, yield_per, readonly)
+    try:
+        first = next(results)
+    except StopIteration:
+        return results  # Already exhausted so yields nothing.
+    return _resume(first, results)
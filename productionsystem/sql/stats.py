@@ -0,0 +1,164 @@
+"""
+Aggregated job statistics.
+
+The statistics are computed in the DB with GROUP BY queries over the
+ParametricJobs counters and DiracJobs statuses rather than by loading
+every request. Results are cached for a short time and invalidated as
+soon as the monitoring daemon writes any parametric job or DIRAC job.
+"""
+import time
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import func
+
+from productionsystem.utils import TimedCache
+from .registry import managed_session
+from .models import Users, Requests, ParametricJobs, DiracJobs
+
+__all__ = ('STAT_TYPES', 'get_stats')
+
+CACHE_TTL = 300  # 5 mins
+VERSION_CHECK_INTERVAL = 10  # secs
+_cache = TimedCache(ttl=CACHE_TTL, maxsize=256)  # pylint: disable=invalid-name
+_version = {'checked': None, 'version': None}  # pylint: disable=invalid-name
+_version_lock = threading.Lock()  # pylint: disable=invalid-name
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+COUNTERS = ('num_jobs', 'num_completed', 'num_failed', 'num_submitted', 'num_running')
+
+
+def _counter_columns():
+    """Summed ParametricJobs counters."""
+    return [func.count(ParametricJobs.id).label('num_parametricjobs')] +\
+        [func.coalesce(func.sum(getattr(ParametricJobs, counter)), 0).label(counter)
+         for counter in COUNTERS]
+
+
+def _window(query, since, until, user_id):
+    """Restrict query to requests made in the time window (by the given user)."""
+    if since is not None:
+        query = query.filter(Requests.request_date >= since)
+    if until is not None:
+        query = query.filter(Requests.request_date < until)
+    if user_id is not None:
+        query = query.filter(Requests.requester_id == user_id)
+    return query
+
+
+def _counters_dict(row, **kwargs):
+    """Convert a row of summed counters to a dict."""
+    output = {counter: int(getattr(row, counter)) for counter in COUNTERS}
+    output['num_parametricjobs'] = row.num_parametricjobs
+    output.update(kwargs)
+    return output
+
+
+def status_stats(session, since=None, until=None, user_id=None):
+    """Number of DIRAC jobs per status."""
+    query = session.query(DiracJobs.status, func.count(DiracJobs.id))\
+                   .join(Requests, Requests.id == DiracJobs.request_id)
+    query = _window(query, since, until, user_id).group_by(DiracJobs.status)
+    return [{'status': status.name.capitalize(), 'count': count}
+            for status, count in query]
+
+
+def user_stats(session, since=None, until=None, user_id=None):
+    """Job counts per requester."""
+    query = session.query(Users.id, Users.dn, *_counter_columns())\
+                   .join(ParametricJobs, ParametricJobs.requester_id == Users.id)\
+                   .join(Requests, Requests.id == ParametricJobs.request_id)
+    query = _window(query, since, until, user_id).group_by(Users.id, Users.dn)
+    return [_counters_dict(row, requester_id=row.id, requester=Users.name_from_dn(row.dn))
+            for row in query]
+
+
+def site_stats(session, since=None, until=None, user_id=None):
+    """Job counts per site."""
+    query = session.query(ParametricJobs.site, *_counter_columns())\
+                   .join(Requests, Requests.id == ParametricJobs.request_id)
+    query = _window(query, since, until, user_id).group_by(ParametricJobs.site)
+    return [_counters_dict(row, site=row.site) for row in query]
+
+
+def daily_stats(session, since=None, until=None, user_id=None):
+    """Job counts per day requested."""
+    day = func.date(Requests.request_date).label('day')
+    query = session.query(day, *_counter_columns())\
+                   .join(ParametricJobs, ParametricJobs.request_id == Requests.id)
+    query = _window(query, since, until, user_id).group_by(day).order_by(day)
+    # sqlite returns a string where as MySQL returns a date object.
+    return [_counters_dict(row, day=str(row.day)) for row in query]
+
+
+STAT_TYPES = {'status': status_stats,
+              'users': user_stats,
+              'sites': site_stats,
+              'daily': daily_stats}
+
+
+def _data_version(session):
+    """
+    Return a cheap marker of the current state of the parametric and DIRAC jobs.
+
+    The monitoring daemon updates the parametric job counters (and so their
+    timestamps) whenever it writes them. DIRAC jobs have no timestamp so their
+    per status counts and total reschedules are used instead, these change
+    whenever the daemon moves a DIRAC job between statuses or reschedules it.
+    """
+    parametricjobs = tuple(session.query(func.count(ParametricJobs.id),
+                                         func.max(ParametricJobs.timestamp)).one())
+    diracjobs = tuple(sorted((status.name, count) for status, count in
+                             session.query(DiracJobs.status, func.count(DiracJobs.id))
+                             .group_by(DiracJobs.status)))
+    reschedules = session.query(func.coalesce(func.sum(DiracJobs.reschedules), 0)).scalar()
+    return parametricjobs + (diracjobs, int(reschedules))
+
+
+def _current_version(session):
+    """
+    Return the data version, querying the DB at most every VERSION_CHECK_INTERVAL.
+
+    The monitoring daemon only writes once per cycle so there is no point in
+    paying for the version query on every stats request.
+    """
+    with _version_lock:
+        now = time.time()
+        if _version['checked'] is None or now - _version['checked'] >= VERSION_CHECK_INTERVAL:
+            _version['version'] = _data_version(session)
+            _version['checked'] = now
+        return _version['version']
+
+
+def get_stats(stat_type, since=None, until=None, user_id=None):
+    """
+    Get the requested job statistics.
+
+    Args:
+        stat_type (str): One of the STAT_TYPES keys
+        since (datetime): Only include requests made at or after this time
+        until (datetime): Only include requests made before this time
+        user_id (int): Only include requests made by this user
+
+    Returns:
+        list: The statistics as a list of dicts
+    """
+    if stat_type not in STAT_TYPES:
+        logger.error("Stat type: %r should be one of %s", stat_type, sorted(STAT_TYPES))
+        raise KeyError(stat_type)
+    for time_limit in (since, until):
+        if time_limit is not None and not isinstance(time_limit, datetime):
+            logger.error("Time window limit: %r should be of type datetime", time_limit)
+            raise TypeError
+
+    key = (stat_type, since, until, user_id)
+    with managed_session(readonly=True) as session:
+        version = _current_version(session)
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        logger.debug("Computing %s stats for %s", stat_type, key[1:])
+        stats = STAT_TYPES[stat_type](session, since=since, until=until, user_id=user_id)
+    _cache.set(key, (version, stats))
+    return stats
@@ -1,6 +1,11 @@
 """Package utility module."""
 import os
+import time
 import shutil
+import threading
+from collections import OrderedDict
+from multiprocessing import TimeoutError as PoolTimeoutError
+from multiprocessing.pool import ThreadPool
 from tempfile import NamedTemporaryFile, mkdtemp
 
 
@@ -21,6 +26,179 @@ def igroup(sequence, nentries):
         yield sequence[i:i + nentries]
 
 
+class TimedCache(object):
+    """
+    Thread safe LRU cache with expiring entries.
+
+    Entries older than ttl seconds are treated as missing unless explicitly
+    asked for (e.g. to serve stale data when the source is unavailable).
+    Once maxsize entries are held the least recently used is dropped.
+    """
+
+    def __init__(self, ttl=60, maxsize=128):
+        """
+        Initialisation.
+
+        Args:
+            ttl (float): Time in seconds before an entry expires. None means never
+            maxsize (int): Maximum number of entries held. None means unbounded
+        """
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of entries held, including expired ones."""
+        return len(self._data)
+
+    def __contains__(self, key):
+        """Check for a non-expired entry."""
+        return self.get(key, self) is not self
+
+    def _expired(self, timestamp):
+        return self._ttl is not None and time.time() - timestamp > self._ttl
+
+    def get(self, key, default=None, allow_expired=False):
+        """
+        Get an entry.
+
+        Args:
+            key (hashable): The entry key
+            default: Returned if there is no (non-expired) entry
+            allow_expired (bool): Return the entry even if it has expired
+        """
+        with self._lock:
+            try:
+                timestamp, value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = (timestamp, value)  # mark as most recently used.
+        if not allow_expired and self._expired(timestamp):
+            return default
+        return value
+
+    def set(self, key, value):
+        """Add or refresh an entry."""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time(), value)
+            while self._maxsize is not None and len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def touch(self, key):
+        """Reset the expiry time of an existing entry."""
+        with self._lock:
+            if key in self._data:
+                self._data[key] = (time.time(), self._data.pop(key)[1])
+
+    def pop(self, key, default=None):
+        """Remove and return an entry."""
+        with self._lock:
+            return self._data.pop(key, (None, default))[1]
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+
+class ExecutorBusy(Exception):
+    """Raised when a BoundedExecutor has no free slots."""
+
+
+class ExecutorTimeout(Exception):
+    """Raised when a call run by a BoundedExecutor doesn't finish in time."""
+
+
+class BoundedExecutor(object):
+    """
+    Thread pool for running blocking calls with a bounded backlog and timeouts.
+
+    At most workers calls run at once with up to backlog more queued, beyond that calls are
+    refused straight away. This keeps callers (e.g. web server threads) from piling up behind
+    a slow resource. Calls which time out carry on running in the pool but the caller stops
+    waiting for them. The pool is started lazily, and restarted in forked children.
+    """
+
+    def __init__(self, workers=4, backlog=2):
+        """
+        Initialisation.
+
+        Args:
+            workers (int): The number of pool threads
+            backlog (int): The number of calls allowed to queue for a free thread
+        """
+        self._workers = workers
+        self._slots = threading.BoundedSemaphore(workers + backlog)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        """Get the thread pool for this process."""
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ThreadPool(self._workers)
+                self._pid = os.getpid()
+            return self._pool
+
+    def run(self, func, *args, **kwargs):
+        """
+        Run a function in the pool and wait for the result.
+
+        Args:
+            func (callable): The function to run
+            *args: Positional arguments for func
+            timeout (float): Keyword only, seconds to wait for the result. None means forever
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            The return value of func, any exception it raises is re-raised
+
+        Raises:
+            ExecutorBusy: If all of the workers and backlog slots are in use
+            ExecutorTimeout: If func didn't return within the timeout
+        """
+        timeout = kwargs.pop('timeout', None)
+        result = self.submit(func, *args, **kwargs)
+        try:
+            return result.get(timeout)
+        except PoolTimeoutError:
+            raise ExecutorTimeout("Call timed out after %ss" % timeout)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Start a function running in the pool without waiting for it.
+
+        Args:
+            func (callable): The function to run
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            AsyncResult: The pending result of func
+
+        Raises:
+            ExecutorBusy: If all of the workers and backlog slots are in use
+        """
+        if not self._slots.acquire(False):
+            raise ExecutorBusy("Too many calls in progress")
+
+        def task():
+            """Run func, freeing the slot once done."""
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._slots.release()
+
+        try:
+            return self._get_pool().apply_async(task)
+        except Exception:
+            self._slots.release()
+            raise
+
+
 # This can derive from ExitStack in Python3
 class TemporyFileManagerContext(object):
     def __init__(self):
@@ -38,8 +216,12 @@ class TemporyFileManagerContext(object):
         self._files = []
         self._dirs = []
 
-    def new_file(self):
-        file_ = NamedTemporaryFile()
+    def new_file(self, name=None):
+        """Create a temporary file, named name (in a new temporary dir) if given."""
+        if name is None:
+            file_ = NamedTemporaryFile()
+        else:
+            file_ = open(os.path.join(self.new_dir(), name), 'w+b')
         self._files.append(file_)
         return file_
 
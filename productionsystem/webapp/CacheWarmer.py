@@ -0,0 +1,93 @@
+"""Background cache warmer for the listing services."""
+import logging
+import threading
+from distutils.version import LooseVersion  # pylint: disable=import-error, no-name-in-module
+from cherrypy.process.plugins import SimplePlugin
+
+
+class CacheWarmer(SimplePlugin):
+    """
+    CherryPy engine plugin to keep the listing caches warm.
+
+    Whilst the engine is running a background thread periodically prefetches the tags and
+    directory trees of the configured Git repositories and the configured CVMFS directories,
+    so interactive requests are served from the listing caches rather than waiting on upstream.
+    """
+
+    def __init__(self, bus, tag_listing, directory_listing, cvmfs_listing, cvmfs_search=None,
+                 git_repos=(), cvmfs_paths=(), interval=240, n_tags=5):
+        """
+        Initialisation.
+
+        Args:
+            bus (cherrypy.process.wspbus.Bus): The CherryPy engine
+            tag_listing (GitTagListing): The mounted Git tag listing service
+            directory_listing (GitDirectoryListing): The mounted Git directory listing service
+            cvmfs_listing (CVMFSDirectoryListing): The mounted CVMFS listing service
+            cvmfs_search (CVMFSSearch): The mounted CVMFS search service, if its indexes
+                                        should also be kept warm
+            git_repos (iterable): (owner, repo) pairs or "owner/repo" strings to keep warm
+            cvmfs_paths (iterable): Directories relative to /cvmfs to keep warm
+            interval (float): Seconds between refreshes, should be less than the cache TTLs
+            n_tags (int): The number of most recent tags to prefetch directory trees for
+        """
+        super(CacheWarmer, self).__init__(bus)
+        self._logger = logging.getLogger(__name__)
+        self._tag_listing = tag_listing
+        self._directory_listing = directory_listing
+        self._cvmfs_listing = cvmfs_listing
+        self._cvmfs_search = cvmfs_search
+        self._git_repos = [repo.split('/', 1) if isinstance(repo, basestring) else repo
+                           for repo in git_repos]
+        self._cvmfs_paths = list(cvmfs_paths)
+        self._interval = interval
+        self._n_tags = n_tags
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the warming thread."""
+        if self._thread is not None or not (self._git_repos or self._cvmfs_paths):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="CacheWarmer")
+        self._thread.daemon = True
+        self._thread.start()
+        self.bus.log("Started cache warmer thread.")
+    start.priority = 80  # After the server has started.
+
+    def stop(self):
+        """Stop the warming thread."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout=1)
+        self._thread = None
+        self.bus.log("Stopped cache warmer thread.")
+
+    def _run(self):
+        """Warm the caches until stopped."""
+        while not self._stop_event.is_set():
+            self.warm()
+            self._stop_event.wait(self._interval)
+
+    def warm(self):
+        """Prefetch all of the configured repositories and directories."""
+        for owner, repo in self._git_repos:
+            try:
+                tags = self._tag_listing.prefetch(owner, repo)
+                refs = ['master']
+                if self._n_tags:
+                    refs.extend(sorted(tags, key=LooseVersion)[-self._n_tags:])
+                self._directory_listing.prefetch(owner, repo, refs)
+            except Exception:  # pylint: disable=broad-except
+                self._logger.warning("Failed to warm Git caches for %s/%s", owner, repo,
+                                     exc_info=True)
+
+        for path in self._cvmfs_paths:
+            try:
+                self._cvmfs_listing.prefetch(path)
+                if self._cvmfs_search is not None:
+                    self._cvmfs_search.prefetch(path)
+            except Exception:  # pylint: disable=broad-except
+                self._logger.warning("Failed to warm CVMFS cache for %s", path, exc_info=True)
@@ -1,41 +1,100 @@
 """LZ Production Web Server."""
+import os
+import time
+import errno
+import signal
+import socket
 import pkg_resources
 import cherrypy
+from cherrypy._cpwsgi_server import CPWSGIServer
+from cherrypy.process.servers import ServerAdapter
 from daemonize import Daemonize
 from productionsystem.sql.JSONTableEncoder import json_cherrypy_handler
 from productionsystem.sql.registry import SessionRegistry
-from .services import (HTMLPageServer, CVMFSDirectoryListing, GitDirectoryListing,
-                       GitTagListing, GitSchema)
+from productionsystem.utils import BoundedExecutor
+from .asset_utils import ASSETS_MOUNT, FAR_FUTURE, VENDOR_DIR, missing_vendor_assets
+from .CacheWarmer import CacheWarmer
+from .services import (HTMLPageServer, CVMFSDirectoryListing, CVMFSSearch, GitDirectoryListing,
+                       GitTagListing, GitSchema, StaticAssets)
 import services.RESTfulAPI
 
 
+class SharedSocketServer(CPWSGIServer):
+    """CherryPy WSGI server accepting connections on an existing listening socket."""
+
+    def __init__(self, server_adapter, listener):
+        """
+        Initialisation.
+
+        Args:
+            server_adapter (cherrypy._cpserver.Server): The configured CherryPy server
+            listener (socket.socket): The bound and listening socket, shared between processes
+        """
+        super(SharedSocketServer, self).__init__(server_adapter)
+        self._listener = listener
+
+    def bind(self, family, type, proto=0):  # pylint: disable=redefined-builtin
+        """Use the shared socket rather than binding a new one."""
+        self.socket = self._listener
+        return self.socket
+
+    def prepare(self):
+        """Prepare the server, making accept non-blocking as other processes may win the race."""
+        super(SharedSocketServer, self).prepare()
+        self.socket.setblocking(False)
+
+
 class WebApp(Daemonize):
     """LZ Production Web Server Daemon."""
 
     def __init__(self,
                  dburl="sqlite:///",
+                 dburl_readonly=None,
                  socket_host='0.0.0.0',
                  socket_port=8080,
                  thread_pool=8,
                  git_schema=GitSchema.GITHUB,
                  git_token='',
                  git_api_base_url="https://api.github.com/repos",
+                 warm_git_repos=(),
+                 warm_cvmfs_paths=(),
+                 warm_interval=240,
+                 upstream_workers=4,
+                 upstream_backlog=2,
+                 upstream_timeout=20,
+                 workers=1,
                  extra_jinja2_loader=None,
+                 jinja2_cache_dir=None,
+                 precompile_templates=False,
                  mock_mode=False,
                  **kwargs):
         """Initialisation."""
         super(WebApp, self).__init__(action=self.main, **kwargs)
         self._dburl = dburl
+        self._dburl_readonly = dburl_readonly
         self._socket_host = socket_host
         self._socket_port = socket_port
         self._thread_pool = thread_pool
         self._extra_jinja2_loader = extra_jinja2_loader
+        self._jinja2_cache_dir = jinja2_cache_dir
+        self._precompile_templates = precompile_templates
         self._mock_mode = mock_mode
         self._git_token = git_token
         self._git_api_base_url = git_api_base_url
         self._git_schema = git_schema
         if isinstance(git_schema, basestring):
             self._git_schema = GitSchema[git_schema]
+        self._warm_git_repos = warm_git_repos or ()
+        self._warm_cvmfs_paths = warm_cvmfs_paths or ()
+        self._warm_interval = warm_interval
+        self._services = {}
+        # Kept smaller than thread_pool so that some server threads are always free for
+        # requests which don't depend on GitHub/GitLab or CVMFS.
+        self._upstream_executor = BoundedExecutor(workers=upstream_workers,
+                                                  backlog=upstream_backlog)
+        self._upstream_timeout = upstream_timeout
+        self._workers = workers
+        self._worker_pids = set()
 
     def _global_config(self):
         static_resources = pkg_resources.resource_filename('productionsystem',
@@ -46,6 +105,7 @@ class WebApp(Daemonize):
                 'log.access_file': '',
                 'log.error_file': '',
                 'tools.gzip.on': True,
+                'tools.gzip.mime_types': ['text/*', 'application/json', 'application/javascript'],
                 'tools.json_out.handler': json_cherrypy_handler,
                 'tools.staticdir.root': static_resources,
                 'tools.staticdir.on': True,
@@ -65,28 +125,53 @@ class WebApp(Daemonize):
         return config
 
     def _mount_points(self):
-        cherrypy.tree.mount(HTMLPageServer(extra_jinja2_loader=self._extra_jinja2_loader),
+        html_page_server = HTMLPageServer(extra_jinja2_loader=self._extra_jinja2_loader)
+        html_page_server.enable_bytecode_cache(self._jinja2_cache_dir)
+        if self._precompile_templates:
+            html_page_server.precompile_templates()
+        cherrypy.tree.mount(html_page_server,
                             '/',
-                            {'/': {'request.dispatch': cherrypy.dispatch.Dispatcher()}})
+                            {'/': {'request.dispatch': cherrypy.dispatch.Dispatcher()},
+                             # The vendored paths are versioned so can be cached long term.
+                             '/' + VENDOR_DIR: {'tools.expires.secs': FAR_FUTURE}})
 
-        cherrypy.tree.mount(CVMFSDirectoryListing(),
+        upstream = {'executor': self._upstream_executor,
+                    'upstream_timeout': self._upstream_timeout}
+        cherrypy.tree.mount(StaticAssets(),
+                            ASSETS_MOUNT,
+                            {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher(),
+                                   'tools.staticdir.on': False,
+                                   'tools.expires.on': False}})
+        self._services['cvmfs_listing'] = CVMFSDirectoryListing(**upstream)
+        cherrypy.tree.mount(self._services['cvmfs_listing'],
                             '/cvmfs',
                             {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}})
-        cherrypy.tree.mount(GitDirectoryListing(api_base_url=self._git_api_base_url,
-                                                schema=self._git_schema,
-                                                access_token=self._git_token),
+        # Index builds can take minutes so run on the search's own executor.
+        self._services['cvmfs_search'] = CVMFSSearch(upstream_timeout=self._upstream_timeout)
+        cherrypy.tree.mount(self._services['cvmfs_search'],
+                            '/cvmfssearch',
+                            {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}})
+        self._services['directory_listing'] = GitDirectoryListing(
+            api_base_url=self._git_api_base_url,
+            schema=self._git_schema,
+            access_token=self._git_token,
+            **upstream)
+        cherrypy.tree.mount(self._services['directory_listing'],
                             '/git',
                             {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}})
-        cherrypy.tree.mount(GitTagListing(api_base_url=self._git_api_base_url,
-                                          schema=self._git_schema,
-                                          access_token=self._git_token),
+        self._services['tag_listing'] = GitTagListing(api_base_url=self._git_api_base_url,
+                                                      schema=self._git_schema,
+                                                      access_token=self._git_token,
+                                                      **upstream)
+        cherrypy.tree.mount(self._services['tag_listing'],
                             '/gittags',
                             {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}})
         services.RESTfulAPI.mount('/api')
 
     def main(self):
         """Daemon main."""
-        SessionRegistry.setup(self._dburl)  # pylint: disable=no-member
+        SessionRegistry.setup(self._dburl,  # pylint: disable=no-member
+                              readonly_url=self._dburl_readonly)
 
         # Setup testing entry for mock mode.
         ####################################
@@ -99,5 +184,127 @@ class WebApp(Daemonize):
 
         cherrypy.config.update(self._global_config())  # global vars need updating global config
         self._mount_points()
+        missing_assets = missing_vendor_assets()
+        if missing_assets:
+            self.logger.error("%d third party web asset(s) are not vendored and will be loaded "
+                              "from their CDN, run scripts/vendor-assets.py to vendor them: %s",
+                              len(missing_assets), ', '.join(missing_assets))
+        warmer = CacheWarmer(cherrypy.engine,
+                             git_repos=self._warm_git_repos,
+                             cvmfs_paths=self._warm_cvmfs_paths,
+                             interval=self._warm_interval,
+                             **self._services)
+        if self._workers > 1:
+            self._run_workers(warmer)
+            return
+        warmer.subscribe()
         cherrypy.engine.start()
         cherrypy.engine.block()
+
+    def _run_workers(self, warmer):
+        """
+        Run the server in multiple pre-forked worker processes.
+
+        The listening socket is bound here and shared by all of the workers, each of which runs
+        its own CherryPy engine. This process (the one in the pid file) stays to restart any
+        workers which die and to stop them all when it is stopped.
+
+        Only one worker runs the cache warmer, otherwise every worker would make the same
+        upstream Git API calls and build the same CVMFS indexes. The listing caches are per
+        process so the other workers still fill their own caches on demand.
+
+        Args:
+            warmer (CacheWarmer): The cache warmer to run in one of the workers
+        """
+        host, port = cherrypy.server.bind_addr
+        family, socktype, proto, _, addr = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
+                                                              socket.SOCK_STREAM, 0,
+                                                              socket.AI_PASSIVE)[0]
+        listener = socket.socket(family, socktype, proto)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(addr)
+        listener.listen(cherrypy.server.socket_queue_size)
+        self.logger.info("Starting %d workers on %s:%s", self._workers, host, port)
+
+        SessionRegistry.get_instance().dispose()  # pylint: disable=no-member
+        try:
+            warmer_pid = self._spawn_worker(listener, warmer)
+            for _ in xrange(self._workers - 1):
+                self._spawn_worker(listener)
+            while True:
+                try:
+                    pid, status = os.wait()
+                except OSError as err:
+                    if err.errno == errno.EINTR:
+                        continue
+                    raise
+                if pid in self._worker_pids:
+                    self._worker_pids.discard(pid)
+                    self.logger.warning("Worker %d exited with status %d, restarting.",
+                                        pid, status)
+                    time.sleep(1)  # Don't spin if workers are failing at startup.
+                    if pid == warmer_pid:
+                        warmer_pid = self._spawn_worker(listener, warmer)
+                    else:
+                        self._spawn_worker(listener)
+        finally:
+            self._stop_workers()
+
+    def _spawn_worker(self, listener, warmer=None):
+        """
+        Fork a worker process serving on the shared listening socket.
+
+        Args:
+            listener (socket.socket): The shared listening socket
+            warmer (CacheWarmer): A cache warmer to run in the worker, if any
+
+        Returns:
+            int: The worker pid
+        """
+        pid = os.fork()
+        if pid:
+            self._worker_pids.add(pid)
+            return pid
+
+        # In the worker.
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, lambda *_: cherrypy.engine.exit())
+            SessionRegistry.get_instance().dispose()  # pylint: disable=no-member
+            cherrypy.engine.autoreload.unsubscribe()  # Re-exec'ing a worker would orphan it.
+            cherrypy.server.unsubscribe()
+            ServerAdapter(cherrypy.engine, SharedSocketServer(cherrypy.server, listener))\
+                .subscribe()
+            if warmer is not None:
+                warmer.subscribe()
+            cherrypy.engine.start()
+            cherrypy.engine.block()
+        except BaseException:  # pylint: disable=broad-except
+            self.logger.exception("Worker %d failed.", os.getpid())
+            status = 1
+        finally:
+            os._exit(status)  # pylint: disable=protected-access
+
+    def _stop_workers(self, timeout=5):
+        """Terminate the worker processes, waiting up to timeout seconds for them to exit."""
+        for pid in self._worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        deadline = time.time() + timeout
+        while self._worker_pids and time.time() < deadline:
+            for pid in list(self._worker_pids):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        self._worker_pids.discard(pid)
+                except OSError:
+                    self._worker_pids.discard(pid)
+            time.sleep(0.1)
+        for pid in self._worker_pids:
+            self.logger.warning("Worker %d didn't stop, killing.", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        self._worker_pids.clear()
@@ -0,0 +1,192 @@
+"""Utilities for fingerprinted static assets."""
+import os
+import base64
+import hashlib
+import logging
+import threading
+import pkg_resources
+import requests
+
+STATIC_ROOT = pkg_resources.resource_filename('productionsystem', 'webapp/static_resources')
+ASSETS_MOUNT = '/assets'
+FAR_FUTURE = 365 * 24 * 60 * 60  # 1 year
+VENDOR_DIR = 'vendor'
+
+# Third party assets used by the templates, mapping the path they are vendored to within the
+# static resources to their CDN url and subresource integrity hash (if known). Vendored copies
+# are committed and shipped with the package, refresh them with the vendor-assets.py script.
+# Anything not vendored is loaded from the CDN. The vendored paths contain the version so never
+# change.
+VENDOR_ASSETS = {
+    'vendor/bootstrap/4.1.3/css/bootstrap.min.css':
+        ("https://stackpath.bootstrapcdn.com/bootstrap/4.1.3/css/bootstrap.min.css",
+         "sha384-MCw98/SFnGE8fJT3GXwEOngsV7Zt27NXFoaoApmYm81iuXoPkFOJwJ8ERdknLPMO"),
+    'vendor/bootstrap/4.1.3/js/bootstrap.min.js':
+        ("https://stackpath.bootstrapcdn.com/bootstrap/4.1.3/js/bootstrap.min.js",
+         "sha384-ChfqqxuZUCnJSK3+MXmPNIyE6ZbWh2IMqE241rYiqJxyMiZ6OW/JmZQ5stwEULTy"),
+    'vendor/bootstrap/4.1.1/css/bootstrap.css':
+        ("https://cdnjs.cloudflare.com/ajax/libs/twitter-bootstrap/4.1.1/css/bootstrap.css",
+         None),
+    'vendor/jquery/3.3.1/jquery.min.js':
+        ("https://code.jquery.com/jquery-3.3.1.min.js",
+         "sha256-FgpCb/KJQlLNfOu91ta32o/NMZxltwRo8QtmkMRdAu8="),
+    'vendor/popper.js/1.14.3/umd/popper.min.js':
+        ("https://cdnjs.cloudflare.com/ajax/libs/popper.js/1.14.3/umd/popper.min.js",
+         "sha384-ZMP7rVo3mIykV+2+9J3UJ46jBk0WLaUAdn689aCwoqbBJiSnjAK/l8WvCWPIPm49"),
+    'vendor/open-iconic/1.1.1/font/css/open-iconic-bootstrap.min.css':
+        ("https://cdnjs.cloudflare.com/ajax/libs/open-iconic/1.1.1/font/css/"
+         "open-iconic-bootstrap.min.css",
+         "sha256-BJ/G+e+y7bQdrYkS2RBTyNfBHpA9IuGaPmf9htub5MQ="),
+    'vendor/datatables/1.10.19/css/dataTables.bootstrap4.min.css':
+        ("https://cdn.datatables.net/1.10.19/css/dataTables.bootstrap4.min.css", None),
+    'vendor/datatables/1.10.19/js/jquery.dataTables.min.js':
+        ("https://cdn.datatables.net/1.10.19/js/jquery.dataTables.min.js", None),
+    'vendor/datatables/1.10.19/js/dataTables.bootstrap4.min.js':
+        ("https://cdn.datatables.net/1.10.19/js/dataTables.bootstrap4.min.js", None),
+    'vendor/fancybox/3.3.5/jquery.fancybox.min.css':
+        ("https://cdnjs.cloudflare.com/ajax/libs/fancybox/3.3.5/jquery.fancybox.min.css", None),
+    'vendor/fancybox/3.3.5/jquery.fancybox.min.js':
+        ("https://cdnjs.cloudflare.com/ajax/libs/fancybox/3.3.5/jquery.fancybox.min.js", None),
+    'vendor/titatoggle/2.1.2/titatoggle-dist-min.css':
+        ("https://cdnjs.cloudflare.com/ajax/libs/titatoggle/2.1.2/titatoggle-dist-min.css", None),
+}
+# Files referenced from within the vendored assets (e.g. fonts in css) rather than the templates.
+VENDOR_ASSETS.update(
+    ('vendor/open-iconic/1.1.1/font/fonts/open-iconic.%s' % ext,
+     ("https://cdnjs.cloudflare.com/ajax/libs/open-iconic/1.1.1/font/fonts/open-iconic.%s" % ext,
+      None))
+    for ext in ('eot', 'otf', 'svg', 'ttf', 'woff'))
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def asset_digest(path):
+    """
+    Get the content hash of a static asset.
+
+    Hashes are cached until the file is modified.
+
+    Args:
+        path (str): The asset path relative to the static resources
+
+    Returns:
+        str: The hash or None if the asset doesn't exist
+    """
+    filename = os.path.join(STATIC_ROOT, path)
+    try:
+        mtime = os.stat(filename).st_mtime
+    except OSError:
+        return None
+    with _digests_lock:
+        cached = _digests.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(filename, 'rb') as file_:
+        digest = hashlib.sha1(file_.read()).hexdigest()[:12]
+    with _digests_lock:
+        _digests[path] = (mtime, digest)
+    return digest
+
+
+def asset_url(path):
+    """
+    Get the url for a static asset.
+
+    Local assets are given a url containing their content hash so they can be cached forever.
+    Third party assets which haven't been vendored fall back to their CDN url.
+
+    Args:
+        path (str): The asset path relative to the static resources
+
+    Returns:
+        str: The asset url
+    """
+    digest = asset_digest(path)
+    if digest is not None:
+        return '/'.join((ASSETS_MOUNT, digest, path))
+    if path in VENDOR_ASSETS:
+        return VENDOR_ASSETS[path][0]
+    logging.getLogger(__name__).warning("Unknown static asset: %s", path)
+    return '/' + path
+
+
+def is_vendored(path):
+    """
+    Check if a static asset path is a (versioned) third party asset.
+
+    Args:
+        path (str): The asset path relative to the static resources
+
+    Returns:
+        bool: True if the asset content can never change
+    """
+    return path.startswith(VENDOR_DIR + '/') and path in VENDOR_ASSETS
+
+
+def missing_vendor_assets(static_root=STATIC_ROOT):
+    """
+    Find the third party assets which haven't been vendored.
+
+    Args:
+        static_root (str): The static resources directory
+
+    Returns:
+        list: The sorted paths of the assets which will be loaded from their CDN
+    """
+    return sorted(path for path in VENDOR_ASSETS
+                  if not os.path.isfile(os.path.join(static_root, path)))
+
+
+def check_integrity(content, integrity):
+    """
+    Check content against a subresource integrity string.
+
+    Args:
+        content (str): The downloaded content
+        integrity (str): The integrity string, e.g. "sha384-<base64 digest>"
+
+    Returns:
+        bool: True if the content matches
+    """
+    algorithm, expected = integrity.split('-', 1)
+    return base64.b64encode(hashlib.new(algorithm, content).digest()) == expected
+
+
+def vendor_assets(output_dir=STATIC_ROOT, force=False):
+    """
+    Download the third party assets into the static resources.
+
+    Args:
+        output_dir (str): The static resources directory
+        force (bool): Download assets even if they are already vendored
+
+    Returns:
+        list: The paths of the assets which could not be vendored
+    """
+    logger = logging.getLogger(__name__)
+    failed = []
+    for path, (url, integrity) in sorted(VENDOR_ASSETS.iteritems()):
+        filename = os.path.join(output_dir, path)
+        if os.path.exists(filename) and not force:
+            logger.debug("Already vendored: %s", path)
+            continue
+
+        logger.info("Downloading %s", url)
+        try:
+            response = requests.get(url, timeout=30)
+            response.raise_for_status()
+        except requests.RequestException as err:
+            logger.error("Failed to download %s: %s", url, err)
+            failed.append(path)
+            continue
+        if integrity is not None and not check_integrity(response.content, integrity):
+            logger.error("Integrity check failed for %s", url)
+            failed.append(path)
+            continue
+
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'wb') as file_:
+            file_.write(response.content)
+    return failed
@@ -3,7 +3,31 @@ import os
 import re
 from distutils.version import StrictVersion  # pylint: disable=import-error, no-name-in-module
 import cherrypy
+import xattr
+from scandir import scandir
 from productionsystem.apache_utils import check_credentials
+from productionsystem.utils import TimedCache, BoundedExecutor, ExecutorBusy, ExecutorTimeout
+
+REVISION_XATTR = "user.revision"
+UNVERSIONED_TTL = 60  # seconds
+UPSTREAM_TIMEOUT = 20  # seconds
+
+
+def repository_revision(target):
+    """
+    Get the catalogue revision of the CVMFS repository containing a path.
+
+    Args:
+        target (str): The absolute path
+
+    Returns:
+        str: The repository revision or None if it couldn't be read (e.g. not CVMFS)
+    """
+    repo_root = os.sep.join(target.split(os.sep)[:3])  # /cvmfs/<repo>
+    try:
+        return xattr.getxattr(repo_root, REVISION_XATTR)
+    except (IOError, OSError):
+        return None
 
 
 @cherrypy.expose
@@ -13,6 +37,80 @@ class CVMFSDirectoryListing(object):
     sort_type_map = {None: None,
                      'versions': StrictVersion}
 
+    listings = TimedCache(ttl=None, maxsize=4096)
+    unversioned_listings = TimedCache(ttl=UNVERSIONED_TTL, maxsize=1024)
+
+    def __init__(self, executor=None, upstream_timeout=UPSTREAM_TIMEOUT):
+        """
+        Initialisation.
+
+        Args:
+            executor (BoundedExecutor): Executor to run the (possibly slow) filesystem reads on
+            upstream_timeout (float): Seconds to wait for a filesystem read
+        """
+        self._executor = executor if executor is not None else BoundedExecutor()
+        self._upstream_timeout = upstream_timeout
+
+    @staticmethod
+    def _scan(target):
+        """Read a directory, returning the lists of (directory names, file names)."""
+        dirs = []
+        files = []
+        for entry in scandir(target):
+            (dirs if entry.is_dir() else files).append(entry.name)
+        return dirs, files
+
+    def _listing(self, target):
+        """
+        List a CVMFS directory.
+
+        Listings are cached against the repository revision so they are only re-read from
+        the filesystem when a new revision of the repository is published. Where the revision
+        can't be determined listings are cached for UNVERSIONED_TTL seconds instead.
+
+        Args:
+            target (str): The absolute directory path
+
+        Returns:
+            tuple: The lists of (directory names, file names)
+        """
+        revision = repository_revision(target)
+        if revision is None:
+            cached = self.unversioned_listings.get(target)
+        else:
+            cached = self.listings.get(target)
+            if cached is not None and cached[0] != revision:
+                cached = None
+        if cached is not None:
+            return cached[1]
+
+        try:
+            dirs, files = self._executor.run(self._scan, target, timeout=self._upstream_timeout)
+        except OSError:
+            raise cherrypy.HTTPError(404, "Couldn't access '%s'" % target)
+        except ExecutorBusy as err:
+            raise cherrypy.HTTPError(503, "CVMFS unavailable: %s" % err)
+        except ExecutorTimeout as err:
+            raise cherrypy.HTTPError(504, "CVMFS unavailable: %s" % err)
+
+        if revision is None:
+            self.unversioned_listings.set(target, (None, (dirs, files)))
+        else:
+            self.listings.set(target, (revision, (dirs, files)))
+        return dirs, files
+
+    def prefetch(self, path):
+        """
+        Pre-load a CVMFS directory and its subdirectories.
+
+        Args:
+            path (str): The directory path relative to /cvmfs
+        """
+        target = os.path.join('/cvmfs', path.lstrip('/'))
+        dirs, _ = self._listing(target)
+        for dir_ in dirs:
+            self._listing(os.path.join(target, dir_))
+
     def _cp_dispatch(self, vpath):
         cherrypy.request.params['path'] = os.path.join(*vpath)
         while vpath:
@@ -59,10 +157,7 @@ class CVMFSDirectoryListing(object):
         sort_type = CVMFSDirectoryListing.sort_type_map[sort_type]
 
         target = os.path.join('/cvmfs', path)
-        try:
-            _, dirs, files = os.walk(target).next()
-        except StopIteration:
-            raise cherrypy.HTTPError(404, "Couldn't access '%s'" % target)
+        dirs, files = self._listing(target)
 
         output = []
         if list_type in ('dirs', 'all'):
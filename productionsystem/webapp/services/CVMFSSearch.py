@@ -0,0 +1,258 @@
+"""CVMFS Recursive Search Service."""
+import os
+import re
+import time
+import fnmatch
+import logging
+import threading
+from bisect import bisect_left
+from multiprocessing import TimeoutError as PoolTimeoutError
+import cherrypy
+import scandir
+from productionsystem.apache_utils import check_credentials
+from productionsystem.utils import TimedCache, BoundedExecutor, ExecutorBusy
+from .CVMFSListing import repository_revision, UNVERSIONED_TTL, UPSTREAM_TIMEOUT
+
+MAX_INDEX_ENTRIES = 500000
+DEFAULT_LIMIT = 1000
+TOO_LARGE_TTL = 3600  # seconds
+BUILD_WORKERS = 2
+BUILD_BACKLOG = 4
+
+
+class IndexTooLarge(Exception):
+    """Raised when a subtree has too many entries to index."""
+
+
+class CVMFSTreeIndex(object):
+    """Revision stamped index of every path under a CVMFS directory."""
+
+    def __init__(self, root, max_entries=MAX_INDEX_ENTRIES):
+        """
+        Build the index by walking the directory tree.
+
+        Args:
+            root (str): The absolute path of the directory to index
+            max_entries (int): The maximum number of paths to index
+
+        Raises:
+            IndexTooLarge: If the tree has more than max_entries paths
+            OSError: If root couldn't be accessed
+        """
+        self.root = root
+        self.revision = repository_revision(root)
+        self.built = time.time()
+
+        if not os.path.isdir(root):
+            raise OSError("Not a directory: %s" % root)
+        entries = []
+        for dirpath, dirs, files in scandir.walk(root):
+            reldir = dirpath[len(root):].lstrip(os.sep)
+            entries.extend((os.path.join(reldir, dir_), True) for dir_ in dirs)
+            entries.extend((os.path.join(reldir, file_), False) for file_ in files)
+            if len(entries) > max_entries:
+                raise IndexTooLarge("More than %d paths under %s" % (max_entries, root))
+        entries.sort()
+        self._paths = [path for path, _ in entries]
+        self._is_dir = [is_dir for _, is_dir in entries]
+
+    def __len__(self):
+        """Number of indexed paths."""
+        return len(self._paths)
+
+    def is_stale(self):
+        """Check if the repository has been published to since the index was built."""
+        if self.revision is None:
+            return time.time() - self.built > UNVERSIONED_TTL
+        return repository_revision(self.root) != self.revision
+
+    def search(self, regex, subdir='', list_type='all', limit=None):
+        """
+        Search the index.
+
+        Args:
+            regex (re.RegexObject): Pattern matched against the paths relative to subdir
+            subdir (str): Only search under this subdirectory of the index root
+            list_type (str): One of 'dirs', 'files' or 'all'
+            limit (int): The maximum number of matches to return
+
+        Returns:
+            list: The matching paths, relative to subdir
+        """
+        prefix = subdir.strip(os.sep)
+        if prefix:
+            prefix += os.sep
+        output = []
+        for i in xrange(bisect_left(self._paths, prefix), len(self._paths)):
+            path = self._paths[i]
+            if not path.startswith(prefix):
+                break
+            if list_type == 'dirs' and not self._is_dir[i]:
+                continue
+            if list_type == 'files' and self._is_dir[i]:
+                continue
+            if regex.match(path[len(prefix):]) is not None:
+                output.append(path[len(prefix):])
+                if limit is not None and len(output) >= limit:
+                    break
+        return output
+
+
+@cherrypy.expose
+class CVMFSSearch(object):
+    """CVMFS recursive search service."""
+
+    indexes = TimedCache(ttl=None, maxsize=32)
+    too_large = TimedCache(ttl=TOO_LARGE_TTL, maxsize=256)
+
+    def __init__(self, upstream_timeout=UPSTREAM_TIMEOUT, executor=None):
+        """
+        Initialisation.
+
+        Args:
+            upstream_timeout (float): Seconds to wait for an index to be built. If it takes
+                                      longer the build continues and the request can be retried
+            executor (BoundedExecutor): Executor to build indexes on. Defaults to one of its
+                                        own so that slow builds don't hold up the listings
+        """
+        self._logger = logging.getLogger(__name__).getChild(self.__class__.__name__)
+        self._executor = executor if executor is not None\
+            else BoundedExecutor(workers=BUILD_WORKERS, backlog=BUILD_BACKLOG)
+        self._upstream_timeout = upstream_timeout
+        self._builds = {}  # target -> AsyncResult of its build in progress
+        self._builds_lock = threading.Lock()
+
+    def _cp_dispatch(self, vpath):
+        cherrypy.request.params['path'] = os.path.join(*vpath)
+        while vpath:
+            vpath.pop()
+        return self
+
+    def _build(self, target):
+        """Build and store the index for target, unless it already has a fresh one."""
+        try:
+            index = self.indexes.get(target)
+            if index is None or index.is_stale():
+                start = time.time()
+                try:
+                    index = CVMFSTreeIndex(target)
+                except IndexTooLarge as err:
+                    self.too_large.set(target, err)
+                    self.indexes.pop(target)
+                    raise
+                self.indexes.set(target, index)
+                self._logger.info("Indexed %d paths under %s in %.1fs",
+                                  len(index), target, time.time() - start)
+            return index
+        finally:
+            with self._builds_lock:
+                self._builds.pop(target, None)
+
+    def _start_build(self, target):
+        """
+        Start building the index for target in the background.
+
+        Only one build per target runs at a time, builds of different targets run
+        concurrently up to the executor's limits.
+
+        Args:
+            target (str): The absolute directory path
+
+        Returns:
+            AsyncResult: The pending result of the build, the one already in progress if any
+
+        Raises:
+            ExecutorBusy: If the executor has no free slots for the build
+        """
+        with self._builds_lock:
+            build = self._builds.get(target)
+            if build is None:
+                build = self._executor.submit(self._build, target)
+                self._builds[target] = build
+            return build
+
+    def _rebuild(self, target):
+        """Rebuild the index for target in the background, logging rather than raising errors."""
+        try:
+            self._start_build(target)
+        except ExecutorBusy:
+            self._logger.warning("Too many indexes building, not rebuilding %s", target)
+
+    def _index(self, target):
+        """
+        Get an index covering target.
+
+        An existing index of target or any of its parent directories is used if there is one,
+        with stale indexes served whilst being rebuilt in the background. Otherwise a new
+        index is built for target in the background, waiting up to the upstream timeout for
+        it. Targets found to be too large to index are remembered for TOO_LARGE_TTL seconds.
+
+        Args:
+            target (str): The absolute directory path
+
+        Returns:
+            tuple: The (CVMFSTreeIndex, subdir of target within the index)
+
+        Raises:
+            IndexTooLarge: If target has too many paths to index
+        """
+        root = target
+        while root.startswith('/cvmfs/'):
+            index = self.indexes.get(root)
+            if index is not None:
+                if index.is_stale():
+                    self._rebuild(root)
+                return index, target[len(root):]
+            root = os.path.dirname(root)
+
+        too_large = self.too_large.get(target)
+        if too_large is not None:
+            raise too_large
+        try:
+            return self._start_build(target).get(self._upstream_timeout), ''
+        except ExecutorBusy as err:
+            raise cherrypy.HTTPError(503, "CVMFS unavailable: %s" % err)
+        except PoolTimeoutError:
+            raise cherrypy.HTTPError(504, "Still indexing '%s', try again shortly" % target)
+
+    def prefetch(self, path):
+        """
+        Build (or rebuild if stale) the index for a CVMFS directory.
+
+        Args:
+            path (str): The directory path relative to /cvmfs
+        """
+        self._start_build(os.path.join('/cvmfs', path.strip('/'))).get()
+
+    @cherrypy.tools.accept(media='application/json')
+    @cherrypy.tools.json_in()
+    @cherrypy.tools.json_out()
+    @check_credentials
+    def POST(self, path):  # pylint: disable=invalid-name
+        """HTTP POST request handler."""
+        data = cherrypy.request.json
+        if ('regex' in data) == ('glob' in data):
+            raise cherrypy.HTTPError(400, "Expected exactly one of regex or glob keys")
+        with cherrypy.HTTPError.handle(Exception, 400, "Bad RegEx"):
+            pattern = data['regex'] if 'regex' in data else fnmatch.translate(data['glob'])
+            regex = re.compile(pattern)
+
+        list_type = data.get('type', 'all').lower()
+        if list_type not in ("dirs", "files", "all"):
+            raise cherrypy.HTTPError(400,
+                                     "Bad type: expected one of ('dirs', 'files', 'all'), got %s"
+                                     % list_type)
+
+        limit = data.get('limit', DEFAULT_LIMIT)
+        if not isinstance(limit, int) or limit < 1:
+            raise cherrypy.HTTPError(400,
+                                     "Bad type: expected limit to be a positive int, "
+                                     "got (%r, %s)" % (limit, type(limit)))
+
+        target = os.path.normpath(os.path.join('/cvmfs', path))
+        if not target.startswith('/cvmfs/'):
+            raise cherrypy.HTTPError(400, "Bad path: %s" % path)
+        with cherrypy.HTTPError.handle(IndexTooLarge, 413):
+            with cherrypy.HTTPError.handle(OSError, 404, "Couldn't access '%s'" % target):
+                index, subdir = self._index(target)
+        return index.search(regex, subdir=subdir, list_type=list_type, limit=limit)
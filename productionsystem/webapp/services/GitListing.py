@@ -1,12 +1,15 @@
 """Github/lab Directory/Tag Listing Service."""
 import os
 import re
+import posixpath
 import logging
 from distutils.version import StrictVersion  # pylint: disable=import-error, no-name-in-module
 import cherrypy
 import requests
+from requests.adapters import HTTPAdapter
 from enum import Enum
 from productionsystem.apache_utils import check_credentials
+from productionsystem.utils import TimedCache, BoundedExecutor, ExecutorBusy, ExecutorTimeout
 # gitlab base url: https://lz-git.ua.edu/api/v4
 
 
@@ -23,24 +26,372 @@ class GitSchema(Enum):
 SORT_TYPE_MAPPING = {None: None,
                      'versions': StrictVersion}
 
+CACHE_TTL = 300  # 5 mins
+BRANCH_REFRESH = 300  # 5 mins
+API_TIMEOUT = 10  # seconds
+UPSTREAM_TIMEOUT = 20  # seconds, for all API calls needed to answer one request
+PER_PAGE = 100  # max allowed by both GitHub and GitLab
+PAGE_WORKERS = 8
+SHA_REGEX = re.compile(r"^[0-9a-f]{40}$")
+PAGE_REGEX = re.compile(r"[?&]page=(\d+)")
+
+
+class GitAPIError(Exception):
+    """Unexpected status code returned from the Git API."""
+
+    def __init__(self, status_code):
+        super(GitAPIError, self).__init__("Git API returned code: %d" % status_code)
+        self.status_code = status_code
+
+
+class RepoTree(object):
+    """Directory index of a full recursive repository tree."""
+
+    def __init__(self, entries):
+        """
+        Initialisation.
+
+        Args:
+            entries (iterable): (path, is_dir) tuples for every entry in the tree
+        """
+        self._dirs = {'': ([], [])}
+        for path, is_dir in entries:
+            parent, name = posixpath.split(path)
+            self._dirs.setdefault(parent, ([], []))[0 if is_dir else 1].append(name)
+            if is_dir:
+                self._dirs.setdefault(path, ([], []))
+
+    @classmethod
+    def from_github(cls, data):
+        """Build from a GitHub recursive tree, None if the tree was truncated."""
+        if data.get('truncated', False):
+            return None
+        return cls((x['path'], x['type'] == "tree") for x in data['tree'])
+
+    @classmethod
+    def from_gitlab(cls, data):
+        """Build from a GitLab recursive tree."""
+        return cls((x['path'], x['type'] == "tree") for x in data)
+
+    def listing(self, path):
+        """
+        Get a directory listing.
+
+        Args:
+            path (str): The directory path
+
+        Returns:
+            tuple: The lists of (directory names, file names) or None if path is not a directory
+        """
+        return self._dirs.get(posixpath.normpath('/' + path).strip('/'))
+
+
+def _pooled_session(pool_maxsize=16):
+    """Create a requests session with a keep-alive connection pool."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 
 class GitListingBase(object):
-    """Base Git Listing Service."""
+    """
+    Base Git Listing Service.
+
+    All listing services share one pooled HTTP session and one response
+    cache keyed on (schema, owner, repo, path, ref). Fresh cache entries are
+    served directly, expired ones are revalidated with If-None-Match (304s
+    don't count against the GitHub rate limit) and if the upstream API is
+    slow or down then stale entries are served rather than failing. API calls are run on a
+    bounded executor so that slow upstream responses can't tie up all the server threads.
+    """
+
+    session = _pooled_session()
+    cache = TimedCache(ttl=CACHE_TTL, maxsize=1024)
+    page_executor = BoundedExecutor(workers=PAGE_WORKERS, backlog=4 * PAGE_WORKERS)
 
     def __init__(self,
                  api_base_url="https://api.github.com/repos",
                  schema=GitSchema.GITHUB,
-                 access_token=''):
+                 access_token='',
+                 timeout=API_TIMEOUT,
+                 executor=None,
+                 upstream_timeout=UPSTREAM_TIMEOUT):
         self._logger = logging.getLogger(__name__).getChild(self.__class__.__name__)
         self._api_base_url = api_base_url
         self._schema = schema
         self._token = access_token
+        self._timeout = timeout
+        self._executor = executor if executor is not None else BoundedExecutor()
+        self._upstream_timeout = upstream_timeout
+
+    def _headers(self):
+        """Return the API authorisation headers for the schema."""
+        # remove attempt at sending Auth token if not present. Will then work for example with
+        # public repos.
+        if not self._token:
+            return {}
+        if self._schema == GitSchema.GITLAB:
+            return {"Private-Token": self._token}
+        return {"Authorization": "token %s" % self._token}
+
+    def _api_call(self, url, params=None, etag=None):
+        """
+        Make a single Git API call.
+
+        Args:
+            url (str): The API url
+            params (dict): The url query parameters
+            etag (str): ETag of previously fetched data, sent as If-None-Match
+
+        Returns:
+            requests.Response: The API response, with status code 200 or 304
+        """
+        headers = self._headers()
+        if etag is not None:
+            headers["If-None-Match"] = etag
+
+        self._logger.debug("Using Git API: %s", url)
+        self._logger.debug("->with params: %s", params)
+        # self._logger.debug("->and headers: %s", headers)  # maybe dont disclose token in log.
+        result = self.session.get(url, params=params, headers=headers, timeout=self._timeout)
+        if result.status_code not in (200, 304):
+            raise GitAPIError(result.status_code)
+        return result
+
+    @staticmethod
+    def _page_count(result):
+        """
+        Get the total number of pages from a paginated API response.
+
+        Args:
+            result (requests.Response): The response for the first page
+
+        Returns:
+            int: The number of pages or None if the API didn't say
+        """
+        total = result.headers.get('X-Total-Pages')  # GitLab
+        if total:
+            return int(total)
+        last = result.links.get('last')  # GitHub
+        if last is not None:
+            match = PAGE_REGEX.search(last['url'])
+            if match is not None:
+                return int(match.group(1))
+        if 'next' not in result.links and not result.headers.get('X-Next-Page'):
+            return 1
+        return None
+
+    def _api_get_pages(self, url, params=None, stale=None):
+        """
+        Call a paginated Git API, fetching all of the pages.
+
+        The first page tells us how many pages there are (GitHub Link or GitLab
+        X-Total-Pages header) and the rest are then fetched concurrently on the shared page
+        executor. If the total isn't known (GitLab omits it for very large collections)
+        pages are fetched one at a time for as long as they come back full.
+
+        Pages from a previous call are revalidated with If-None-Match using their ETags,
+        unchanged pages being reused.
+
+        Args:
+            url (str): The API url
+            params (dict): The url query parameters
+            stale (list): The pages returned by a previous call
+
+        Returns:
+            list: The (ETag, decoded JSON response) of each page, or None if there were stale
+                  pages and none of them have changed
+        """
+        params = dict(params or {}, per_page=PER_PAGE)
+        stale = stale or []
+
+        def fetch_page(page):
+            """Fetch and decode a single page, returning it and the response."""
+            etag = stale[page - 1][0] if page <= len(stale) else None
+            result = self._api_call(url, params=dict(params, page=page), etag=etag)
+            if result.status_code == 304:
+                return stale[page - 1], result
+            with cherrypy.HTTPError.handle(ValueError, 500, "Bad Git API response"):
+                return (result.headers.get('ETag'), result.json()), result
+
+        first, result = fetch_page(1)
+        pages = [first]
+        # 304 responses don't necessarily repeat the pagination headers.
+        n_pages = self._page_count(result) if result.status_code == 200 else None
+        known_total = n_pages is not None
+        if n_pages is None:
+            n_pages = len(stale)
+
+        pending = []
+        for page in xrange(2, n_pages + 1):
+            try:
+                pending.append((page, self.page_executor.submit(fetch_page, page)))
+            except ExecutorBusy:
+                pending.append((page, None))
+        for page, async_result in pending:
+            pages.append((async_result.get() if async_result is not None
+                          else fetch_page(page))[0])
+
+        while not known_total and len(pages[-1][1]) >= PER_PAGE:
+            pages.append(fetch_page(len(pages) + 1)[0])
+            if not pages[-1][1]:
+                pages.pop()
+                break
+
+        if stale and len(pages) == len(stale)\
+                and all(page is old for page, old in zip(pages, stale)):
+            return None
+        return pages
+
+    def _cached_get(self, cache_key, fetch, cache=None, refresh=False):
+        """
+        Get Git API data through a response cache.
+
+        Args:
+            cache_key (tuple): The (owner, repo, path, ref) the data is for
+            fetch (callable): Called with the validator of any stale entry (or None), e.g. its
+                              ETag or its paginated pages, should return a (validator, data)
+                              tuple or None if the stale data is still valid
+            cache (TimedCache): Cache to use, defaults to the shared response cache
+            refresh (bool): Revalidate the entry even if it hasn't expired
+
+        Returns:
+            The (possibly stale) cached data
+        """
+        if cache is None:
+            cache = self.cache
+        cache_key = (self._schema,) + tuple(cache_key)
+        entry = cache.get(cache_key)
+        if entry is not None and not refresh:
+            return entry[1]
+
+        stale = cache.get(cache_key, allow_expired=True)
+
+        def fetch_and_store():
+            """Fetch and update the cache, even if the caller has stopped waiting."""
+            entry = fetch(None if stale is None else stale[0])
+            if entry is None:
+                cache.touch(cache_key)
+                return stale
+            cache.set(cache_key, entry)
+            return entry
+
+        try:
+            entry = self._executor.run(fetch_and_store, timeout=self._upstream_timeout)
+        except cherrypy.HTTPError:
+            raise
+        except (ExecutorBusy, ExecutorTimeout) as err:
+            if stale is None:
+                raise cherrypy.HTTPError(503 if isinstance(err, ExecutorBusy) else 504,
+                                         "Git API unavailable: %s" % err)
+            self._logger.warning("Git API unavailable (%s), serving stale data for %s",
+                                 err, cache_key)
+            return stale[1]
+        except GitAPIError as err:
+            if stale is not None and err.status_code >= 500:
+                self._logger.warning("Git API returned code: %d, serving stale data for %s",
+                                     err.status_code, cache_key)
+                return stale[1]
+            raise cherrypy.HTTPError(500, "Git API returned code: %d" % err.status_code)
+        except Exception:
+            if stale is None:
+                self._logger.exception("Git API call failed")
+                raise cherrypy.HTTPError(500, "Git API call failed")
+            self._logger.warning("Git API call failed, serving stale data for %s", cache_key)
+            return stale[1]
+        return entry[1]
+
+    def _api_get(self, url, cache_key, params=None, transform=None, cache=None,
+                 refresh=False):
+        """
+        Call the Git API, through the response cache.
+
+        Expired entries are revalidated using their ETag.
+
+        Args:
+            url (str): The API url
+            cache_key (tuple): The (owner, repo, path, ref) the call is for
+            params (dict): The url query parameters
+            transform (callable): Applied to the decoded JSON response before caching
+            cache (TimedCache): Cache to use, defaults to the shared response cache
+            refresh (bool): Revalidate the entry even if it hasn't expired
+
+        Returns:
+            The (transformed) decoded JSON response
+        """
+        def fetch(etag):
+            """Fetch and decode the url unless it's unchanged since etag."""
+            result = self._api_call(url, params=params, etag=etag)
+            if result.status_code == 304:
+                return None
+            with cherrypy.HTTPError.handle(ValueError, 500, "Bad Git API response"):
+                data = result.json()
+            if transform is not None:
+                data = transform(data)
+            return result.headers.get('ETag'), data
+        return self._cached_get(cache_key, fetch, cache, refresh)
+
+    def _project_url(self, owner, repo, *parts):
+        """Build an API url for the given repository."""
+        if self._schema == GitSchema.GITLAB:
+            return os.path.join(self._api_base_url,
+                                "projects",
+                                "{owner}%2F{repo}".format(owner=owner, repo=repo),  # %2F = /
+                                "repository",
+                                *parts)
+        return os.path.join(self._api_base_url, owner, repo, *parts)
+
+    def _tags(self, owner, repo, refresh=False):
+        """
+        Get the tags of a repository.
+
+        Args:
+            owner (str): The repository owner
+            repo (str): The repository name
+            refresh (bool): Refetch the tags even if the cached list hasn't expired
+
+        Returns:
+            list: The tag names
+        """
+        # Schema selection GitSchema.GITHUB is default.
+        # ################
+        url = self._project_url(owner, repo, "git", "refs", "tags")
+        if self._schema == GitSchema.GITLAB:
+            url = self._project_url(owner, repo, "tags")
+
+        def fetch(stale):
+            """Fetch all pages of tags, unless none of the stale pages have changed."""
+            pages = self._api_get_pages(url, stale=stale)
+            if pages is None:
+                return None
+            tags_list = [tag for _, page in pages for tag in page]
+            if self._schema == GitSchema.GITLAB:
+                return pages, [x['name'] for x in tags_list]
+            return pages, [os.path.basename(x['ref']) for x in tags_list]
+        return self._cached_get((owner, repo, None, None), fetch, refresh=refresh)
 
 
 @cherrypy.expose
 class GitTagListing(GitListingBase):
     """Github/lab Tag listing service."""
 
+    sorted_tags = TimedCache(ttl=None, maxsize=256)
+
+    def prefetch(self, owner, repo):
+        """
+        Fetch (or refresh) the cached tags of a repository.
+
+        Args:
+            owner (str): The repository owner
+            repo (str): The repository name
+
+        Returns:
+            list: The tag names
+        """
+        return self._tags(owner, repo, refresh=True)
+
     @cherrypy.tools.accept(media='application/json')
     @cherrypy.tools.json_in()
     @cherrypy.tools.json_out()
@@ -73,52 +424,121 @@ class GitTagListing(GitListingBase):
                                                  sort_type))
         sort_type = SORT_TYPE_MAPPING[sort_type]
 
+        tags = self._tags(owner, repo)
+        if not (sort or sort_reversed):
+            return tags
+
+        # Sorted lists are kept for as long as the underlying tag list is current.
+        sort_key = (self._schema, owner, repo, sort_reversed, sort_type)
+        cached = self.sorted_tags.get(sort_key)
+        if cached is not None and cached[0] is tags:
+            return cached[1]
+        output = sorted(tags, reverse=sort_reversed, key=sort_type)
+        self.sorted_tags.set(sort_key, (tags, output))
+        return output
+
+
+@cherrypy.expose
+class GitDirectoryListing(GitListingBase):
+    """Github/lab Directory listing service."""
+
+    tag_trees = TimedCache(ttl=None, maxsize=64)
+    branch_trees = TimedCache(ttl=BRANCH_REFRESH, maxsize=64)
+
+    def _tree(self, owner, repo, ref, refresh=False):
+        """
+        Get the directory index of a repository at a given ref.
+
+        The full recursive tree is fetched once per ref. Trees for tags (and commit SHAs)
+        never change so are kept until evicted, while those for branches are revalidated
+        every BRANCH_REFRESH seconds.
+
+        Args:
+            owner (str): The repository owner
+            repo (str): The repository name
+            ref (str): The tag, branch or commit SHA
+            refresh (bool): Revalidate a branch tree even if it hasn't expired
+
+        Returns:
+            RepoTree: The directory index or None if the tree is too large for a single call
+        """
+        cache = self.branch_trees
+        if SHA_REGEX.match(ref) is not None or self._is_tag(owner, repo, ref):
+            cache = self.tag_trees
+            refresh = False
+
         # Schema selection GitSchema.GITHUB is default.
         # ################
-        headers = {"Authorization": "token %s" % self._token}
-        url = os.path.join(self._api_base_url,
-                           owner,
-                           repo,
-                           "git",
-                           "refs",
-                           "tags")
         if self._schema == GitSchema.GITLAB:
-            headers = {"Private-Token": self._token}
-            url = os.path.join(self._api_base_url,
-                               "projects",
-                               "{owner}%2F{repo}".format(owner=owner, repo=repo),  # %2F = /
-                               "repository",
-                               "tags")
-        # remove attempt at sending Auth token if not present. Will then work for example with
-        # public repos.
-        if not self._token:
-            headers.clear()
+            url = self._project_url(owner, repo, "tree")
+            params = {"ref": ref, "recursive": "true"}
 
-        # Call API
-        # ########
-        self._logger.debug("Using Git API: %s", url)
-        # self._logger.debug("->and headers: %s", headers)  # maybe dont disclose token in log.
-        with cherrypy.HTTPError.handle(Exception, 500, "Git API call failed"):
-            result = requests.get(url, headers=headers)
+            def fetch(stale):
+                """Fetch all pages of the tree, unless none of the stale pages have changed."""
+                pages = self._api_get_pages(url, params, stale)
+                if pages is None:
+                    return None
+                return pages, RepoTree.from_gitlab(x for _, page in pages for x in page)
+            return self._cached_get((owner, repo, None, ref), fetch, cache, refresh)
+        return self._api_get(self._project_url(owner, repo, "git", "trees", ref),
+                             cache_key=(owner, repo, None, ref),
+                             params={"recursive": 1},
+                             transform=RepoTree.from_github,
+                             cache=cache,
+                             refresh=refresh)
 
-        status_code = result.status_code
-        if status_code != 200:
-            raise cherrypy.HTTPError(500, "Git API returned code: %d" % status_code)
+    def _is_tag(self, owner, repo, ref):
+        """
+        Check if a ref is a tag of a repository.
 
-        tags_list = result.json()
-        tags = (os.path.basename(x['ref']) for x in tags_list)
-        if self._schema == GitSchema.GITLAB:
-            tags = (x['name'] for x in tags_list)
+        If the tags can't be fetched the ref is taken not to be a tag, its tree then being
+        cached and revalidated like a branch's, so listings don't depend on the tags API.
+        """
+        try:
+            return ref in self._tags(owner, repo)
+        except cherrypy.HTTPError as err:
+            self._logger.warning("Couldn't get the tags of %s/%s (%s), treating %r as a branch",
+                                 owner, repo, err, ref)
+            return False
 
-        output = list(tags)
-        if sort or sort_reversed:
-            output.sort(reverse=sort_reversed, key=sort_type)
-        return output
+    def prefetch(self, owner, repo, refs):
+        """
+        Fetch (or refresh) the cached directory index of a repository at the given refs.
 
+        Args:
+            owner (str): The repository owner
+            repo (str): The repository name
+            refs (iterable): The tags, branches or commit SHAs
+        """
+        for ref in refs:
+            self._tree(owner, repo, ref, refresh=True)
 
-@cherrypy.expose
-class GitDirectoryListing(GitListingBase):
-    """Github/lab Directory listing service."""
+    def _directory(self, owner, repo, path, ref):
+        """
+        Get a single directory listing from the Git API.
+
+        Args:
+            owner (str): The repository owner
+            repo (str): The repository name
+            path (str): The directory path
+            ref (str): The tag, branch or commit SHA
+
+        Returns:
+            tuple: The lists of (directory names, file names)
+        """
+        # Schema selection GitSchema.GITHUB is default.
+        # ################
+        params = {"ref": ref}
+        url = self._project_url(owner, repo, "contents", path.lstrip('/'))
+        dir_type, file_type = "dir", "file"
+        if self._schema == GitSchema.GITLAB:
+            params.update(path=path)
+            url = self._project_url(owner, repo, "tree")
+            dir_type, file_type = "tree", "blob"
+
+        listing = self._api_get(url, cache_key=(owner, repo, path, ref), params=params)
+        return ([x['name'] for x in listing if x['type'] == dir_type],
+                [x['name'] for x in listing if x['type'] == file_type])
 
     def _cp_dispatch(self, vpath):
         if len(vpath) < 2:
@@ -181,49 +601,16 @@ class GitDirectoryListing(GitListingBase):
                                      "Bad type: expected tag to be of type str, "
                                      "got (%r, %s)" % (tag, type(tag)))
 
-        # Schema selection GitSchema.GITHUB is default.
-        # ################
-        params = {"ref": tag}
-        headers = {"Authorization": "token %s" % self._token}
-        url = os.path.join(self._api_base_url,
-                           owner,
-                           repo,
-                           "contents",
-                           path.lstrip('/'))
-        if self._schema == GitSchema.GITLAB:
-            params.update(path=path)
-            headers = {"Private-Token": self._token}
-            url = os.path.join(self._api_base_url,
-                               "projects",
-                               "{owner}%2F{repo}".format(owner=owner, repo=repo),  # %2F = /
-                               "repository",
-                               "tree")
-        # remove attempt at sending Auth token if not present. Will then work for example with
-        # public repos.
-        if not self._token:
-            headers.clear()
-
-        # Call API
-        # ########
-        self._logger.debug("Using Git API: %s", url)
-        self._logger.debug("->with params: %s", params)
-        # self._logger.debug("->and headers: %s", headers)  # maybe dont disclose token in log.
-        with cherrypy.HTTPError.handle(Exception, 500, "Git API call failed"):
-            result = requests.get(url,
-                                  params=params,
-                                  headers=headers)
-
-        status_code = result.status_code
-        if status_code != 200:
-            raise cherrypy.HTTPError(500, "Git API returned code: %d" % status_code)
+        tree = self._tree(owner, repo, tag)
+        if tree is not None:
+            listing = tree.listing(path)
+            if listing is None:
+                raise cherrypy.HTTPError(404, "No such directory: %s" % path)
+        else:
+            listing = self._directory(owner, repo, path, tag)
+        dirs, files = listing
 
         output = []
-        listing = result.json()
-        dirs = (x['name'] for x in listing if x['type'] == "dir")
-        files = (x['name'] for x in listing if x['type'] == "file")
-        if self._schema == GitSchema.GITLAB:
-            dirs = (x['name'] for x in listing if x['type'] == "tree")
-            files = (x['name'] for x in listing if x['type'] == "blob")
         if list_type in ('dirs', 'all'):
             for dir_ in dirs:
                 match = regex.match(dir_)
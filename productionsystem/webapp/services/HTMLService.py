@@ -1,4 +1,5 @@
 """HTML Page Server."""
+import os
 import logging
 # from collections import defaultdict
 from datetime import datetime
@@ -8,9 +9,11 @@ import hashlib
 import cherrypy
 # from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 # from productionsystem.config import getConfig
-from productionsystem.sql.enums import ServiceStatus
+from productionsystem.sql.enums import ServiceStatus, DiracStatus
 from productionsystem.apache_utils import check_credentials, admin_only
+from productionsystem.utils import expand_path
 from productionsystem.webapp.jinja2_utils import jinja2_filter
+from productionsystem.webapp.asset_utils import asset_url
 # from productionsystem.sql import managed_session
 from productionsystem.sql.models import Services, Users, Requests
 
@@ -29,16 +32,55 @@ def gravitar_hash(email_add):
     return hashlib.md5(email_add.strip().lower()).hexdigest()
 
 
+BADGE_COLOURS = {'brightgreen': '#4c1',
+                 'red': '#e05d44',
+                 'lightgrey': '#9f9f9f'}
+BADGE_TEMPLATE = jinja2.Template(
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{{ width }}" height="20">'
+    '<linearGradient id="s" x2="0" y2="100%">'
+    '<stop offset="0" stop-color="#bbb" stop-opacity=".1"/><stop offset="1" stop-opacity=".1"/>'
+    '</linearGradient>'
+    '<clipPath id="r"><rect width="{{ width }}" height="20" rx="3" fill="#fff"/></clipPath>'
+    '<g clip-path="url(#r)">'
+    '<rect width="{{ label_width }}" height="20" fill="#555"/>'
+    '<rect x="{{ label_width }}" width="{{ status_width }}" height="20" fill="{{ colour }}"/>'
+    '<rect width="{{ width }}" height="20" fill="url(#s)"/></g>'
+    '<g fill="#fff" text-anchor="middle" font-family="Verdana,Geneva,sans-serif" font-size="11">'
+    '<text x="{{ label_width / 2 }}" y="14">{{ label }}</text>'
+    '<text x="{{ label_width + status_width / 2 }}" y="14">{{ status }}</text></g></svg>',
+    autoescape=True)
+
+
 @jinja2_filter
 def service_badge_url(service, service_name):
-    """Return ShieldIO url for service badge."""
+    """Return url for the locally generated service badge."""
     name = service_name
     status = ServiceStatus.UNKNOWN
     if service is not None:
         name = service.name
         status = service.status
-    return "https://img.shields.io/badge/{name}-{status.name}-{status.value}.svg"\
-        .format(name=name, status=status)
+    return "/badge/{name}/{status.name}.svg".format(name=name, status=status)
+
+
+def badge_svg(label, status):
+    """
+    Make a shields.io style status badge.
+
+    Args:
+        label (str): The badge label (left hand side)
+        status (ServiceStatus): The status (right hand side)
+
+    Returns:
+        str: The SVG image
+    """
+    label_width = 7 * len(label) + 10  # approximate Verdana 11px text width plus padding.
+    status_width = 7 * len(status.name) + 10
+    return BADGE_TEMPLATE.render(label=label,
+                                 status=status.name,
+                                 colour=BADGE_COLOURS[status.value],
+                                 label_width=label_width,
+                                 status_width=status_width,
+                                 width=label_width + status_width)
 
 
 class HTMLPageServer(object):
@@ -53,17 +95,66 @@ class HTMLPageServer(object):
                                           extra_jinja2_loader,
                                           loader])
         self._template_env = jinja2.Environment(loader=loader)
+        self._template_env.globals['asset_url'] = asset_url
         self._logger = logging.getLogger(__name__)
 
+    def enable_bytecode_cache(self, directory=None):
+        """
+        Cache compiled templates on disk.
+
+        The cache is shared by all processes using the same directory and survives restarts,
+        so templates are only parsed and compiled once per change.
+
+        Args:
+            directory (str): The cache directory, created if needed. Defaults to a per user
+                             temporary directory
+        """
+        if directory is not None:
+            directory = expand_path(directory)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        self._template_env.bytecode_cache = jinja2.FileSystemBytecodeCache(directory)
+
+    def precompile_templates(self, extensions=('html',)):
+        """
+        Load all templates up front.
+
+        Compiles (or loads from the bytecode cache) every template from the loaders and keeps
+        them in the environment's template cache, so the first render is as fast as any other.
+
+        Args:
+            extensions (tuple): Only templates with these file extensions are loaded
+        """
+        try:
+            template_names = self._template_env.list_templates(extensions=extensions)
+        except TypeError:
+            self._logger.warning("Template loader can't list templates, not precompiling.")
+            return
+        for template_name in template_names:
+            try:
+                self._template_env.get_template(template_name)
+            except jinja2.TemplateError:
+                self._logger.exception("Failed to compile template: %s", template_name)
+        self._logger.info("Precompiled %d templates.", len(template_names))
+
     def _render(self, template_name, **kwargs):
         """Wrap the Jinja2 template getting and rendering boilerplate."""
         return self._template_env.get_template(template_name).render(**kwargs)
 
+    @cherrypy.expose
+    @cherrypy.tools.expires(secs=24 * 60 * 60, force=True)
+    def badge(self, name, status):
+        """Return a service status badge image."""
+        with cherrypy.HTTPError.handle(KeyError, 404, "Unknown status"):
+            status = ServiceStatus[status.rsplit('.svg', 1)[0]]
+        cherrypy.response.headers['Content-Type'] = 'image/svg+xml'
+        return badge_svg(name, status).encode('utf-8')
+
     @cherrypy.expose
     @check_credentials
     def index(self):
         """Return the index page."""
-        services = {service.name: service for service in Services.get_services()}
+        services = {service.name: service for service in Services.get_services(readonly=True)}
         monitoring_service = services.get("monitoringd")
         if monitoring_service is None:
             services = {}
@@ -82,7 +173,7 @@ class HTMLPageServer(object):
     @admin_only
     def admins(self):
         """Return admin management page."""
-        users = Users.get_users()
+        users = Users.get_users(readonly=True)
         return self._render('admins_template.html', users=users)
 
     @cherrypy.expose
@@ -94,7 +185,15 @@ class HTMLPageServer(object):
     @cherrypy.expose
     @check_credentials
     def info(self, id):
-        """Returns request info page."""
+        """
+        Returns request info page.
+
+        Only the request and parametric job summaries are loaded, the DIRAC jobs
+        are fetched page by page from the API as they are viewed. This is read from the
+        primary DB as it's opened straight after the request is created.
+        """
         return self._render('requestinfo_template.html',
                             request=Requests.get(id, user_id=cherrypy.request.verified_user.id,
-                                                 load_user=True, load_parametricjobs=True))
+                                                 load_user=True, load_parametricjobs=True,
+                                                 load_diracjobs=False),
+                            dirac_statuses=[status.name for status in DiracStatus])
@@ -1,13 +1,53 @@
 """RESTful API."""
 import logging
 import os
+from datetime import datetime
 from distutils.util import strtobool  # pylint: disable=import-error, no-name-in-module
 import cherrypy
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from productionsystem.apache_utils import check_credentials, admin_only
-from productionsystem.sql.models import Services, Users, Requests, ParametricJobs, DiracJobs
-from productionsystem.sql.enums import LocalStatus
+from productionsystem.sql.models import (Services, Users, Requests, ParametricJobs, DiracJobs,
+                                         SchedulerQueue)
+from productionsystem.sql.enums import LocalStatus, DiracStatus
+from productionsystem.sql.stats import STAT_TYPES, get_stats
+
+
+def split_fields(fields):
+    """
+    Split the fields query parameter.
+
+    Fields can be given either as a comma separated list (?fields=a,b)
+    or by repeating the parameter (?fields=a&fields=b).
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, basestring):
+        fields = [fields]
+    return [field.strip() for field_list in fields
+            for field in field_list.split(',') if field.strip()]
+
+
+def parse_time(time_str):
+    """Parse a date ('%Y-%m-%d') or datetime ('%Y-%m-%d %H:%M:%S') query parameter."""
+    if time_str is None:
+        return None
+    for time_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(time_str, time_format)
+        except ValueError:
+            continue
+    raise ValueError("Unrecognised time format: %r" % time_str)
+
+
+def parse_count(count_str):
+    """Parse a non-negative integer (limit/offset) query parameter."""
+    if count_str is None:
+        return None
+    count = int(count_str)
+    if count < 0:
+        raise ValueError("Expected a non-negative integer, got %d" % count)
+    return count
 
 
 @cherrypy.expose
@@ -35,7 +75,7 @@ class ServicesAPI(object):
         with cherrypy.HTTPError.handle(NoResultFound, 404, "No Service with id %s" % service_id),\
                 cherrypy.HTTPError.handle(MultipleResultsFound, 500,
                                           "Multiple services with id %s" % service_id):
-            return Services.get_services(service_id=service_id)
+            return Services.get_services(service_id=service_id, readonly=True)
 
 
 @cherrypy.expose
@@ -63,7 +103,7 @@ class UsersAPI(object):
         with cherrypy.HTTPError.handle(NoResultFound, 404, "No user with id %s" % user_id),\
                 cherrypy.HTTPError.handle(MultipleResultsFound, 500,
                                           "Multiple users with id %s" % user_id):
-            return Users.get_users(user_id=user_id)
+            return Users.get_users(user_id=user_id, readonly=True)
 
     @classmethod
     @check_credentials
@@ -103,11 +143,16 @@ class DiracJobsAPI(object):
     @cherrypy.tools.accept(media='application/json')
     @cherrypy.tools.json_out()
     @check_credentials
-    def GET(cls, request_id, parametricjob_id, diracjob_id=None):  # pylint: disable=invalid-name
+    def GET(cls, request_id, parametricjob_id, diracjob_id=None,  # pylint: disable=invalid-name
+            fields=None, status=None, limit=None, offset=None):
         """
         REST Get method.
 
         Returns all DiracJobs for a given request and parametricjob id.
+        Optionally only the given fields (columns) are returned and only jobs
+        with the given statuses (?status=Failed,Stalled). The jobs can be paged
+        through, ordered by id, using limit and offset in which case the total
+        number of matching jobs is given in the X-Total-Count header.
         """
         cls.logger.debug("In GET: reqid = %s, parametricjob_id = %s, diracjob_id = %s",
                          request_id, parametricjob_id, diracjob_id)
@@ -121,17 +166,35 @@ class DiracJobsAPI(object):
             with cherrypy.HTTPError.handle(ValueError, 400, 'Bad diracjob_id: %r' % diracjob_id):
                 diracjob_id = int(diracjob_id)
 
+        status = split_fields(status)
+        if status is not None:
+            with cherrypy.HTTPError.handle(KeyError, 400, 'Bad status: %r' % status):
+                # pylint: disable=unsubscriptable-object
+                status = [DiracStatus[status_.upper()] for status_ in status]
+        with cherrypy.HTTPError.handle(ValueError, 400, 'Bad limit: %r' % limit):
+            limit = parse_count(limit)
+        with cherrypy.HTTPError.handle(ValueError, 400, 'Bad offset: %r' % offset):
+            offset = parse_count(offset)
+
         requester = cherrypy.request.verified_user
         user_id = requester.id
         if requester.admin:
             user_id = None
 
+        fields = split_fields(fields)
         with cherrypy.HTTPError.handle(NoResultFound, 404,
                                        "No dirac job with id %s" % parametricjob_id),\
                 cherrypy.HTTPError.handle(MultipleResultsFound, 500,
-                                          "Multiple dirac jobs with id %s" % parametricjob_id):
+                                          "Multiple dirac jobs with id %s" % parametricjob_id),\
+                cherrypy.HTTPError.handle(ValueError, 400, "Bad fields: %r" % fields):
+            if diracjob_id is None and limit is not None:
+                total = DiracJobs.count(parametricjob_id=parametricjob_id, request_id=request_id,
+                                        user_id=user_id, status=status)
+                cherrypy.response.headers['X-Total-Count'] = str(total)
             return DiracJobs.get(diracjob_id=diracjob_id, parametricjob_id=parametricjob_id,
-                                 request_id=request_id, user_id=user_id)
+                                 request_id=request_id, user_id=user_id,
+                                 readonly=True, stream=True, fields=fields,
+                                 status=status, limit=limit, offset=offset)
 
 
 @cherrypy.expose
@@ -147,11 +210,12 @@ class ParametricJobsAPI(object):
     @cherrypy.tools.accept(media='application/json')
     @cherrypy.tools.json_out()
     @check_credentials
-    def GET(cls, request_id, parametricjob_id=None):  # pylint: disable=invalid-name
+    def GET(cls, request_id, parametricjob_id=None, fields=None):  # pylint: disable=invalid-name
         """
         REST Get method.
 
         Returns all ParametricJobs for a given request id.
+        Optionally only the given fields (columns) are returned.
         """
         cls.logger.debug("In GET: reqid = %s, parametricjob_id = %s", request_id, parametricjob_id)
         with cherrypy.HTTPError.handle(ValueError, 400, 'Bad request_id: %r' % request_id):
@@ -167,14 +231,17 @@ class ParametricJobsAPI(object):
         if requester.admin:
             user_id = None
 
+        fields = split_fields(fields)
         with cherrypy.HTTPError.handle(NoResultFound, 404,
                                        "No parametric job with id %d.%s"
                                        % (request_id, parametricjob_id)),\
                 cherrypy.HTTPError.handle(MultipleResultsFound, 500,
                                           "Multiple parametric jobs with id %d.%s"
-                                          % (request_id, parametricjob_id)):
+                                          % (request_id, parametricjob_id)),\
+                cherrypy.HTTPError.handle(ValueError, 400, "Bad fields: %r" % fields):
             return ParametricJobs.get(parametricjob_id=parametricjob_id,
-                                      request_id=request_id, user_id=user_id)
+                                      request_id=request_id, user_id=user_id,
+                                      readonly=True, stream=True, fields=fields)
 
     @classmethod
     @check_credentials
@@ -241,8 +308,12 @@ class RequestsAPI(object):
     @cherrypy.tools.accept(media='application/json')
     @cherrypy.tools.json_out()
     @check_credentials
-    def GET(cls, request_id=None):  # pylint: disable=invalid-name
-        """REST Get method."""
+    def GET(cls, request_id=None, fields=None):  # pylint: disable=invalid-name
+        """
+        REST Get method.
+
+        Optionally only the given fields (columns) are returned.
+        """
         cls.logger.debug("In GET: reqid = %r", request_id)
 
         if request_id is not None:
@@ -254,10 +325,13 @@ class RequestsAPI(object):
         if requester.admin:
             user_id = None
 
+        fields = split_fields(fields)
         with cherrypy.HTTPError.handle(NoResultFound, 404, "No request with id %s" % request_id),\
                 cherrypy.HTTPError.handle(MultipleResultsFound, 500,
-                                          "Multiple requests with id %s" % request_id):
-            return Requests.get(request_id=request_id, user_id=user_id, load_user=True)
+                                          "Multiple requests with id %s" % request_id),\
+                cherrypy.HTTPError.handle(ValueError, 400, "Bad fields: %r" % fields):
+            return Requests.get(request_id=request_id, user_id=user_id, load_user=True,
+                                readonly=True, stream=True, fields=fields)
 
     @classmethod
     @check_credentials
@@ -323,8 +397,81 @@ class RequestsAPI(object):
             cls.logger.info("Request %d changed to status %s", request_id, status.name)
 
 
+@cherrypy.expose
+@cherrypy.popargs('stat_type')
+class StatsAPI(object):
+    """Aggregated job statistics RESTful API."""
+
+    mount_point = 'stats'
+    logger = logging.getLogger(__name__).getChild("StatsAPI")
+
+    @classmethod
+    @cherrypy.tools.accept(media='application/json')
+    @cherrypy.tools.json_out()
+    @check_credentials
+    def GET(cls, stat_type=None, since=None, until=None):  # pylint: disable=invalid-name
+        """
+        REST Get method.
+
+        Returns the job statistics of the given type (status, users, sites or daily)
+        or all of them if no type given. These can be restricted to requests made
+        in the time window [since, until). Non-admin users only see their own requests.
+        """
+        cls.logger.debug("In GET: stat_type = %r, since = %r, until = %r",
+                         stat_type, since, until)
+
+        if stat_type is not None and stat_type not in STAT_TYPES:
+            raise cherrypy.HTTPError(404, "No stats of type %r, expected one of %s"
+                                     % (stat_type, sorted(STAT_TYPES)))
+
+        with cherrypy.HTTPError.handle(ValueError, 400, 'Bad since: %r' % since):
+            since = parse_time(since)
+        with cherrypy.HTTPError.handle(ValueError, 400, 'Bad until: %r' % until):
+            until = parse_time(until)
+
+        requester = cherrypy.request.verified_user
+        user_id = requester.id
+        if requester.admin:
+            user_id = None
+
+        with cherrypy.HTTPError.handle(SQLAlchemyError, 500, "Error getting stats"):
+            if stat_type is not None:
+                return get_stats(stat_type, since=since, until=until, user_id=user_id)
+            return {type_: get_stats(type_, since=since, until=until, user_id=user_id)
+                    for type_ in STAT_TYPES}
+
+
+@cherrypy.expose
+class SchedulerAPI(object):
+    """Submission scheduler RESTful API."""
+
+    mount_point = 'scheduler'
+    logger = logging.getLogger(__name__).getChild("SchedulerAPI")
+
+    @classmethod
+    @cherrypy.tools.accept(media='application/json')
+    @cherrypy.tools.json_out()
+    @check_credentials
+    def GET(cls):  # pylint: disable=invalid-name
+        """
+        REST Get method.
+
+        Returns the approved requests the fair-share scheduler considered in the last
+        monitoring cycle in the order it took them, with their scores, the factors making
+        them up and whether they were submitted. Non-admin users only see their own requests.
+        """
+        cls.logger.debug("In GET")
+        requester = cherrypy.request.verified_user
+        user_id = requester.id
+        if requester.admin:
+            user_id = None
+
+        with cherrypy.HTTPError.handle(SQLAlchemyError, 500, "Error getting scheduler queue"):
+            return SchedulerQueue.get(user_id=user_id, readonly=True)
+
+
 def mount(root):
     """Mount RESTful API."""
-    for api in [ServicesAPI, UsersAPI, RequestsAPI]:
+    for api in [ServicesAPI, UsersAPI, RequestsAPI, StatsAPI, SchedulerAPI]:
         cherrypy.tree.mount(api(), os.path.join(root, api.mount_point),
                             {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}})
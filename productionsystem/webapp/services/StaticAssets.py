@@ -0,0 +1,29 @@
+"""Fingerprinted Static Asset Service."""
+import os
+import cherrypy
+from cherrypy.lib.static import serve_file
+from productionsystem.webapp.asset_utils import STATIC_ROOT, FAR_FUTURE, asset_digest, is_vendored
+
+
+@cherrypy.expose
+class StaticAssets(object):
+    """Fingerprinted static asset service."""
+
+    def GET(self, digest, *path):  # pylint: disable=invalid-name
+        """
+        HTTP GET request handler.
+
+        Requests where the hash matches the current file content are cacheable forever, as are
+        the versioned third party assets (such as fonts referenced relative to a vendored
+        stylesheet). Others are still served but must be revalidated.
+        """
+        path = '/'.join(path)
+        filename = os.path.normpath(os.path.join(STATIC_ROOT, path))
+        if not filename.startswith(STATIC_ROOT + os.sep) or not os.path.isfile(filename):
+            raise cherrypy.NotFound()
+        if is_vendored(path) or digest == asset_digest(path):
+            cherrypy.response.headers['Cache-Control'] = 'public, max-age=%d, immutable' \
+                % FAR_FUTURE
+        else:
+            cherrypy.response.headers['Cache-Control'] = 'no-cache'
+        return serve_file(filename)
@@ -2,7 +2,9 @@
 # import pkg_resources
 from productionsystem.config import ConfigSystem
 from CVMFSListing import CVMFSDirectoryListing
+from CVMFSSearch import CVMFSSearch
 from GitListing import GitDirectoryListing, GitTagListing, GitSchema
+from StaticAssets import StaticAssets
 
 # pylint: disable=no-member
 HTMLPageServer = ConfigSystem.get_instance()\
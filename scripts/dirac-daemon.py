@@ -71,12 +71,16 @@ def start(args):
         dirac_job_mock = mock.MagicMock
         dirac_job_mock.setInputSandbox = mock.MagicMock(return_value=None)
         dirac_job_mock._setParamValue = mock.MagicMock(return_value=None)
+        dirac_job_mock.numberOfParameters = 0
         dirac_class_mock = mock.MagicMock
-        dirac_class_mock.kill = mock.MagicMock(return_value=None)
-        dirac_class_mock.delete = mock.MagicMock(return_value=None)
+        dirac_class_mock.kill = mock.MagicMock(side_effect=lambda ids: {'OK': True, 'Value': ids})
+        dirac_class_mock.delete = mock.MagicMock(side_effect=lambda ids: {'OK': True, 'Value': ids})
         dirac_class_mock.status = mock.MagicMock(side_effect=lambda ids: {'OK': True, 'Value': {id: {'Status': 'DONE'} for id in ids}})
         dirac_class_mock.submit = mock.MagicMock(side_effect=lambda jobs: {'OK': True, 'Value': [random.randrange(1234) for _ in xrange(1, len(jobs) +1 )]} if isinstance(jobs, list) else {'OK': True, 'Value': [random.randrange(1234)]})
         dirac_class_mock.reschedule = mock.MagicMock(side_effect=lambda ids: {'OK': True, 'Value': ids})
+        dirac_class_mock.addFile = mock.MagicMock(side_effect=lambda lfn, path, se: {'OK': True, 'Value': {'Successful': {lfn: True}, 'Failed': {}}})
+        dirac_class_mock.getReplicas = mock.MagicMock(side_effect=lambda lfn: {'OK': True, 'Value': {'Successful': {lfn: {}}, 'Failed': {}}})
+        dirac_class_mock.removeFile = mock.MagicMock(side_effect=lambda lfns: {'OK': True, 'Value': {'Successful': {lfn: True for lfn in lfns}, 'Failed': {}}})
         dirac_rpc_mock = mock.MagicMock
         dirac_rpc_mock.listDirectory = mock.MagicMock(side_effect=lambda directory_path, _: {'OK': True, 'Value':{'Failed': [], 'Successful': {directory_path: {'Files': {'FileA': {}, 'FileB': {}, 'FileC': {}}}}}})
         sys.modules['DIRAC.Interfaces.API.Job'].Job = dirac_job_mock
@@ -94,10 +98,29 @@ def start(args):
     # sys.path.append(lzprod_root)
     DiracDaemon = importlib.import_module('productionsystem.monitoring.diracrpc.DiracRPCServer')\
                            .DiracDaemon
+    SandboxCache = importlib.import_module('productionsystem.monitoring.diracrpc.SandboxCache')\
+                            .SandboxCache
+
+    # Sandbox cache setup
+    ###########################################################################
+    sandbox_cache = None
+    if args.sandbox_lfn_base is not None:
+        if args.sandbox_se is None:
+            logger.critical("A storage element (--sandbox-se) is needed for the sandbox cache")
+            sys.exit(1)
+        sandbox_cache = SandboxCache(index_path=expand_path(args.sandbox_index),
+                                     lfn_base=args.sandbox_lfn_base,
+                                     storage_element=args.sandbox_se,
+                                     max_age=args.sandbox_max_age)
 
     # Daemon setup
     ###########################################################################
     DiracDaemon(address=(args.socket_host, args.socket_port),
+                sandbox_cache=sandbox_cache,
+                mode=args.server_mode,
+                workers=args.server_workers,
+                processes=args.server_processes,
+                backlog=args.socket_backlog,
                 app=app_name,
                 pid=args.pid_file,
                 logger=logger,
@@ -122,6 +145,33 @@ if __name__ == '__main__':
                               help="The dirac environment API host [default: %(default)s]")
     start_parser.add_argument('--socket-port', default=18861, type=int,
                               help="The dirac environment API port [default: %(default)s]")
+    start_parser.add_argument('--socket-backlog', default=10, type=int,
+                              help="The number of connections waiting to be accepted "
+                                   "[default: %(default)s]")
+    start_parser.add_argument('--server-mode', default='threaded',
+                              choices=('threaded', 'pool', 'prefork'),
+                              help="Serve each connection on its own thread, on a bounded pool "
+                                   "of threads or on pools of threads in pre-forked processes "
+                                   "[default: %(default)s]")
+    start_parser.add_argument('--server-workers', default=16, type=int,
+                              help="Connections served at once per process in the pool and "
+                                   "prefork modes, more are turned away as busy "
+                                   "[default: %(default)s]")
+    start_parser.add_argument('--server-processes', default=4, type=int,
+                              help="The number of server processes in the prefork mode "
+                                   "[default: %(default)s]")
+    start_parser.add_argument('--sandbox-lfn-base', default=None,
+                              help="LFN directory to cache input sandbox files under, the "
+                                   "cache is disabled if not set [default: %(default)s]")
+    start_parser.add_argument('--sandbox-se', default=None,
+                              help="The DIRAC storage element to cache input sandbox files on "
+                                   "[default: %(default)s]")
+    start_parser.add_argument('--sandbox-index',
+                              default=os.path.join(current_dir, 'sandboxcache.db'),
+                              help="The sandbox cache's index file [default: %(default)s]")
+    start_parser.add_argument('--sandbox-max-age', default=30, type=float,
+                              help="Days after which unused sandbox cache files are removed "
+                                   "[default: %(default)s]")
     start_parser.add_argument('-p', '--pid-file',
                               default=os.path.join(current_dir, "%s.pid" % app_name),
                               help="The pid file used by the daemon [default: %(default)s]")
@@ -75,6 +75,8 @@ def start(args):
                      delay=args.frequency,
                      cert=(args.cert, args.key),
                      verify=args.verify,
+                     cleanup_interval=args.cleanup_interval,
+                     cleanup_batch_size=args.cleanup_batch_size,
                      app=args.app_name,
                      pid=args.pid_file,
                      logger=logger,
@@ -98,6 +100,12 @@ if __name__ == '__main__':
     start_parser.add_argument('-f', '--frequency', default=5, type=int,
                               help="The frequency that the daemon does it's main functionality "
                                    "(in mins) [default: %(default)s]")
+    start_parser.add_argument('--cleanup-interval', default=60, type=int,
+                              help="How often the queue of DIRAC jobs from deleted requests is "
+                                   "drained (in secs) [default: %(default)s]")
+    start_parser.add_argument('--cleanup-batch-size', default=1000, type=int,
+                              help="The number of DIRAC jobs killed/deleted per call to DIRAC "
+                                   "[default: %(default)s]")
     start_parser.add_argument('-p', '--pid-file',
                               default=os.path.join(current_dir, "%s.pid" % app_name),
                               help="The pid file used by the daemon [default: %(default)s]")
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# pylint: disable=invalid-name
+"""Script to vendor the third party web assets into the static resources."""
+import os
+import sys
+import logging
+import argparse
+
+from productionsystem.webapp.asset_utils import STATIC_ROOT, vendor_assets
+
+
+if __name__ == '__main__':
+    app_name = os.path.splitext(os.path.basename(__file__))[0]
+
+    parser = argparse.ArgumentParser(description='Download the third party CSS, JavaScript and '
+                                                 'fonts used by the web pages into the static '
+                                                 'resources so they are served locally.')
+    parser.add_argument('-o', '--output-dir', default=STATIC_ROOT,
+                        help="The static resources directory [default: %(default)s]")
+    parser.add_argument('-f', '--force', action='store_true', default=False,
+                        help="Download assets even if they are already vendored")
+    parser.add_argument('-v', '--verbose', action='count',
+                        help="Increase the logged verbosity, can be used twice")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=max(logging.WARNING - 10 * (args.verbose or 0), logging.DEBUG),
+                        format="%(name)15s : %(levelname)8s : %(message)s")
+    logging.getLogger(app_name).debug("Vendoring assets into %s", args.output_dir)
+
+    sys.exit(1 if vendor_assets(output_dir=args.output_dir, force=args.force) else 0)
@@ -38,15 +38,18 @@ def stop(args):
 
     logger.info("Sending daemon SIGTERM...")
     daemon = psutil.Process(pid)
+    processes = [daemon] + daemon.children(recursive=True)  # Include any --workers processes
     daemon.terminate()
-    try:
-        daemon.wait(timeout=1)
-    except psutil.TimeoutExpired:
+    _, alive = psutil.wait_procs(processes, timeout=6)
+    if alive:
         logger.warning("Daemon not responding, sending SIGKILL...")
-        daemon.kill()
-        try:
-            daemon.wait(timeout=0)
-        except psutil.TimeoutExpired:
+        for process in alive:
+            try:
+                process.kill()
+            except psutil.NoSuchProcess:
+                pass
+        _, alive = psutil.wait_procs(alive, timeout=1)
+        if alive:
             logger.warning("SIGKILL failed to remove the process!")
 
     logging.shutdown()
@@ -83,13 +86,23 @@ def start(args):
     # Daemon setup
     ###########################################################################
     WebApp(dburl=args.dburl,
+           dburl_readonly=args.dburl_readonly,
            socket_host=args.socket_host,
            socket_port=args.socket_port,
            thread_pool=args.thread_pool,
            git_schema=args.git_schema,
            git_token=args.git_token,
            git_api_base_url=args.git_api_base_url,
+           warm_git_repos=args.warm_git_repos,
+           warm_cvmfs_paths=args.warm_cvmfs_paths,
+           warm_interval=args.warm_interval,
+           upstream_workers=args.upstream_workers,
+           upstream_backlog=args.upstream_backlog,
+           upstream_timeout=args.upstream_timeout,
+           workers=args.workers,
            extra_jinja2_loader=extra_jinja2_loader,
+           jinja2_cache_dir=args.jinja2_cache_dir,
+           precompile_templates=args.precompile_templates,
            mock_mode=args.mock_mode,
            app=args.app_name,
            pid=args.pid_file,
@@ -123,6 +136,10 @@ if __name__ == '__main__':
                               help="URL for the requests DB. Note can use the prefix "
                                    "'mysql+pymysql://' if you have a problem with MySQLdb.py "
                                    "[default: %(default)s]")
+    start_parser.add_argument('--dburl-readonly', default=None,
+                              help="URL for a read-only replica of the requests DB. If given, "
+                                   "read-only queries from the API and web pages are sent here "
+                                   "rather than to the primary DB [default: %(default)s]")
     start_parser.add_argument('--socket-host', default='0.0.0.0',
                               help="The host address to listen on (0.0.0.0 means all available "
                               "interfaces) [default: %(default)s]")
@@ -136,6 +153,39 @@ if __name__ == '__main__':
                               help="The git API base url [default: %(default)s]")
     start_parser.add_argument('--git-token', default='',
                               help="The git API access token [default: %(default)s]")
+    start_parser.add_argument('--warm-git-repo', dest='warm_git_repos', action='append',
+                              default=[], metavar='OWNER/REPO',
+                              help="A git repository whose tags and directory trees are kept "
+                                   "warm in the listing caches, can be used multiple times. In "
+                                   "the config file use warm_git_repos = [('owner', 'repo'), ...]")
+    start_parser.add_argument('--warm-cvmfs-path', dest='warm_cvmfs_paths', action='append',
+                              default=[], metavar='PATH',
+                              help="A directory (relative to /cvmfs) kept warm in the listing "
+                                   "cache, can be used multiple times. In the config file use "
+                                   "warm_cvmfs_paths = ['path', ...]")
+    start_parser.add_argument('--warm-interval', default=240, type=float,
+                              help="Seconds between cache warming runs [default: %(default)s]")
+    start_parser.add_argument('--workers', default=1, type=int,
+                              help="The number of server processes. More than one pre-forks "
+                                   "workers sharing the listening socket, each with its own "
+                                   "--thread-pool threads [default: %(default)s]")
+    start_parser.add_argument('--upstream-workers', default=4, type=int,
+                              help="The number of threads making GitHub/GitLab and CVMFS calls. "
+                                   "Together with --upstream-backlog this should be less than "
+                                   "--thread-pool [default: %(default)s]")
+    start_parser.add_argument('--upstream-backlog', default=2, type=int,
+                              help="The number of GitHub/GitLab and CVMFS calls allowed to queue "
+                                   "for an upstream worker before being refused "
+                                   "[default: %(default)s]")
+    start_parser.add_argument('--upstream-timeout', default=20, type=float,
+                              help="Seconds to wait for GitHub/GitLab and CVMFS calls "
+                                   "[default: %(default)s]")
+    start_parser.add_argument('--jinja2-cache-dir', default=None,
+                              help="Directory for the compiled template cache, shared by all "
+                                   "processes [default: a per user temporary directory]")
+    start_parser.add_argument('--precompile-templates', action='store_true', default=False,
+                              help="Compile all of the page templates at startup "
+                                   "(before forking any --workers)")
     start_parser.add_argument('-p', '--pid-file',
                               default=os.path.join(current_dir, '%s.pid' % app_name),
                               help="The pid file used by the daemon [default: %(default)s]")
@@ -16,7 +16,9 @@ setup(
                       'rpyc',
                       'suds',
                       'psutil',
-                      'mock'
+                      'mock',
+                      'scandir',
+                      'xattr'
                       ],
     extras_require={
         'doc': ['Sphinx', 'sphinxcontrib-httpdomain'],
@@ -49,9 +51,14 @@ setup(
              'scripts/monitoring-daemon.py',
              'scripts/dirac-daemon.py',
              'scripts/userdb-update.py',
+             'scripts/vendor-assets.py',
              'scripts/service-status.sh',
              'scripts/stop-services.sh'],
-    package_data={'productionsystem': ['webapp/static_resources/*', 'webapp/templates/*']},
+    package_data={'productionsystem': ['webapp/static_resources/*',
+                                       'webapp/static_resources/vendor/*/*/*',
+                                       'webapp/static_resources/vendor/*/*/*/*',
+                                       'webapp/static_resources/vendor/*/*/*/*/*',
+                                       'webapp/templates/*']},
     # metadata for upload to PyPI
     author="Alexander Richards",
     author_email="a.richards@imperial.ac.uk",
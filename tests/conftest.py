@@ -2,11 +2,35 @@
 import pytest
 import pkg_resources
 from productionsystem.config import ConfigSystem
+from productionsystem.sql.registry import SessionRegistry
+from productionsystem.sql.SQLTableBase import SQLTableBase
 
 
-@pytest.fixture(scope="session", autouse=True)
-def config():
-    """Set up the config entrypoint map."""
+def pytest_configure():
+    """Set up the config entrypoint map before the test modules import the models."""
     config_instance = ConfigSystem.setup(None)  # pylint: disable=no-member
     config_instance.entry_point_map = pkg_resources.get_entry_map('productionsystem')
-    return config_instance
+
+
+@pytest.fixture(scope="session", autouse=True)
+def config():
+    """The config system."""
+    return ConfigSystem.get_instance()
+
+
+@pytest.fixture(scope="session")
+def database(tmpdir_factory):
+    """A throw away sqlite DB shared by the tests."""
+    url = "sqlite:///%s" % tmpdir_factory.mktemp("db").join("test.db")
+    return SessionRegistry.setup(url)  # pylint: disable=no-member
+
+
+@pytest.fixture
+def clean_database(database):  # pylint: disable=redefined-outer-name
+    """The test DB, emptied after the test."""
+    yield database
+    session = database()
+    for table in reversed(SQLTableBase.metadata.sorted_tables):
+        session.execute(table.delete())
+    session.commit()
+    database.remove()
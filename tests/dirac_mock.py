@@ -0,0 +1,58 @@
+"""Stand-ins for the DIRAC API, which isn't installed for the unit tests."""
+import sys
+import mock
+
+DIRAC_MODULES = ("DIRAC", "DIRAC.Core", "DIRAC.Core.Base", "DIRAC.Core.Base.Script",
+                 "DIRAC.Core.DISET", "DIRAC.Core.DISET.RPCClient", "DIRAC.Interfaces",
+                 "DIRAC.Interfaces.API", "DIRAC.Interfaces.API.Job",
+                 "DIRAC.Interfaces.API.Dirac")
+
+
+class Job(object):
+    """Minimal DIRAC Job recording what is set on it."""
+
+    def __init__(self, script=None, stdout='std.out', stderr='std.err'):
+        """Initialisation."""
+        self.script = script
+        self.stdout = stdout
+        self.stderr = stderr
+        self.params = {}
+        self.parameterSeqs = {}  # pylint: disable=invalid-name
+        self.numberOfParameters = 0  # pylint: disable=invalid-name
+
+    def _setParamValue(self, name, value):  # pylint: disable=invalid-name
+        """Set a JDL parameter."""
+        self.params[name] = value
+
+    def setName(self, name):  # pylint: disable=invalid-name
+        """Set the job name."""
+        self.params['JobName'] = name
+
+    def setExecutable(self, executable, arguments=''):  # pylint: disable=invalid-name
+        """Set the executable, counting the calls as it's the expensive setter in DIRAC."""
+        Job.executables_set += 1
+        self.params['Executable'] = (executable, arguments)
+
+    def setInputSandbox(self, files):  # pylint: disable=invalid-name
+        """Set the input sandbox."""
+        self.params['InputSandbox'] = files
+
+    def setParameterSequence(self, name, sequence, addToWorkflow=False):
+        """Set a parameter sequence."""
+        # pylint: disable=invalid-name, unused-argument
+        self.numberOfParameters = len(sequence)
+        self.parameterSeqs[name] = list(sequence)
+
+    executables_set = 0
+
+
+def install():
+    """Put the DIRAC stand-ins in sys.modules unless the real DIRAC is importable."""
+    try:
+        import DIRAC  # pylint: disable=unused-variable
+    except ImportError:
+        for name in DIRAC_MODULES:
+            sys.modules.setdefault(name, mock.MagicMock())
+        sys.modules["DIRAC.Interfaces.API.Job"].Job = Job
+        sys.modules["DIRAC.Interfaces.API.Dirac"].Dirac = mock.MagicMock
+        sys.modules["DIRAC.Core.DISET.RPCClient"].RPCClient = mock.MagicMock
@@ -0,0 +1,44 @@
+"""Test the Apache credential checking."""
+from unittest import TestCase
+import mock
+import pytest
+import cherrypy
+import productionsystem.sql as sql
+from productionsystem.apache_utils import check_credentials
+from productionsystem.sql.registry import managed_session
+from productionsystem.sql.models import Users
+
+HEADERS = {'Ssl-Client-S-Dn': '/C=UK/CN=Bob Smith', 'Ssl-Client-I-Dn': '/C=UK/CN=CA',
+           'Ssl-Client-Verify': 'SUCCESS'}
+
+
+@pytest.mark.usefixtures("clean_database")
+class TestCheckCredentials(TestCase):
+    """Test users are looked up on the primary DB."""
+
+    def setUp(self):
+        """Add a user and set the request's certificate headers."""
+        with managed_session() as session:
+            session.add(Users(id=1, dn='/C=UK/CN=Bob Smith', ca='/C=UK/CN=CA',
+                              email='bob@example.com', suspended=False, admin=False))
+        cherrypy.serving.request.headers = dict(HEADERS)
+
+    @staticmethod
+    def verified_user():
+        """Check the credentials, returning the verified user."""
+        check_credentials(lambda: cherrypy.request.verified_user)()
+        return cherrypy.request.verified_user
+
+    def test_primary(self):
+        """Test the lookup doesn't go to the read replica, which may lag behind."""
+        with mock.patch.object(sql, 'managed_session', wraps=sql.managed_session) as session:
+            self.assertEqual(self.verified_user().id, 1)
+        session.assert_called_once_with()
+
+    def test_suspended(self):
+        """Test a suspension takes effect straight away."""
+        with managed_session() as session:
+            session.query(Users).filter_by(id=1).update({'suspended': True})
+        with self.assertRaises(cherrypy.HTTPError) as err:
+            self.verified_user()
+        self.assertEqual(err.exception.status, 403)
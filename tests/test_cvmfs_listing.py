@@ -0,0 +1,59 @@
+"""Test the revision aware CVMFS directory listings."""
+import os
+import sys
+import shutil
+import tempfile
+from unittest import TestCase
+import mock
+import cherrypy
+from productionsystem.utils import BoundedExecutor
+from productionsystem.webapp.services import CVMFSDirectoryListing
+
+listing_module = sys.modules[CVMFSDirectoryListing.__module__]  # pylint: disable=invalid-name
+
+
+class TestCVMFSDirectoryListing(TestCase):
+    """Test the listing cache."""
+
+    def setUp(self):
+        """Make a directory, clear the caches and patch the repository revision."""
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.mkdir(os.path.join(self.root, 'v1'))
+        open(os.path.join(self.root, 'run.mac'), 'w').close()
+        CVMFSDirectoryListing.listings.clear()
+        CVMFSDirectoryListing.unversioned_listings.clear()
+        self.revision = '10'
+        patch = mock.patch.object(listing_module, 'repository_revision',
+                                  side_effect=lambda target: self.revision)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.service = CVMFSDirectoryListing(executor=BoundedExecutor(workers=1),
+                                             upstream_timeout=5)
+
+    def listing(self, path=None):
+        """List the test directory (or a path within it)."""
+        target = self.root if path is None else os.path.join(self.root, path)
+        return self.service._listing(target)  # pylint: disable=protected-access
+
+    def test_revision(self):
+        """Test listings are cached until the repository revision changes."""
+        self.assertEqual(self.listing(), (['v1'], ['run.mac']))
+        os.mkdir(os.path.join(self.root, 'v2'))
+        self.assertEqual(self.listing(), (['v1'], ['run.mac']))
+        self.revision = '11'
+        self.assertEqual(sorted(self.listing()[0]), ['v1', 'v2'])
+
+    def test_unversioned(self):
+        """Test listings without a revision are cached for a limited time."""
+        self.revision = None
+        self.assertEqual(self.listing(), (['v1'], ['run.mac']))
+        self.assertIn(self.root, CVMFSDirectoryListing.unversioned_listings)
+        self.assertNotIn(self.root, CVMFSDirectoryListing.listings)
+
+    def test_missing(self):
+        """Test missing directories are a 404 and not cached."""
+        with self.assertRaises(cherrypy.HTTPError) as err:
+            self.listing('bob')
+        self.assertEqual(err.exception.status, 404)
+        self.assertEqual(len(CVMFSDirectoryListing.listings), 0)
@@ -0,0 +1,93 @@
+"""Test the CVMFS recursive search service."""
+import os
+import re
+import sys
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+import mock
+import cherrypy
+from productionsystem.webapp.services.CVMFSSearch import (CVMFSSearch, CVMFSTreeIndex,
+                                                          IndexTooLarge)
+
+search_module = sys.modules[CVMFSSearch.__module__]  # pylint: disable=invalid-name
+
+
+class TestCVMFSTreeIndex(TestCase):
+    """Test the tree index."""
+
+    def setUp(self):
+        """Make a small directory tree."""
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'a', 'b'))
+        for path in ('a/x.mac', 'a/b/y.mac', 'z.txt'):
+            open(os.path.join(self.root, path), 'w').close()
+
+    def tearDown(self):
+        """Remove the directory tree."""
+        shutil.rmtree(self.root)
+
+    def test_search(self):
+        """Test searching the whole index and a subdirectory."""
+        index = CVMFSTreeIndex(self.root)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.search(re.compile(r'.*\.mac$')), ['a/b/y.mac', 'a/x.mac'])
+        self.assertEqual(index.search(re.compile('.*'), subdir='a', list_type='dirs'), ['b'])
+        self.assertEqual(index.search(re.compile('.*'), list_type='files', limit=1),
+                         ['a/b/y.mac'])
+
+    def test_too_large(self):
+        """Test trees with too many paths aren't indexed."""
+        with self.assertRaises(IndexTooLarge):
+            CVMFSTreeIndex(self.root, max_entries=2)
+
+
+class TestCVMFSSearch(TestCase):
+    """Test building the indexes."""
+
+    def setUp(self):
+        """Clear the class level caches."""
+        CVMFSSearch.indexes.clear()
+        CVMFSSearch.too_large.clear()
+
+    def test_too_large_cached(self):
+        """Test a too large tree is only walked once."""
+        with mock.patch.object(search_module, 'CVMFSTreeIndex',
+                               side_effect=IndexTooLarge("too large")) as tree_index:
+            service = CVMFSSearch(upstream_timeout=5)
+            for _ in xrange(2):
+                with self.assertRaises(IndexTooLarge):
+                    service._index('/cvmfs/repo/big')  # pylint: disable=protected-access
+        self.assertEqual(tree_index.call_count, 1)
+
+    def test_builds(self):
+        """Test one build runs per target and builds of different targets run together."""
+        started = {'/cvmfs/repo/a': threading.Event(), '/cvmfs/repo/b': threading.Event()}
+        release = threading.Event()
+        built = []
+
+        def build(target):
+            """Block until released."""
+            built.append(target)
+            started[target].set()
+            release.wait(5)
+            return mock.MagicMock(is_stale=mock.MagicMock(return_value=False))
+
+        with mock.patch.object(search_module, 'CVMFSTreeIndex', side_effect=build):
+            service = CVMFSSearch(upstream_timeout=0.1)
+            # pylint: disable=protected-access
+            first = service._start_build('/cvmfs/repo/a')
+            self.assertIs(service._start_build('/cvmfs/repo/a'), first)
+            service._start_build('/cvmfs/repo/b')
+            self.assertTrue(started['/cvmfs/repo/a'].wait(5))
+            self.assertTrue(started['/cvmfs/repo/b'].wait(5))
+            with self.assertRaises(cherrypy.HTTPError) as err:
+                service._index('/cvmfs/repo/a')
+            self.assertEqual(err.exception.status, 504)
+            release.set()
+            first.get(5)
+            index, subdir = service._index('/cvmfs/repo/a/sub')
+        self.assertEqual(sorted(built), ['/cvmfs/repo/a', '/cvmfs/repo/b'])
+        self.assertIs(index, first.get())
+        self.assertEqual(subdir, '/sub')
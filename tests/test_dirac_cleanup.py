@@ -0,0 +1,58 @@
+"""Test the DIRAC job cleanup queue."""
+import sys
+from unittest import TestCase
+import mock
+import pytest
+from productionsystem.sql.registry import managed_session
+from productionsystem.sql.models import DiracCleanup
+
+CLEANUP_MODULE = sys.modules[DiracCleanup.__module__]
+
+
+@pytest.mark.usefixtures("clean_database")
+class TestDiracCleanup(TestCase):
+    """Test queueing and draining DIRAC job removals."""
+
+    def setUp(self):
+        """Patch in a DIRAC client."""
+        self.dirac = mock.MagicMock()
+        self.dirac.kill.return_value = {'OK': True, 'Value': ''}
+        self.dirac.delete.return_value = {'OK': True, 'Value': ''}
+        patch = mock.patch.object(CLEANUP_MODULE, 'dirac_api_client')
+        self.addCleanup(patch.stop)
+        patch.start().return_value.__enter__.return_value = self.dirac
+
+    @staticmethod
+    def queued():
+        """The queued ids and their attempts."""
+        with managed_session() as session:
+            return dict(session.query(DiracCleanup.id, DiracCleanup.attempts))
+
+    def test_enqueue_existing(self):
+        """Test queueing already queued ids doesn't fail the flush."""
+        with managed_session() as session:
+            DiracCleanup.enqueue(session, [1, 2, 2])
+        with managed_session() as session:
+            DiracCleanup.enqueue(session, [2, 3])
+        self.assertEqual(self.queued(), {1: 0, 2: 0, 3: 0})
+
+    def test_drain(self):
+        """Test the queue is drained in batches."""
+        with managed_session() as session:
+            DiracCleanup.enqueue(session, range(5))
+        self.assertEqual(DiracCleanup.drain(batch_size=2), 5)
+        self.assertEqual(self.dirac.delete.call_count, 3)
+        self.assertEqual(self.queued(), {})
+
+    def test_retry(self):
+        """Test jobs DIRAC fails to delete are retried until max attempts."""
+        self.dirac.delete.return_value = {'OK': False, 'Message': 'denied',
+                                          'FailedJobIDs': [1], 'InvalidJobIDs': [2]}
+        with managed_session() as session:
+            DiracCleanup.enqueue(session, [1, 2])
+        self.assertEqual(DiracCleanup.drain(max_attempts=2), 1)
+        self.assertEqual(self.queued(), {1: 1})
+        self.assertEqual(DiracCleanup.drain(max_attempts=2), 0)
+        self.assertEqual(DiracCleanup.drain(max_attempts=2), 0)
+        self.assertEqual(self.queued(), {1: 2})
+        self.assertEqual(self.dirac.delete.call_count, 2)
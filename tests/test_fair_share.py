@@ -0,0 +1,77 @@
+"""Test the fair-share submission scheduler."""
+from datetime import datetime, timedelta
+from unittest import TestCase
+import mock
+from productionsystem.sql.enums import SchedulerDecision
+from productionsystem.sql.models import ParametricJobs, SchedulerQueue
+from productionsystem.monitoring.FairShareScheduler import FairShareScheduler
+
+
+def request(request_id, requester_id, priority=0, num_jobs=10, age=0):
+    """Make an approved request with one parametric job."""
+    return mock.Mock(id=request_id, requester_id=requester_id,
+                     request_date=datetime.utcnow() - timedelta(days=age),
+                     parametric_jobs=[mock.Mock(priority=priority, num_jobs=num_jobs)])
+
+
+class TestFairShareScheduler(TestCase):
+    """Test the submission order."""
+
+    def setUp(self):
+        """Patch the recent usage and the published queue."""
+        self.usage = {}
+        for patch in (mock.patch.object(ParametricJobs, 'usage_by_requester',
+                                        side_effect=lambda since: dict(self.usage)),
+                      mock.patch.object(SchedulerQueue, 'replace')):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    @staticmethod
+    def order(scheduler, requests, decision=SchedulerDecision.SUBMITTED):
+        """Take all the requests from the schedule, recording the decision for each."""
+        order = []
+        for chosen in scheduler.schedule(requests):
+            order.append(chosen.id)
+            scheduler.record(chosen, decision)
+        return order
+
+    def test_turns(self):
+        """Test users with many requests take turns with the others."""
+        scheduler = FairShareScheduler(weights={'priority': 0, 'age': 0})
+        requests = [request(1, 1), request(2, 1), request(3, 1), request(4, 2), request(5, 3)]
+        self.assertEqual(self.order(scheduler, requests), [1, 4, 5, 2, 3])
+
+    def test_held_not_counted(self):
+        """Test requests that weren't submitted don't count towards their user's usage."""
+        scheduler = FairShareScheduler(weights={'priority': 0, 'age': 0})
+        requests = [request(1, 1), request(2, 1), request(3, 2)]
+        self.assertEqual(self.order(scheduler, requests, SchedulerDecision.THROTTLED),
+                         [1, 2, 3])
+
+    def test_usage(self):
+        """Test recent heavy users go last."""
+        self.usage = {1: 1000, 2: 10}
+        scheduler = FairShareScheduler(weights={'priority': 0, 'age': 0})
+        self.assertEqual(self.order(scheduler, [request(1, 1), request(2, 2), request(3, 3)]),
+                         [3, 2, 1])
+
+    def test_priority_age(self):
+        """Test priority and age factors break the tie between users."""
+        scheduler = FairShareScheduler(weights={'fairshare': 0})
+        requests = [request(1, 1, priority=1), request(2, 2, priority=9),
+                    request(3, 3, priority=1, age=7)]
+        self.assertEqual(self.order(scheduler, requests), [2, 3, 1])
+
+    def test_publish(self):
+        """Test the decisions are published in order."""
+        scheduler = FairShareScheduler()
+        self.order(scheduler, [request(1, 1), request(2, 2)])
+        scheduler.publish()
+        entries, = SchedulerQueue.replace.call_args[0]
+        self.assertEqual([(entry.position, entry.request_id) for entry in entries],
+                         [(1, 1), (2, 2)])
+
+    def test_bad_weights(self):
+        """Test unknown weights are refused."""
+        with self.assertRaises(ValueError):
+            FairShareScheduler(weights={'bob': 1})
@@ -0,0 +1,136 @@
+"""Test the Git listing services' API calls and caches."""
+from unittest import TestCase
+import mock
+from productionsystem.utils import ExecutorBusy
+from productionsystem.webapp.services.GitListing import (GitListingBase, GitDirectoryListing,
+                                                         PER_PAGE)
+
+
+class FakeResponse(object):
+    """Stand-in for a requests.Response."""
+
+    def __init__(self, status_code, data=None, etag=None, n_pages=None, next_page=None):
+        """Initialisation."""
+        self.status_code = status_code
+        self._data = data
+        self.headers = {}
+        if etag is not None:
+            self.headers['ETag'] = etag
+        self.links = {}
+        if n_pages is not None:
+            self.links['last'] = {'url': 'https://api/tags?page=%d' % n_pages}
+        if next_page is not None:
+            self.links['next'] = {'url': 'https://api/tags?page=%d' % next_page}
+
+    def json(self):
+        """The decoded response."""
+        return self._data
+
+
+class FakeAPI(object):
+    """Paginated Git API serving a list of tags, honouring If-None-Match."""
+
+    def __init__(self, tags, send_total=True):
+        """Initialisation."""
+        self.tags = tags
+        self.send_total = send_total
+        self.calls = []
+
+    def __call__(self, url, params=None, headers=None, timeout=None):
+        """Answer a GET."""
+        # pylint: disable=unused-argument
+        page = params['page']
+        self.calls.append(page)
+        data = [{'ref': 'refs/tags/%s' % tag}
+                for tag in self.tags[(page - 1) * PER_PAGE:page * PER_PAGE]]
+        etag = '"%d-%s"' % (page, hash(str(data)))
+        if headers.get('If-None-Match') == etag:
+            return FakeResponse(304, etag=etag)
+        n_pages = max(1, -(-len(self.tags) // PER_PAGE))
+        if self.send_total:
+            return FakeResponse(200, data, etag, n_pages)
+        return FakeResponse(200, data, etag, next_page=page + 1 if page < n_pages else None)
+
+
+class GitListingTestCase(TestCase):
+    """Base test case with the Git API faked and the caches cleared."""
+
+    def setUp(self):
+        """Patch the shared session and clear the caches."""
+        self.api = FakeAPI(['v%d' % i for i in xrange(250)])
+        patcher = mock.patch.object(GitListingBase.session, 'get', side_effect=self.api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for cache in (GitListingBase.cache, GitDirectoryListing.tag_trees,
+                      GitDirectoryListing.branch_trees):
+            cache.clear()
+
+
+class TestTags(GitListingTestCase):
+    """Test fetching and revalidating tags."""
+
+    def test_all_pages(self):
+        """Test all of the pages are fetched."""
+        tags = GitListingBase()._tags('owner', 'repo')  # pylint: disable=protected-access
+        self.assertEqual(tags, self.api.tags)
+        self.assertEqual(sorted(self.api.calls), [1, 2, 3])
+
+    def test_unknown_total(self):
+        """Test pages are followed while full if the API doesn't give the total."""
+        self.api.tags = self.api.tags[:200]
+        self.api.send_total = False
+        tags = GitListingBase()._tags('owner', 'repo')  # pylint: disable=protected-access
+        self.assertEqual(tags, self.api.tags)
+        self.assertEqual(self.api.calls, [1, 2, 3])
+
+    def test_revalidate(self):
+        """Test expired tags are revalidated by ETag and new tags on later pages noticed."""
+        listing = GitListingBase()
+        # pylint: disable=protected-access
+        first = listing._tags('owner', 'repo')
+        self.assertIs(listing._tags('owner', 'repo', refresh=True), first)
+
+        self.api.tags.append('v999')
+        self.assertEqual(listing._tags('owner', 'repo', refresh=True)[-1], 'v999')
+
+
+class TestTree(GitListingTestCase):
+    """Test directory trees."""
+
+    def test_tags_unavailable(self):
+        """Test trees are still listed, as branches, when the tags can't be fetched."""
+        tree = {'tree': [{'path': 'a', 'type': 'tree'}, {'path': 'a/b.mac', 'type': 'blob'}]}
+
+        def get(url, params=None, headers=None, timeout=None):
+            """Fail the tags call."""
+            # pylint: disable=unused-argument
+            if 'tags' in url:
+                return FakeResponse(403)
+            return FakeResponse(200, tree, '"tree"')
+
+        listing = GitDirectoryListing()
+        with mock.patch.object(GitListingBase.session, 'get', side_effect=get):
+            index = listing._tree('owner', 'repo', 'v1')  # pylint: disable=protected-access
+        self.assertEqual(index.listing('a'), ([], ['b.mac']))
+        self.assertIn((listing._schema, 'owner', 'repo', None, 'v1'),  # pylint: disable=W0212
+                      GitDirectoryListing.branch_trees)
+
+
+class TestPageExecutor(GitListingTestCase):
+    """Test the pages are fetched on the shared executor."""
+
+    def test_shared(self):
+        """Test the same executor is used for every call."""
+        executor = GitListingBase.page_executor
+        with mock.patch.object(executor, 'submit', wraps=executor.submit) as submit:
+            GitListingBase()._tags('owner', 'repo')  # pylint: disable=protected-access
+            GitListingBase()._tags('owner', 'other')  # pylint: disable=protected-access
+        self.assertEqual(submit.call_count, 4)
+        self.assertIs(GitListingBase.page_executor, executor)
+
+    def test_busy(self):
+        """Test pages are fetched in the calling thread when the executor is busy."""
+        with mock.patch.object(GitListingBase.page_executor, 'submit',
+                               side_effect=ExecutorBusy("busy")):
+            tags = GitListingBase()._tags('owner', 'repo')  # pylint: disable=protected-access
+        self.assertEqual(tags, self.api.tags)
@@ -0,0 +1,86 @@
+"""Test building DIRAC jobs from job descriptions."""
+from unittest import TestCase
+from .dirac_mock import install, Job
+install()
+# pylint: disable=wrong-import-position
+from productionsystem.monitoring.diracrpc.DiracRPCClient import JobDescription
+from productionsystem.monitoring.diracrpc.DiracRPCServer import JobBuilder
+
+
+def description(name, executable='run.sh', sequence=(1, 2), **init):
+    """Make a serialised job description."""
+    job = JobDescription(**init)
+    job.setName(name)
+    job.setExecutable(executable, arguments='-x')
+    job.setInputSandbox(['/tmp/%s/run.sh' % name])
+    job.setParameterSequence('seed', list(sequence))
+    job.setPriority(3)
+    return job.dumps()
+
+
+class TestJobDescription(TestCase):
+    """Test recording job descriptions."""
+
+    def test_records(self):
+        """Test the constructor arguments and setter calls are recorded."""
+        job = JobDescription(stdout='out.log')
+        self.assertEqual(job.setName('bob'), {'OK': True, 'Value': ''})
+        self.assertEqual(job.init, [[], {'stdout': 'out.log'}])
+        self.assertEqual(job.calls, [['setName', ['bob'], {}]])
+
+    def test_unknown_attribute(self):
+        """Test only DIRAC Job setters can be used."""
+        job = JobDescription()
+        with self.assertRaises(AttributeError):
+            job.getName()  # pylint: disable=no-member
+        with self.assertRaises(AttributeError):
+            job.numberOfParameters  # pylint: disable=pointless-statement
+
+    def test_not_serialisable(self):
+        """Test non-JSON arguments are refused when the call is made."""
+        with self.assertRaises(TypeError):
+            JobDescription(stdout=object())
+        job = JobDescription()
+        with self.assertRaises(TypeError):
+            job.setInputSandbox(set(['a']))
+        self.assertEqual(job.calls, [])
+
+
+class TestJobBuilder(TestCase):
+    """Test building jobs from descriptions."""
+
+    def setUp(self):
+        """Reset the executable call count."""
+        Job.executables_set = 0
+
+    def test_build(self):
+        """Test the built job has everything described."""
+        job = JobBuilder().build(description('a', stdout='out.log'))
+        self.assertEqual(job.stdout, 'out.log')
+        self.assertEqual(job.params, {'JobName': 'a', 'Executable': ('run.sh', '-x'),
+                                      'InputSandbox': ['/tmp/a/run.sh'], 'Priority': 3})
+        self.assertEqual(job.parameterSeqs, {'seed': [1, 2]})
+        self.assertIsInstance(job.params['JobName'], str)
+
+    def test_template_reuse(self):
+        """Test jobs differing only in their per job settings reuse a template."""
+        builder = JobBuilder()
+        first = builder.build(description('a'))
+        second = builder.build(description('b', sequence=(3, 4, 5)))
+        self.assertEqual(Job.executables_set, 1)
+        self.assertIsNot(first, second)
+        self.assertEqual(first.params['InputSandbox'], ['/tmp/a/run.sh'])
+        self.assertEqual(second.params['InputSandbox'], ['/tmp/b/run.sh'])
+        self.assertEqual(second.parameterSeqs, {'seed': [3, 4, 5]})
+
+        builder.build(description('c', stdout='other.log'))
+        builder.build(description('d', executable='other.sh'))
+        self.assertEqual(Job.executables_set, 3)
+
+    def test_template_eviction(self):
+        """Test the least recently used template is dropped."""
+        builder = JobBuilder(max_templates=1)
+        builder.build(description('a'))
+        builder.build(description('b', executable='other.sh'))
+        builder.build(description('c'))
+        self.assertEqual(Job.executables_set, 3)
@@ -0,0 +1,80 @@
+"""Test the pooled DIRAC RPC server and the client's busy handling."""
+import time
+import socket
+import threading
+from unittest import TestCase
+import mock
+import rpyc
+from .dirac_mock import install
+install()
+# pylint: disable=wrong-import-position
+from productionsystem.monitoring.diracrpc import DiracRPCClient
+from productionsystem.monitoring.diracrpc.DiracRPCServer import PooledServer
+
+
+class EchoService(rpyc.Service):
+    """Minimal service."""
+
+    def exposed_echo(self, value):  # pylint: disable=no-self-use
+        """Return the value."""
+        return value
+
+
+class TestPooledServer(TestCase):
+    """Test connections beyond the pool are turned away as busy."""
+
+    def setUp(self):
+        """Start a server with one worker."""
+        self.server = PooledServer(EchoService, hostname='localhost', port=0, workers=1,
+                                   protocol_config={'allow_public_attrs': True})
+        thread = threading.Thread(target=self.server.start)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.close)
+        while not self.server.active:
+            time.sleep(0.01)
+        for patch in (mock.patch.object(DiracRPCClient, 'BUSY_BACKOFF', 0),
+                      mock.patch.object(DiracRPCClient, 'BUSY_RETRIES', 1)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def connect(self):
+        """Connect to the test server."""
+        # pylint: disable=protected-access
+        return DiracRPCClient._connect('localhost', self.server.port)
+
+    def test_serves(self):
+        """Test connections within the pool are served."""
+        conn = self.connect()
+        self.assertEqual(conn.root.echo(3), 3)
+        conn.close()
+
+    def test_busy(self):
+        """Test a full pool is reported as busy."""
+        conn = self.connect()
+        try:
+            with self.assertRaises(DiracRPCClient.DiracServerBusy):
+                self.connect()
+        finally:
+            conn.close()
+
+
+class TestBrokenServer(TestCase):
+    """Test servers closing connections without the busy marker."""
+
+    def test_closed(self):
+        """Test a connection closed without the busy marker is an error, not busy."""
+        listener = socket.socket()
+        listener.bind(('localhost', 0))
+        listener.listen(1)
+        self.addCleanup(listener.close)
+
+        def close_connection():
+            """Accept and close a connection as a crashing server would."""
+            sock, _ = listener.accept()
+            sock.close()
+        thread = threading.Thread(target=close_connection)
+        thread.daemon = True
+        thread.start()
+        with self.assertRaises(EOFError):
+            DiracRPCClient._connect(*listener.getsockname())  # pylint: disable=protected-access
@@ -0,0 +1,57 @@
+"""Test the column only projection queries."""
+from datetime import datetime
+from unittest import TestCase
+from sqlalchemy import Column, Integer, TEXT, TIMESTAMP, ForeignKey, MetaData, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from productionsystem.sql.SQLTableBase import IterableBase, DeclarativeABCMeta, ProjectionQuery
+
+# Separate metadata so these tables aren't created in the shared test DB.
+Base = declarative_base(cls=IterableBase,  # pylint: disable=invalid-name
+                        metaclass=DeclarativeABCMeta, metadata=MetaData())
+
+
+class Parent(Base):
+    """Base table."""
+
+    __tablename__ = 'parent'
+    id = Column(Integer, primary_key=True)  # pylint: disable=invalid-name
+    classtype = Column(TEXT)
+    name = Column(TEXT)
+    created = Column(TIMESTAMP)
+    __mapper_args__ = {'polymorphic_on': classtype, 'polymorphic_identity': 'parent'}
+
+
+class Child(Parent):
+    """Joined table inheritance subclass, as plugins define."""
+
+    __tablename__ = 'child'
+    id = Column(Integer, ForeignKey('parent.id'), primary_key=True)  # pylint: disable=invalid-name
+    extra = Column(TEXT)
+    __mapper_args__ = {'polymorphic_identity': 'child'}
+
+
+class TestProjectionQuery(TestCase):
+    """Test selecting columns as dicts."""
+
+    def setUp(self):
+        """Make an in memory DB with one child row."""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(engine)()
+        self.addCleanup(self.session.close)
+        self.session.add(Child(id=1, name='bob', extra='x', created=datetime(2018, 1, 2)))
+        self.session.commit()
+
+    def test_inherited_columns(self):
+        """Test columns of the parent table can be selected from the subclass."""
+        rows = list(ProjectionQuery(Child, ('id', 'name', 'created', 'extra'), self.session))
+        self.assertEqual(rows, [{'id': 1, 'name': 'bob', 'extra': 'x',
+                                 'created': '2018-01-02 00:00:00'}])
+
+    def test_unknown_field(self):
+        """Test unknown fields are refused."""
+        with self.assertRaises(ValueError):
+            ProjectionQuery(Child, ('id', 'bob'), self.session)
+        with self.assertRaises(ValueError):
+            ProjectionQuery(Parent, ('extra',), self.session)
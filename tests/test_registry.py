@@ -0,0 +1,22 @@
+"""Test the DB session registry setup."""
+from unittest import TestCase
+from sqlalchemy import create_engine, inspect
+from productionsystem.sql.registry import create_missing_indexes
+from productionsystem.sql.SQLTableBase import SQLTableBase
+from productionsystem.sql.models import DiracJobs
+
+INDEX = 'ix_diracjobs_parametricjob_status'
+
+
+class TestCreateMissingIndexes(TestCase):
+    """Test indexes added to existing tables are created."""
+
+    def test_existing_db(self):
+        """Test the DIRAC jobs index is added to a DB made before it existed."""
+        engine = create_engine('sqlite://')
+        SQLTableBase.metadata.create_all(bind=engine)
+        engine.execute('DROP INDEX %s' % INDEX)
+        self.assertEqual(create_missing_indexes(engine), [INDEX])
+        self.assertIn(INDEX, [index['name'] for index in
+                              inspect(engine).get_indexes(DiracJobs.__tablename__)])
+        self.assertEqual(create_missing_indexes(engine), [])
@@ -0,0 +1,99 @@
+"""Test the cross-request reschedule engine."""
+import sys
+from unittest import TestCase
+import mock
+from productionsystem.sql.enums import DiracStatus
+from productionsystem.monitoring.RescheduleEngine import RescheduleEngine
+
+engine_module = sys.modules[RescheduleEngine.__module__]  # pylint: disable=invalid-name
+
+
+def dirac_job(job_id, status=DiracStatus.FAILED, reschedules=0):
+    """Make a DIRAC job."""
+    return mock.Mock(id=job_id, status=status, reschedules=reschedules)
+
+
+def request(*dirac_jobs, **kwargs):
+    """Make a request with one parametric job holding the given DIRAC jobs."""
+    parametricjob = mock.Mock(dirac_jobs=list(dirac_jobs),
+                              reschedule=kwargs.get('reschedule', False))
+    return mock.Mock(classtype=kwargs.get('classtype', 'requests'),
+                     parametric_jobs=[parametricjob])
+
+
+class TestRescheduleEngine(TestCase):
+    """Test the reschedule policies and site holds."""
+
+    def setUp(self):
+        """Patch in a DIRAC client and a controllable clock."""
+        self.now = 1000.
+        self.sites = {}
+        self.dirac = mock.MagicMock()
+        self.dirac.reschedule.side_effect = lambda ids: {'OK': True, 'Value': list(ids)}
+        self.dirac.status.side_effect = lambda ids: {
+            'OK': True, 'Value': {i: {'Site': self.sites.get(i, 'Unknown')} for i in ids}}
+        client = mock.patch.object(engine_module, 'dirac_api_client')
+        client.start().return_value.__enter__.return_value = self.dirac
+        clock = mock.patch.object(engine_module.time, 'time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(mock.patch.stopall)
+
+    def rescheduled(self):
+        """The batches of job ids DIRAC was asked to reschedule."""
+        return [call[0][0] for call in self.dirac.reschedule.call_args_list]
+
+    def test_policy(self):
+        """Test only jobs of parametric jobs with DONE jobs are rescheduled, up to the max."""
+        engine = RescheduleEngine(policies={'default': {'max_reschedules': 1}})
+        done = dirac_job(1, DiracStatus.DONE)
+        failed = dirac_job(2)
+        stalled = dirac_job(3, DiracStatus.STALLED, reschedules=1)
+        no_done = dirac_job(4)
+        self.assertEqual(engine.run([request(done, failed, stalled), request(no_done)]), {2})
+        self.assertEqual(failed.status, DiracStatus.RECEIVED)
+        self.assertEqual(failed.reschedules, 1)
+        self.assertEqual(stalled.status, DiracStatus.STALLED)
+
+    def test_manual(self):
+        """Test jobs users asked to reschedule are always rescheduled, in batches."""
+        engine = RescheduleEngine(policies={'default': {'max_reschedules': 0}}, batch_size=2)
+        jobs = [dirac_job(i, reschedules=5) for i in xrange(3)]
+        self.assertEqual(engine.run([request(*jobs, reschedule=True)]), {0, 1, 2})
+        self.assertEqual(self.rescheduled(), [[0, 1], [2]])
+
+    def test_class_policy_backoff(self):
+        """Test class specific policies override the default and back off."""
+        engine = RescheduleEngine(policies={'default': {'require_done': False},
+                                            'slow': {'backoff': 60}})
+        self.assertEqual(engine.policy('slow').backoff, 60)
+        self.assertFalse(engine.policy('slow').require_done)
+        job = dirac_job(1, reschedules=1)
+        self.assertEqual(engine.run([request(job, classtype='slow')]), set())
+        self.now += 119
+        self.assertEqual(engine.run([request(job, classtype='slow')]), set())
+        self.now += 1
+        self.assertEqual(engine.run([request(job, classtype='slow')]), {1})
+
+    def test_site_hold(self):
+        """Test the jobs of a failing site are held off for the site backoff."""
+        engine = RescheduleEngine(policies={'default': {'require_done': False,
+                                                        'site_failure_threshold': 2,
+                                                        'site_backoff': 600}})
+        self.sites = {1: 'LCG.Bad.uk', 2: 'LCG.Bad.uk', 3: 'LCG.Good.uk'}
+        jobs = [dirac_job(i) for i in (1, 2, 3)]
+        self.assertEqual(engine.run([request(*jobs)]), {3})
+        jobs = [dirac_job(i) for i in (1, 2)]
+        self.now += 599
+        self.assertEqual(engine.run([request(*jobs)]), set())
+        self.now += 1
+        self.assertEqual(engine.run([request(*jobs)]), {1, 2})
+
+    def test_dirac_error(self):
+        """Test jobs DIRAC fails to reschedule are left as they are."""
+        self.dirac.reschedule.side_effect = None
+        self.dirac.reschedule.return_value = {'OK': False, 'Message': 'bad'}
+        engine = RescheduleEngine(policies={'default': {'require_done': False}})
+        job = dirac_job(1)
+        self.assertEqual(engine.run([request(job)]), set())
+        self.assertEqual(job.status, DiracStatus.FAILED)
+        self.assertEqual(job.reschedules, 0)
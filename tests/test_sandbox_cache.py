@@ -0,0 +1,62 @@
+"""Test the content addressed input sandbox cache."""
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+import mock
+from .dirac_mock import install
+install()
+# pylint: disable=wrong-import-position
+from productionsystem.monitoring.diracrpc import SandboxCache as sandbox_module
+from productionsystem.monitoring.diracrpc.SandboxCache import SandboxCache, file_digest
+
+
+class TestSandboxCache(TestCase):
+    """Test uploading, reusing and evicting sandbox files."""
+
+    def setUp(self):
+        """Make a sandbox file, an index and a fake DIRAC."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.runscript = os.path.join(self.tmpdir, 'run.sh')
+        with open(self.runscript, 'w') as file_:
+            file_.write('echo hello\n')
+        self.now = 1000000.
+        self.dirac = mock.MagicMock()
+        self.dirac.addFile.return_value = {'OK': True, 'Value': {'Successful': {}, 'Failed': {}}}
+        self.dirac.removeFile.return_value = {'OK': True, 'Value': {'Failed': {}}}
+        for patch in (mock.patch.object(sandbox_module, 'Dirac', return_value=self.dirac),
+                      mock.patch.object(sandbox_module.time, 'time',
+                                        side_effect=lambda: self.now)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.cache = SandboxCache(os.path.join(self.tmpdir, 'index.db'), '/lz/sandboxes/',
+                                  'UKI-LT2-IC-HEP-disk', max_age=1, evict_interval=10 ** 9)
+
+    def test_reuse(self):
+        """Test a file is uploaded once then referenced by its LFN."""
+        lfn = 'LFN:/lz/sandboxes/%s/%s/run.sh' % (file_digest(self.runscript)[:2],
+                                                  file_digest(self.runscript))
+        self.assertEqual(self.cache.resolve([self.runscript, 'LFN:/lz/data.root']),
+                         [lfn, 'LFN:/lz/data.root'])
+        self.assertEqual(self.cache.resolve([self.runscript]), [lfn])
+        self.assertEqual(self.dirac.addFile.call_count, 1)
+
+    def test_upload_failure(self):
+        """Test files failing to upload stay in the job's own sandbox."""
+        self.dirac.addFile.return_value = {'OK': False, 'Message': 'no space'}
+        self.dirac.getReplicas.return_value = {'OK': True, 'Value': {'Successful': {}}}
+        self.assertEqual(self.cache.resolve([self.runscript]), [self.runscript])
+        self.dirac.addFile.return_value = {'OK': True, 'Value': {'Failed': {}}}
+        self.assertTrue(self.cache.resolve([self.runscript])[0].startswith('LFN:'))
+
+    def test_evict(self):
+        """Test files unused for max_age are removed from storage and re-uploaded if needed."""
+        self.cache.resolve([self.runscript])
+        self.now += 12 * 3600
+        self.assertEqual(self.cache.evict(), 0)
+        self.now += 13 * 3600
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual(self.dirac.removeFile.call_count, 1)
+        self.cache.resolve([self.runscript])
+        self.assertEqual(self.dirac.addFile.call_count, 2)
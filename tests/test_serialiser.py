@@ -0,0 +1,56 @@
+"""Test the precompiled table serialisers."""
+import json
+from datetime import datetime
+from unittest import TestCase
+import pytest
+from productionsystem.sql.enums import LocalStatus
+from productionsystem.sql.JSONTableEncoder import JSONTableEncoder
+from productionsystem.sql.registry import managed_session
+from productionsystem.sql.models import Users, Requests
+
+
+@pytest.mark.usefixtures("clean_database")
+class TestTableSerialiser(TestCase):
+    """Test converting table instances to JSON encodable dicts."""
+
+    def setUp(self):
+        """Add a user with one request."""
+        with managed_session() as session:
+            session.add(Users(id=1, dn='/C=UK/CN=Bob Smith', ca='ca', email='bob@example.com',
+                              suspended=False, admin=True))
+            request = Requests(id=1, requester_id=1, description='test')
+            request.request_date = datetime(2018, 1, 2, 3, 4, 5)
+            session.add(request)
+
+    def test_compiled_once(self):
+        """Test each class has its own serialiser, built once."""
+        self.assertIs(Users.serialiser(), Users.serialiser())
+        self.assertIsNot(Users.serialiser(), Requests.serialiser())
+
+    def test_serialise(self):
+        """Test columns, enums, datetimes and properties are converted."""
+        request = Requests.get(request_id=1, load_user=True)
+        output = request.jsonable_dict()
+        self.assertEqual(output['status'], LocalStatus.REQUESTED.name.capitalize())
+        self.assertEqual(output['request_date'], '2018-01-02 03:04:05')
+        self.assertEqual(output['description'], 'test')
+        self.assertEqual(output['requester'].name, 'Bob Smith')
+        self.assertEqual(json.loads(json.dumps(request, cls=JSONTableEncoder))['requester']['name'],
+                         'Bob Smith')
+        self.assertEqual(set(request), set(output))
+
+    def test_detached_unloaded(self):
+        """Test relationships not loaded before detaching are skipped rather than lazy loaded."""
+        output = Requests.get(request_id=1).jsonable_dict()
+        self.assertNotIn('requester', output)
+        self.assertNotIn('parametric_jobs', output)
+        self.assertEqual(output['requester_id'], 1)
+
+    def test_subset(self):
+        """Test serialising rows of selected fields and refusing unknown ones."""
+        serialiser = Requests.serialiser().subset(('id', 'status'))
+        self.assertEqual(serialiser.names, ('id', 'status'))
+        self.assertEqual(serialiser.serialise_row((1, LocalStatus.APPROVED)),
+                         {'id': 1, 'status': 'Approved'})
+        with self.assertRaises(KeyError):
+            Requests.serialiser().subset(('bob',))
@@ -0,0 +1,100 @@
+"""Test vendoring and serving the static assets."""
+import os
+import base64
+import shutil
+import hashlib
+import tempfile
+from unittest import TestCase
+import mock
+import requests
+import cherrypy
+from productionsystem.webapp import asset_utils
+from productionsystem.webapp.services import StaticAssets
+
+JQUERY = 'vendor/jquery/3.3.1/jquery.min.js'
+FONT = 'vendor/open-iconic/1.1.1/font/fonts/open-iconic.woff'
+ASSETS = {JQUERY: ("https://cdn/jquery.min.js",
+                   'sha256-' + base64.b64encode(hashlib.sha256('jquery').digest())),
+          FONT: ("https://cdn/open-iconic.woff", None)}
+
+
+def fake_get(contents):
+    """Make a requests.get returning the given content per url (or raising if missing)."""
+    def get(url, timeout=None):  # pylint: disable=unused-argument
+        """Fake GET."""
+        if url not in contents:
+            raise requests.ConnectionError("offline")
+        response = requests.Response()
+        response.status_code = 200
+        response._content = contents[url]  # pylint: disable=protected-access
+        return response
+    return get
+
+
+class TestVendorAssets(TestCase):
+    """Test vendoring the third party assets."""
+
+    def setUp(self):
+        """Patch in a small asset list and a temporary static resources dir."""
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        for patch in (mock.patch.dict(asset_utils.VENDOR_ASSETS, ASSETS, clear=True),
+                      mock.patch.object(asset_utils, 'STATIC_ROOT', self.static_root)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_vendor(self):
+        """Test the assets are downloaded and then served locally."""
+        get = fake_get({"https://cdn/jquery.min.js": 'jquery',
+                        "https://cdn/open-iconic.woff": 'font'})
+        with mock.patch.object(requests, 'get', side_effect=get):
+            self.assertEqual(asset_utils.vendor_assets(self.static_root), [])
+        with open(os.path.join(self.static_root, JQUERY)) as file_:
+            self.assertEqual(file_.read(), 'jquery')
+        self.assertTrue(asset_utils.asset_url(JQUERY).startswith(asset_utils.ASSETS_MOUNT))
+
+    def test_failures(self):
+        """Test integrity and download failures are reported and fall back to the CDN."""
+        get = fake_get({"https://cdn/jquery.min.js": 'tampered'})
+        with mock.patch.object(requests, 'get', side_effect=get):
+            self.assertEqual(sorted(asset_utils.vendor_assets(self.static_root)),
+                             sorted([JQUERY, FONT]))
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, JQUERY)))
+        self.assertEqual(asset_utils.asset_url(JQUERY), "https://cdn/jquery.min.js")
+
+    def test_serve_vendored(self):
+        """Test vendored assets are cacheable forever whatever the url hash."""
+        os.makedirs(os.path.join(self.static_root, os.path.dirname(FONT)))
+        with open(os.path.join(self.static_root, FONT), 'w') as file_:
+            file_.write('font')
+        with open(os.path.join(self.static_root, 'utils.js'), 'w') as file_:
+            file_.write('js')
+        module = __import__(StaticAssets.__module__, fromlist=['STATIC_ROOT'])
+        with mock.patch.object(module, 'STATIC_ROOT', self.static_root),\
+                mock.patch.object(module, 'serve_file'):
+            cherrypy.serving.response.headers.clear()
+            StaticAssets().GET('stale', *FONT.split('/'))
+            self.assertIn('immutable', cherrypy.serving.response.headers['Cache-Control'])
+            StaticAssets().GET('stale', 'utils.js')
+            self.assertEqual(cherrypy.serving.response.headers['Cache-Control'], 'no-cache')
+
+    def test_missing(self):
+        """Test the assets which aren't vendored are reported."""
+        self.assertEqual(asset_utils.missing_vendor_assets(self.static_root), [JQUERY, FONT])
+        os.makedirs(os.path.join(self.static_root, os.path.dirname(JQUERY)))
+        with open(os.path.join(self.static_root, JQUERY), 'w') as file_:
+            file_.write('jquery')
+        self.assertEqual(asset_utils.missing_vendor_assets(self.static_root), [FONT])
+
+
+class TestShippedAssets(TestCase):
+    """Test the vendored assets shipped with the package."""
+
+    def test_integrity(self):
+        """Test the vendored copies match their subresource integrity hashes."""
+        missing = asset_utils.missing_vendor_assets()
+        for path, (_, integrity) in asset_utils.VENDOR_ASSETS.iteritems():
+            if path in missing or integrity is None:
+                continue
+            with open(os.path.join(asset_utils.STATIC_ROOT, path), 'rb') as file_:
+                self.assertTrue(asset_utils.check_integrity(file_.read(), integrity), path)
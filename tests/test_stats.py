@@ -0,0 +1,67 @@
+"""Test the aggregated job statistics."""
+from unittest import TestCase
+import mock
+import pytest
+from productionsystem.sql.enums import DiracStatus
+from productionsystem.sql import stats
+from productionsystem.sql.registry import managed_session
+from productionsystem.sql.models import Users, Requests, ParametricJobs, DiracJobs
+
+
+@pytest.mark.usefixtures("clean_database")
+class TestStats(TestCase):
+    """Test the stats and their cache."""
+
+    def setUp(self):
+        """Add a request with one parametric job and two DIRAC jobs."""
+        stats._cache.clear()  # pylint: disable=protected-access
+        stats._version.update(checked=None, version=None)  # pylint: disable=protected-access
+        with managed_session() as session:
+            session.add(Users(id=1, dn='/C=UK/CN=Bob Smith', ca='ca', email='bob@example.com',
+                              suspended=False, admin=False))
+            session.add(Requests(id=1, requester_id=1))
+            session.add(ParametricJobs(request_id=1, id=1, requester_id=1))
+            session.add(DiracJobs(id=10, requester_id=1, request_id=1, parametricjob_id=1,
+                                  status=DiracStatus.WAITING))
+            session.add(DiracJobs(id=11, requester_id=1, request_id=1, parametricjob_id=1,
+                                  status=DiracStatus.WAITING))
+
+    @staticmethod
+    def set_status(dirac_id, status):
+        """Change a DIRAC job status as the monitoring daemon would."""
+        with managed_session() as session:
+            session.query(DiracJobs).filter_by(id=dirac_id).update({'status': status})
+
+    def test_users(self):
+        """Test the per requester counters."""
+        user, = stats.get_stats('users')
+        self.assertEqual(user['requester_id'], 1)
+        self.assertEqual(user['num_failed'], 0)
+        self.assertEqual(user['num_parametricjobs'], 1)
+
+    def test_dirac_status_invalidates(self):
+        """Test DIRAC job status changes alone invalidate the cache."""
+        self.assertEqual(stats.get_stats('status'), [{'status': 'Waiting', 'count': 2}])
+        self.set_status(10, DiracStatus.RUNNING)
+        with mock.patch.object(stats, 'VERSION_CHECK_INTERVAL', 0):
+            self.assertEqual(sorted(stats.get_stats('status')),
+                             sorted([{'status': 'Waiting', 'count': 1},
+                                     {'status': 'Running', 'count': 1}]))
+
+    def test_version_check_interval(self):
+        """Test the data version is only queried once per interval."""
+        with mock.patch.object(stats, '_data_version', wraps=stats._data_version) as version:
+            stats.get_stats('status')
+            stats.get_stats('status')
+            stats.get_stats('sites')
+            self.assertEqual(version.call_count, 1)
+            with mock.patch.object(stats, 'VERSION_CHECK_INTERVAL', 0):
+                stats.get_stats('status')
+            self.assertEqual(version.call_count, 2)
+
+    def test_bad_args(self):
+        """Test unknown stat types and bad time windows are refused."""
+        with self.assertRaises(KeyError):
+            stats.get_stats('bob')
+        with self.assertRaises(TypeError):
+            stats.get_stats('users', since='yesterday')
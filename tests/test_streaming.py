@@ -0,0 +1,74 @@
+"""Test streaming large collections from the DB and encoding them as JSON."""
+import json
+from types import GeneratorType
+from unittest import TestCase
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Query
+from productionsystem.sql.JSONTableEncoder import iter_json_array
+from productionsystem.sql.registry import managed_session, stream_query
+from productionsystem.sql.models import Users, Requests
+
+
+class TestIterJSONArray(TestCase):
+    """Test incremental JSON array encoding."""
+
+    def test_chunks(self):
+        """Test the chunks join to the same JSON as encoding in one go."""
+        items = [{'id': i, 'name': 'job %d' % i} for i in xrange(100)]
+        chunks = list(iter_json_array(iter(items), buffer_size=64))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(''.join(chunks)), items)
+
+    def test_empty(self):
+        """Test an empty iterable gives an empty array."""
+        self.assertEqual(''.join(iter_json_array(iter(()))), '[]')
+
+
+@pytest.mark.usefixtures("clean_database")
+class TestStreamedGetters(TestCase):
+    """Test the streamed table getters."""
+
+    def setUp(self):
+        """Add a user with some requests."""
+        with managed_session() as session:
+            session.add(Users(id=1, dn='/C=UK/CN=Bob Smith', ca='ca', email='bob@example.com',
+                              suspended=False, admin=False))
+            for request_id in xrange(1, 6):
+                session.add(Requests(id=request_id, requester_id=1))
+
+    def test_stream(self):
+        """Test requests are streamed as detached instances."""
+        requests = Requests.get(stream=True)
+        self.assertIsInstance(requests, GeneratorType)
+        requests = list(requests)
+        self.assertEqual(sorted(request.id for request in requests), range(1, 6))
+        self.assertNotIn('requester', requests[0].jsonable_dict())
+
+    def test_stream_ids_fields(self):
+        """Test streaming selected requests as dicts of selected fields."""
+        requests = Requests.get(request_id=[2, 4], stream=True, fields=('id', 'status'))
+        self.assertEqual(sorted(requests), [{'id': 2, 'status': 'Requested'},
+                                            {'id': 4, 'status': 'Requested'}])
+
+    def test_empty(self):
+        """Test streaming a query with no results."""
+        requests = Requests.get(request_id=[100], stream=True)
+        self.assertIsInstance(requests, GeneratorType)
+        self.assertEqual(list(requests), [])
+
+    def test_error(self):
+        """Test DB errors are raised when the stream is created rather than when iterated."""
+        with self.assertRaises(OperationalError):
+            stream_query(Query(Requests).filter(text('no_such_column = 1')))
+
+    def test_encode(self):
+        """Test a streamed collection encodes as a JSON array."""
+        output = json.loads(''.join(iter_json_array(Requests.get(stream=True))))
+        self.assertEqual(sorted(request['id'] for request in output), range(1, 6))
+
+    def test_eager_loading(self):
+        """Test streaming can't be combined with eager loading the parametric jobs."""
+        with self.assertRaises(ValueError):
+            Requests.get(stream=True, load_parametricjobs=True)
@@ -0,0 +1,85 @@
+"""Test resuming interrupted submissions from the submission journal."""
+import sys
+from contextlib import contextmanager
+from unittest import TestCase
+import mock
+import pytest
+from productionsystem.sql.enums import LocalStatus
+from productionsystem.sql.registry import managed_session
+from productionsystem.sql.models import ParametricJobs, DiracJobs, SubmissionJournal
+
+PARAMETRICJOBS_MODULE = sys.modules[ParametricJobs.__module__]
+
+
+class Interrupted(BaseException):
+    """Stands in for the daemon being killed part way through a submission."""
+
+
+class FakeDirac(object):
+    """Fake DIRAC submitting 3 chunks of 2 jobs, optionally interrupted after some chunks."""
+
+    def __init__(self, interrupt_after=None):
+        """Initialisation."""
+        self.interrupt_after = interrupt_after
+        self.submitted = []
+
+    # pylint: disable=invalid-name
+    def submitChunks(self, job, chunk_size, workers, skip, callback):
+        """Submit the chunks not skipped."""
+        # pylint: disable=unused-argument
+        results = []
+        for chunk in xrange(3):
+            if chunk in skip:
+                results.append(None)
+                continue
+            if chunk == self.interrupt_after:
+                raise Interrupted()
+            self.submitted.append(chunk)
+            result = {'OK': True, 'Value': [100 + 2 * chunk, 101 + 2 * chunk]}
+            callback(chunk, result)
+            results.append(result)
+        return results
+
+
+@pytest.mark.usefixtures("clean_database")
+class TestSubmissionJournal(TestCase):
+    """Test journaling and resuming submissions."""
+
+    def submit(self, dirac):
+        """Submit a parametric job to the given fake DIRAC."""
+        @contextmanager
+        def job_builder():
+            """Fake DIRAC API client and job builder."""
+            yield dirac, lambda description: description
+        job = ParametricJobs(request_id=1, id=1, requester_id=1)
+        with mock.patch.object(PARAMETRICJOBS_MODULE, 'dirac_api_job_builder', job_builder):
+            job.submit()
+        return job
+
+    def test_record(self):
+        """Test recording a chunk is idempotent and keeps the original chunk size."""
+        journal = SubmissionJournal.start(1, 1, chunk_size=2)
+        journal.record(0, 0, [100, 101], requester_id=1)
+        journal.record(0, 0, [100, 101], requester_id=1)
+        self.assertEqual(journal.submitted_chunks, {(0, 0)})
+        journal = SubmissionJournal.start(1, 1, chunk_size=10)
+        self.assertEqual(journal.chunk_size, 2)
+        self.assertEqual(journal.submitted_chunks, {(0, 0)})
+        self.assertEqual(SubmissionJournal.request_ids([1, 2]), {1})
+        with managed_session() as session:
+            self.assertEqual(session.query(DiracJobs).count(), 2)
+
+    def test_resume(self):
+        """Test an interrupted submission only submits the remaining chunks when resumed."""
+        with self.assertRaises(Interrupted):
+            self.submit(FakeDirac(interrupt_after=2))
+        dirac = FakeDirac()
+        job = self.submit(dirac)
+        self.assertEqual(dirac.submitted, [2])
+        self.assertEqual(job.num_jobs, 6)
+        self.assertEqual(sorted(dirac_job.id for dirac_job in job.dirac_jobs), range(100, 106))
+        self.assertNotEqual(job.status, LocalStatus.FAILED)
+
+        dirac = FakeDirac()
+        self.assertEqual(self.submit(dirac).num_jobs, 6)
+        self.assertEqual(dirac.submitted, [])
@@ -0,0 +1,60 @@
+"""Test the queue depth aware submission throttle."""
+from unittest import TestCase
+import mock
+from productionsystem.monitoring.SubmissionThrottle import SubmissionThrottle, ALL_SITES
+from productionsystem.sql.models import ParametricJobs
+
+
+def request(request_id, *sites_jobs):
+    """Make a request with a parametric job of num_jobs per (site, num_jobs) pair."""
+    return mock.Mock(id=request_id, parametric_jobs=[mock.Mock(site=site, num_jobs=num_jobs)
+                                                     for site, num_jobs in sites_jobs])
+
+
+class TestSubmissionThrottle(TestCase):
+    """Test the watermarks."""
+
+    def setUp(self):
+        """Patch the DB queue depths."""
+        self.depths = {}
+        patch = mock.patch.object(ParametricJobs, 'queue_depths',
+                                  side_effect=lambda: dict(self.depths))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_total(self):
+        """Test submission stops at the high watermark and resumes below the low one."""
+        throttle = SubmissionThrottle(high_watermark=100, low_watermark=50, site_watermarks={})
+        throttle.refresh()
+        self.assertTrue(throttle.admit(request(1, ('ANY', 10))))
+        throttle.submitted(request(1, ('ANY', 100)))
+        self.assertEqual(throttle.throttled, {ALL_SITES})
+        self.assertFalse(throttle.admit(request(2, ('ANY', 1))))
+
+        self.depths = {'ANY': 60}
+        throttle.refresh()
+        self.assertFalse(throttle.admit(request(2, ('ANY', 1))))
+        self.depths = {'ANY': 49}
+        throttle.refresh()
+        self.assertTrue(throttle.admit(request(2, ('ANY', 1))))
+
+    def test_site(self):
+        """Test a deep site queue only holds requests for that site."""
+        throttle = SubmissionThrottle(site_watermarks={'LCG.UKI-LT2-IC-HEP.uk': (5, 10)})
+        self.depths = {'LCG.UKI-LT2-IC-HEP.uk': 10, 'ANY': 1000}
+        throttle.refresh()
+        self.assertEqual(throttle.throttled, {'LCG.UKI-LT2-IC-HEP.uk'})
+        self.assertFalse(throttle.admit(request(1, ('ANY', 1), ('LCG.UKI-LT2-IC-HEP.uk', 1))))
+        self.assertTrue(throttle.admit(request(2, ('ANY', 1))))
+
+    def test_unlimited(self):
+        """Test the DB isn't queried without any watermarks."""
+        throttle = SubmissionThrottle(site_watermarks={})
+        throttle.refresh()
+        self.assertFalse(ParametricJobs.queue_depths.called)
+        self.assertTrue(throttle.admit(request(1, ('ANY', 10 ** 6))))
+
+    def test_bad_watermarks(self):
+        """Test a low watermark above the high watermark is refused."""
+        with self.assertRaises(ValueError):
+            SubmissionThrottle(high_watermark=10, low_watermark=20)
@@ -0,0 +1,79 @@
+"""Test the general utilities."""
+import threading
+from unittest import TestCase
+import mock
+from productionsystem import utils
+from productionsystem.utils import TimedCache, BoundedExecutor, ExecutorBusy, ExecutorTimeout
+
+
+class TestTimedCache(TestCase):
+    """Test the expiring LRU cache."""
+
+    def setUp(self):
+        """Make a small cache with a controllable clock."""
+        self.now = 1000.
+        patch = mock.patch.object(utils.time, 'time', side_effect=lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.cache = TimedCache(ttl=10, maxsize=2)
+
+    def test_expiry(self):
+        """Test expired entries are missing unless asked for."""
+        self.cache.set('a', 1)
+        self.assertIn('a', self.cache)
+        self.now += 11
+        self.assertNotIn('a', self.cache)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('a', allow_expired=True), 1)
+        self.cache.touch('a')
+        self.assertEqual(self.cache.get('a'), 1)
+
+    def test_lru(self):
+        """Test the least recently used entry is dropped once full."""
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(self.cache.pop('a'), 1)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestBoundedExecutor(TestCase):
+    """Test the bounded thread pool."""
+
+    def setUp(self):
+        """Make an executor with one worker and one backlog slot."""
+        self.executor = BoundedExecutor(workers=1, backlog=1)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_run(self):
+        """Test results and exceptions are passed back to the caller."""
+        self.assertEqual(self.executor.run(sum, [1, 2], timeout=5), 3)
+        with self.assertRaises(ZeroDivisionError):
+            self.executor.run(lambda: 1 / 0, timeout=5)
+
+    def test_busy(self):
+        """Test calls beyond the workers and backlog are refused until a slot frees up."""
+        running = self.executor.submit(self.release.wait)
+        queued = self.executor.submit(self.release.wait)
+        with self.assertRaises(ExecutorBusy):
+            self.executor.submit(self.release.wait)
+        self.release.set()
+        running.get(5)
+        queued.get(5)
+        self.assertEqual(self.executor.run(len, 'abc', timeout=5), 3)
+
+    def test_timeout(self):
+        """Test the caller stops waiting after the timeout."""
+        with self.assertRaises(ExecutorTimeout):
+            self.executor.run(self.release.wait, timeout=0.05)
+
+    def test_slot_released_on_error(self):
+        """Test failed calls free their slot."""
+        for _ in xrange(3):
+            with self.assertRaises(ZeroDivisionError):
+                self.executor.run(lambda: 1 / 0, timeout=5)